@@ -1,10 +1,13 @@
 # settings.py
 from pathlib import Path
 import os
+import tempfile
 import dj_database_url
 from datetime import timedelta
 from dotenv import load_dotenv
 
+from core.logs import parsear_pares
+
 # Cargar variables de entorno desde .env (solo en desarrollo)
 if os.path.exists(Path(__file__).resolve().parent.parent / '.env'):
     load_dotenv(Path(__file__).resolve().parent.parent / '.env')
@@ -13,13 +16,17 @@ if os.path.exists(Path(__file__).resolve().parent.parent / '.env'):
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 # --- Seguridad / entorno
+# Avisos de configuración: se registran en el logger `backend.settings` cuando el logging ya
+# está configurado (CoreConfig.ready); aquí todavía no lo está
+AVISOS_CONFIGURACION = []
+
 # En Render: define SECRET_KEY en Environment (OBLIGATORIO)
 SECRET_KEY = os.getenv("SECRET_KEY")
 if not SECRET_KEY:
     if os.getenv("DEBUG", "False").lower() == "true":
         # Solo en desarrollo local permitir clave por defecto
         SECRET_KEY = "dev-insecure-key-only-for-localhost"
-        print("⚠️  [WARNING] Usando SECRET_KEY por defecto - SOLO para desarrollo local")
+        AVISOS_CONFIGURACION.append(("WARNING", "Usando SECRET_KEY por defecto - SOLO para desarrollo local"))
     else:
         # En producción es OBLIGATORIO definir SECRET_KEY
         raise ValueError("SECRET_KEY no está definida en variables de entorno. Define SECRET_KEY en tu plataforma de hosting.")
@@ -57,6 +64,9 @@ INSTALLED_APPS = [
 
 # --- Middleware
 MIDDLEWARE = [
+    # Primero: mide consultas/tiempo de todo lo que viene después (ver INSTRUMENTACION_ACTIVA)
+    "core.middleware.InstrumentacionMiddleware",
+
     "django.middleware.security.SecurityMiddleware",
 
     # WhiteNoise inmediatamente después de SecurityMiddleware
@@ -128,7 +138,7 @@ if USE_CLOUDINARY:
     # ========================================
     # PRODUCCIÓN: Cloudinary
     # ========================================
-    print("✅ [PRODUCCIÓN] Configurando Cloudinary para archivos media")
+    AVISOS_CONFIGURACION.append(("INFO", f"Media en Cloudinary (cloud: {os.getenv('CLOUDINARY_CLOUD_NAME') or 'NO CONFIGURADO'})"))
     
     CLOUDINARY_STORAGE = {
         'CLOUD_NAME': os.getenv('CLOUDINARY_CLOUD_NAME'),
@@ -149,14 +159,10 @@ if USE_CLOUDINARY:
     # URLs de archivos media
     MEDIA_URL = '/media/'  # Cloudinary maneja la URL real
     
-    print(f"   Cloud Name: {os.getenv('CLOUDINARY_CLOUD_NAME', '❌ NO CONFIGURADO')}")
-    
 else:
     # ========================================
     # DESARROLLO LOCAL: FileSystem
     # ========================================
-    print("⚠️  [DESARROLLO] Usando almacenamiento LOCAL para archivos media")
-    
     MEDIA_URL = "/media/"
     MEDIA_ROOT = BASE_DIR / "media"
     
@@ -171,8 +177,7 @@ else:
             "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"
         },
     }
-    
-    print(f"   Ruta: {MEDIA_ROOT}")
+    AVISOS_CONFIGURACION.append(("DEBUG", f"Media en almacenamiento LOCAL: {MEDIA_ROOT}"))
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -188,7 +193,7 @@ if DEBUG:
         "http://localhost:3000",  # Next.js
         "http://127.0.0.1:3000"
     ]
-    print("🔧 [DESARROLLO] CORS permitido para localhost en múltiples puertos")
+    AVISOS_CONFIGURACION.append(("DEBUG", "CORS permitido para localhost en múltiples puertos"))
 else:
     # Producción: configuración más explícita y robusta
     cors_origins_env = os.getenv("CORS_ALLOWED_ORIGINS", "")
@@ -201,13 +206,11 @@ else:
             "https://frontavanza.vercel.app",  # Por si acaso hay variaciones
         ]
         # 🚨 TEMPORAL: Si no hay variable configurada, permitir todo para diagnosticar
-        print("🚨 [WARNING] CORS_ALLOWED_ORIGINS no configurada - usando fallback temporal")
-        print("� [WARNING] ACTIVANDO CORS_ALLOW_ALL_ORIGINS temporalmente para debug")
+        AVISOS_CONFIGURACION.append(("WARNING", "CORS_ALLOWED_ORIGINS no configurada: CORS_ALLOW_ALL_ORIGINS activado temporalmente"))
         CORS_ALLOW_ALL_ORIGINS = True  # ⚠️ TEMPORAL SOLO PARA DEBUG
     
-    print(f"�🔒 [PRODUCCIÓN] CORS configurado para: {CORS_ALLOWED_ORIGINS}")
-    print(f"🔍 [PRODUCCIÓN] Variable CORS_ALLOWED_ORIGINS: '{cors_origins_env}'")
-    print(f"🔍 [PRODUCCIÓN] CORS_ALLOW_ALL_ORIGINS: {globals().get('CORS_ALLOW_ALL_ORIGINS', False)}")
+    AVISOS_CONFIGURACION.append(("INFO", f"CORS configurado para: {CORS_ALLOWED_ORIGINS} "
+                                         f"(CORS_ALLOW_ALL_ORIGINS={globals().get('CORS_ALLOW_ALL_ORIGINS', False)})"))
 
 # Configuración adicional de CORS para asegurar compatibilidad
 CORS_ALLOW_CREDENTIALS = True
@@ -273,6 +276,9 @@ REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ],
+    # Paginación por cursor en todos los listados (?cursor=..., ?page_size=...)
+    "DEFAULT_PAGINATION_CLASS": "core.pagination.CursorPorFecha",
+    "PAGE_SIZE": int(os.getenv("API_PAGE_SIZE", "50")),
     # Si quieres UI de DRF en prod, deja BrowsableRenderer activo
     "DEFAULT_RENDERER_CLASSES": (
         "rest_framework.renderers.JSONRenderer",
@@ -286,12 +292,81 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
 }
 
+# --- Caché
+# Sin REDIS_URL se usa caché en memoria del proceso (desarrollo/tests)
+REDIS_URL = os.getenv("REDIS_URL", "")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Bloques del dashboard (usuario + cartera); se invalidan al cambiar la cartera
+DASHBOARD_CACHE_ALIAS = "default"
+DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "300"))
+
+# --- Procesos programados
+# Cada cuánto revisa `manage.py actualizar_estados --continuo` si ya cambió el día
+ESTADOS_INTERVALO_SEGUNDOS = int(os.getenv("ESTADOS_INTERVALO_SEGUNDOS", "3600"))
+
+# --- Operaciones masivas
+PRESTAMOS_LOTE_MAX = int(os.getenv("PRESTAMOS_LOTE_MAX", "1000"))
+PAGOS_LOTE_MAX = int(os.getenv("PAGOS_LOTE_MAX", "5000"))
+# Cuotas por página en /api/carteras/{id}/ruta/
+RUTA_CUOTAS_MAX = int(os.getenv("RUTA_CUOTAS_MAX", "500"))
+
+# --- Media protegida (/api/secure-media/)
+# proxy: Django descarga y devuelve los bytes. redirect: tras validar el JWT responde con
+# una URL firmada de vida corta (Cloudinary) o delega el archivo al servidor web (local).
+SECURE_MEDIA_MODO = os.getenv("SECURE_MEDIA_MODO", "proxy").lower()
+SECURE_MEDIA_URL_TTL = int(os.getenv("SECURE_MEDIA_URL_TTL", "300"))
+# Almacenamiento local en modo redirect: "x-accel" (nginx), "x-sendfile" (apache) o vacío (Django sirve)
+SECURE_MEDIA_SENDFILE = os.getenv("SECURE_MEDIA_SENDFILE", "").lower()
+SECURE_MEDIA_ACCEL_PREFIX = os.getenv("SECURE_MEDIA_ACCEL_PREFIX", "/protected-media/")
+# Modo proxy (core/media.py): pool de conexiones al origen y caché LRU en disco (vacío = sin caché)
+SECURE_MEDIA_POOL_SIZE = int(os.getenv("SECURE_MEDIA_POOL_SIZE", "10"))
+SECURE_MEDIA_TIMEOUT = int(os.getenv("SECURE_MEDIA_TIMEOUT", "10"))
+SECURE_MEDIA_CACHE_DIR = os.getenv("SECURE_MEDIA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "avanza-media-cache"))
+SECURE_MEDIA_CACHE_MAX_BYTES = int(os.getenv("SECURE_MEDIA_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# --- Miniaturas de fotos de clientes (core/imagenes.py)
+MINIATURA_LADO = int(os.getenv("MINIATURA_LADO", "320"))
+MINIATURA_FORMATO = os.getenv("MINIATURA_FORMATO", "webp")  # webp | jpeg
+MINIATURA_CALIDAD = int(os.getenv("MINIATURA_CALIDAD", "75"))
+
+# --- Subida de fotos en segundo plano (core/imagenes.py + core/tareas.py)
+FOTOS_SUBIDA_ASINCRONA = os.getenv("FOTOS_SUBIDA_ASINCRONA", str(USE_CLOUDINARY)).lower() == "true"
+FOTOS_STAGING_DIR = os.getenv("FOTOS_STAGING_DIR", os.path.join(tempfile.gettempdir(), "avanza-fotos-staging"))
+TAREAS_WORKERS = int(os.getenv("TAREAS_WORKERS", "2"))
+TAREAS_SINCRONAS = os.getenv("TAREAS_SINCRONAS", "False").lower() == "true"
+
+# --- Instrumentación por petición (core/middleware.py)
+# Server-Timing + log `core.peticiones`; sobre el presupuesto de consultas se registra un WARNING
+INSTRUMENTACION_ACTIVA = os.getenv("INSTRUMENTACION_ACTIVA", "True").lower() == "true"
+PETICION_PRESUPUESTO_CONSULTAS = int(os.getenv("PETICION_PRESUPUESTO_CONSULTAS", "30"))
+# Cabeceras Server-Timing / X-Query-Budget-Exceeded para cualquier cliente (si no, solo staff)
+INSTRUMENTACION_HEADER = os.getenv("INSTRUMENTACION_HEADER", str(DEBUG)).lower() == "true"
+
+# --- Métricas Prometheus (core/metricas.py, GET /metrics)
+# Un archivo por proceso en METRICAS_DIR (vaciarlo al arrancar); sin token /metrics solo responde en DEBUG
+METRICAS_DIR = os.getenv("METRICAS_DIR", os.path.join(tempfile.gettempdir(), "avanza-metricas"))
+METRICAS_FLUSH_SEGUNDOS = float(os.getenv("METRICAS_FLUSH_SEGUNDOS", "5"))
+METRICAS_TOKEN = os.getenv("METRICAS_TOKEN", "")
+
 # --- Seguridad y configuración según entorno
 if DEBUG:
     # ========================================
     # DESARROLLO LOCAL (localhost)
     # ========================================
-    print("🔧 [DESARROLLO] Configuración de seguridad relajada para localhost")
+    AVISOS_CONFIGURACION.append(("DEBUG", "Configuración de seguridad relajada para localhost"))
     
     # Sin redirección SSL ni configuraciones de seguridad estrictas
     SECURE_SSL_REDIRECT = False
@@ -304,7 +379,7 @@ else:
     # ========================================
     # PRODUCCIÓN (Render + Vercel)
     # ========================================
-    print("🔒 [PRODUCCIÓN] Configuración de seguridad estricta activada")
+    AVISOS_CONFIGURACION.append(("INFO", "Configuración de seguridad estricta activada"))
     
     # Configuración de seguridad detrás del proxy de Render
     SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
@@ -324,28 +399,37 @@ else:
     SESSION_COOKIE_SAMESITE = "None"
     CSRF_COOKIE_SAMESITE = "None"
 
-# --- Logging para producción
-if not DEBUG:
-    LOGGING = {
-        'version': 1,
-        'disable_existing_loggers': False,
-        'handlers': {
-            'console': {
-                'class': 'logging.StreamHandler',
-                'level': 'INFO',
-            },
-        },
-        'loggers': {
-            'django': {
-                'handlers': ['console'],
-                'level': 'INFO',
-                'propagate': True,
-            },
-            'core': {  # Logs de tu app
-                'handlers': ['console'],
-                'level': 'INFO',
-                'propagate': True,
-            },
+# --- Logging (core/logs.py)
+# Una línea JSON por registro a stderr a través de una cola (quien registra no espera la
+# escritura). LOG_FORMATO=texto para leerlo en local; niveles por módulo con LOG_NIVELES y
+# muestreo de registros < WARNING con LOG_MUESTREO, ambos "logger=valor,logger=valor".
+LOG_NIVEL = os.getenv("LOG_NIVEL", "INFO").upper()
+LOG_FORMATO = os.getenv("LOG_FORMATO", "texto" if DEBUG else "json").lower()
+# En local runserver ya muestra cada petición: la línea de core.peticiones solo si excede el presupuesto
+LOG_NIVELES = {nombre: nivel.upper() for nombre, nivel in parsear_pares(
+    os.getenv("LOG_NIVELES", "core.peticiones=WARNING" if DEBUG else "")).items()}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'core.logs.FormatoJSON'},
+        'texto': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+    },
+    'filters': {
+        'muestreo': {'()': 'core.logs.FiltroMuestreo', 'tasas': os.getenv("LOG_MUESTREO", "")},
+    },
+    'handlers': {
+        'cola': {
+            'class': 'core.logs.ManejadorEnCola',
+            'formatter': LOG_FORMATO,
+            'filters': ['muestreo'],
         },
-    }
-
+    },
+    'loggers': {
+        'django': {'handlers': ['cola'], 'level': 'INFO', 'propagate': False},
+        'backend': {'handlers': ['cola'], 'level': LOG_NIVEL, 'propagate': False},
+        'core': {'handlers': ['cola'], 'level': LOG_NIVEL, 'propagate': False},
+        **{nombre: {'level': nivel} for nombre, nivel in LOG_NIVELES.items()},
+    },
+}
@@ -24,7 +24,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import (TokenObtainPairView, TokenRefreshView, TokenVerifyView)
 from rest_framework.decorators import api_view, permission_classes
-from core.views import me_view
+from core.views import me_view, metricas_view
 
 User = get_user_model()
 
@@ -57,6 +57,7 @@ urlpatterns = [
     path('api/token/', TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path('api/token/refresh/', TokenRefreshView.as_view(), name="token_refresh"),  # ← Corregido: TokenRefreshView
     path("api/me/", me_view, name="me"),  
+    path("metrics", metricas_view, name="metrics"),  # Prometheus (core/metricas.py)
     
     
 ]+ static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,6 +1,15 @@
+import logging
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Avisos de settings.py, ahora que LOGGING ya está configurado
+        logger = logging.getLogger('backend.settings')
+        for nivel, mensaje in getattr(settings, 'AVISOS_CONFIGURACION', []):
+            logger.log(logging.getLevelName(nivel), mensaje)
@@ -0,0 +1,105 @@
+# core/cache.py
+"""
+Caché de bloques del dashboard (métricas por usuario + cartera).
+
+Invalidación por cartera con un contador de versión: las claves de bloque incluyen la
+versión vigente de la cartera, así que invalidar es un único INCR y las entradas viejas
+simplemente expiran. Funciona con cualquier backend del framework de caché de Django
+(locmem en desarrollo/tests, Redis en producción).
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .metricas import DASHBOARD_CACHE
+
+CLAVE_HITS   = 'dashboard:stats:hits'
+CLAVE_MISSES = 'dashboard:stats:misses'
+
+
+def _cache():
+    return caches[settings.DASHBOARD_CACHE_ALIAS]
+
+
+def _clave_version(cartera_id):
+    return f'dashboard:v:{cartera_id}'
+
+
+def _clave_bloque(cartera_id, version, usuario_id):
+    return f'dashboard:{cartera_id}:{version}:{usuario_id}'
+
+
+def _incrementar(clave, n=1):
+    if not n:
+        return
+    cache = _cache()
+    cache.add(clave, 0, timeout=None)
+    try:
+        cache.incr(clave, n)
+    except ValueError:
+        # expulsada entre add e incr
+        cache.set(clave, n, timeout=None)
+
+
+def _versiones(cartera_ids):
+    cache = _cache()
+    claves = {cid: _clave_version(cid) for cid in cartera_ids}
+    encontradas = cache.get_many(list(claves.values()))
+    versiones, nuevas = {}, {}
+    for cid, clave in claves.items():
+        if clave in encontradas:
+            versiones[cid] = encontradas[clave]
+        else:
+            # Versión inicial basada en el reloj: no colisiona con bloques de una versión expulsada
+            versiones[cid] = nuevas[clave] = int(time.time() * 1000)
+    if nuevas:
+        cache.set_many(nuevas, timeout=None)
+    return versiones
+
+
+def obtener_bloques(usuario_id, cartera_ids, calcular):
+    """
+    Devuelve {cartera_id: bloque} usando la caché; `calcular(ids_faltantes)` debe devolver
+    los bloques que no estaban cacheados.
+    """
+    cache = _cache()
+    versiones = _versiones(cartera_ids)
+    claves = {cid: _clave_bloque(cid, versiones[cid], usuario_id) for cid in cartera_ids}
+
+    encontrados = cache.get_many(list(claves.values()))
+    bloques = {cid: encontrados[clave] for cid, clave in claves.items() if clave in encontrados}
+    faltantes = [cid for cid in cartera_ids if cid not in bloques]
+
+    if faltantes:
+        calculados = calcular(faltantes)
+        cache.set_many({claves[cid]: calculados[cid] for cid in faltantes},
+                       timeout=settings.DASHBOARD_CACHE_TTL)
+        bloques.update(calculados)
+
+    _incrementar(CLAVE_HITS, len(cartera_ids) - len(faltantes))
+    _incrementar(CLAVE_MISSES, len(faltantes))
+    DASHBOARD_CACHE.inc(len(cartera_ids) - len(faltantes), resultado='hit')
+    DASHBOARD_CACHE.inc(len(faltantes), resultado='miss')
+    return bloques
+
+
+def invalidar_cartera(cartera_id):
+    """Invalida todos los bloques cacheados de la cartera (de todos los usuarios)."""
+    cache = _cache()
+    try:
+        cache.incr(_clave_version(cartera_id))
+    except ValueError:
+        # Sin versión registrada: no hay bloques vigentes que invalidar
+        pass
+
+
+def estadisticas():
+    valores = _cache().get_many([CLAVE_HITS, CLAVE_MISSES])
+    hits, misses = valores.get(CLAVE_HITS, 0), valores.get(CLAVE_MISSES, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'ratio_hits': round(hits / total, 4) if total else None,
+    }
@@ -0,0 +1,207 @@
+# core/imagenes.py
+"""
+Fotos de Cliente (avatar y documentos): miniaturas y subida en segundo plano.
+
+Las miniaturas se generan con Pillow desde el archivo subido, antes de guardarlo, así que
+no hace falta volver a descargar el original del almacenamiento (Cloudinary); se suben
+recién cuando el guardado del cliente confirma (subir_miniaturas). Tamaño y formato en
+settings: MINIATURA_LADO (px del lado mayor), MINIATURA_FORMATO (webp/jpeg), MINIATURA_CALIDAD.
+
+Con FOTOS_SUBIDA_ASINCRONA la vista deja las fotos en FOTOS_STAGING_DIR y responde; un hilo
+de core.tareas las sube después (subir_fotos_pendientes) y completa los campos.
+"""
+import io
+import logging
+import os
+import shutil
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# campo original -> campo de la miniatura
+CAMPOS_MINIATURA = {
+    'foto_cliente': 'foto_cliente_thumb',
+    'foto_dni_1': 'foto_dni_1_thumb',
+    'foto_dni_2': 'foto_dni_2_thumb',
+}
+
+EXTENSIONES = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+
+def generar_miniatura(archivo) -> ContentFile | None:
+    """
+    Redimensiona (respetando orientación EXIF y proporción) y recomprime `archivo`.
+    Devuelve un ContentFile listo para asignar a un ImageField, o None si no es una imagen.
+    """
+    formato = settings.MINIATURA_FORMATO.upper()
+    lado = settings.MINIATURA_LADO
+
+    try:
+        archivo.seek(0)
+        with Image.open(archivo) as img:
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+            if formato == 'JPEG':
+                img = img.convert('RGB')
+            elif img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+            salida = io.BytesIO()
+            img.save(salida, format=formato, quality=settings.MINIATURA_CALIDAD, optimize=True)
+    except (UnidentifiedImageError, OSError):
+        return None
+    finally:
+        archivo.seek(0)  # el original se guarda después
+
+    base = os.path.splitext(os.path.basename(archivo.name))[0]
+    return ContentFile(salida.getvalue(), name=f'{base}_thumb.{EXTENSIONES[formato]}')
+
+
+def actualizar_miniaturas(cliente, forzar=False) -> list[str]:
+    """
+    Asigna (sin guardar, pero ya subida) la miniatura de cada foto recién subida, o de
+    todas con `forzar` (comando generar_miniaturas).
+    Si la foto se borró, borra también la referencia a la miniatura.
+    Devuelve los nombres de los campos de miniatura modificados.
+    """
+    cambiados = []
+    for campo, campo_thumb in CAMPOS_MINIATURA.items():
+        foto = getattr(cliente, campo)
+        if not foto:
+            if getattr(cliente, campo_thumb):
+                setattr(cliente, campo_thumb, None)
+                cambiados.append(campo_thumb)
+            continue
+        if foto._committed and not forzar:
+            continue  # sin cambios desde el último guardado
+        miniatura = generar_miniatura(foto)
+        if miniatura is not None:
+            getattr(cliente, campo_thumb).save(miniatura.name, miniatura, save=False)
+            cambiados.append(campo_thumb)
+    return cambiados
+
+
+def preparar_miniaturas(cliente) -> tuple[list[str], dict]:
+    """
+    Para Cliente.save: quita (sin guardar) la miniatura de las fotos borradas y genera en
+    memoria la de cada foto recién asignada, sin subir nada todavía.
+    Devuelve (campos de miniatura quitados, {campo de la foto: ContentFile}).
+    """
+    quitadas, nuevas = [], {}
+    for campo, campo_thumb in CAMPOS_MINIATURA.items():
+        foto = getattr(cliente, campo)
+        if not foto:
+            if getattr(cliente, campo_thumb):
+                setattr(cliente, campo_thumb, None)
+                quitadas.append(campo_thumb)
+        elif not foto._committed:
+            miniatura = generar_miniatura(foto)
+            if miniatura is not None:
+                nuevas[campo] = miniatura
+    return quitadas, nuevas
+
+
+def subir_miniaturas(cliente_id, miniaturas: dict) -> list[str]:
+    """
+    Sube las miniaturas de preparar_miniaturas una vez confirmado el guardado del cliente
+    (si la transacción falla no queda nada huérfano en Cloudinary).
+    `miniaturas` = {campo de la foto: (nombre guardado de la foto, ContentFile)}. Si la foto
+    cambió entretanto la miniatura ya no le corresponde y se borra.
+    Devuelve los campos de miniatura guardados.
+    """
+    from .models import Cliente
+
+    guardados = []
+    for campo, (nombre_foto, miniatura) in miniaturas.items():
+        campo_thumb = CAMPOS_MINIATURA[campo]
+        field = Cliente._meta.get_field(campo_thumb)
+        nombre = field.storage.save(field.generate_filename(Cliente(pk=cliente_id), miniatura.name),
+                                    miniatura, max_length=field.max_length)
+        if Cliente.objects.filter(pk=cliente_id, **{campo: nombre_foto}).update(**{campo_thumb: nombre}):
+            guardados.append(campo_thumb)
+        else:
+            field.storage.delete(nombre)
+    return guardados
+
+
+def preparar_fotos(datos: dict) -> dict:
+    """
+    Saca de `datos` (validated_data del serializer) las fotos subidas y las copia a
+    FOTOS_STAGING_DIR. Devuelve {campo: {'ruta': archivo local, 'nombre': nombre original}}
+    para guardar en Cliente.fotos_pendientes.
+    """
+    pendientes = {}
+    os.makedirs(settings.FOTOS_STAGING_DIR, exist_ok=True)
+    for campo in CAMPOS_MINIATURA:
+        archivo = datos.get(campo)
+        if not archivo:
+            continue  # sin foto nueva (o borrado explícito: se guarda en línea)
+        del datos[campo]
+        nombre = os.path.basename(archivo.name)
+        ruta = os.path.join(settings.FOTOS_STAGING_DIR, f'{uuid.uuid4().hex}_{nombre}')
+        archivo.seek(0)
+        with open(ruta, 'wb') as destino:
+            shutil.copyfileobj(archivo, destino)
+        pendientes[campo] = {'ruta': ruta, 'nombre': nombre}
+    return pendientes
+
+
+def subir_fotos_pendientes(cliente_id) -> list[str]:
+    """
+    Sube al almacenamiento las fotos en staging del cliente (con sus miniaturas) y las
+    quita de fotos_pendientes. Cada foto se confirma apenas termina de subir: si una falla,
+    las anteriores ya quedan guardadas y solo esa queda pendiente para reintentar.
+    Devuelve los campos completados.
+
+    La subida (lenta, contra Cloudinary) va fuera de la transacción: el bloqueo de la fila
+    solo dura lo que tarda escribir los nombres de los archivos.
+    """
+    from .models import Cliente
+
+    cliente = Cliente.objects.filter(pk=cliente_id).first()
+    if cliente is None or not cliente.fotos_pendientes:
+        return []
+
+    subidos = []
+    for campo, info in dict(cliente.fotos_pendientes).items():
+        campos = {}
+        if os.path.exists(info['ruta']):
+            with open(info['ruta'], 'rb') as archivo:
+                foto = File(archivo, name=info['nombre'])
+                miniatura = generar_miniatura(foto)
+                getattr(cliente, campo).save(info['nombre'], foto, save=False)
+            campos[campo] = getattr(cliente, campo).name
+            if miniatura is not None:
+                campo_thumb = CAMPOS_MINIATURA[campo]
+                getattr(cliente, campo_thumb).save(miniatura.name, miniatura, save=False)
+                campos[campo_thumb] = getattr(cliente, campo_thumb).name
+        else:
+            logger.error('Staging perdido para %s.%s: %s (se descarta la foto)', cliente_id, campo,
+                         info['ruta'], extra={'cliente_id': str(cliente_id), 'campo': campo})
+
+        with transaction.atomic():
+            pendientes = Cliente.objects.select_for_update().get(pk=cliente_id).fotos_pendientes
+            # Otra petición pudo dejar otra foto para el campo mientras subíamos: esa sigue pendiente
+            if pendientes.get(campo) == info:
+                del pendientes[campo]
+            # update() y no save(): los archivos ya están subidos y las miniaturas generadas
+            Cliente.objects.filter(pk=cliente_id).update(**campos, fotos_pendientes=pendientes)
+
+        descartar_staging([info])
+        if campos:
+            subidos.append(campo)
+    return subidos
+
+
+def descartar_staging(pendientes) -> None:
+    """Borra los archivos locales de entradas de fotos_pendientes ({ruta, nombre})."""
+    for info in pendientes:
+        try:
+            os.remove(info['ruta'])
+        except FileNotFoundError:
+            pass
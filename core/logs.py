@@ -0,0 +1,120 @@
+# core/logs.py
+"""
+Logging estructurado para la app (se configura en settings.LOGGING).
+
+- FormatoJSON: una línea JSON por registro (ts, nivel, logger, mensaje, campos de `extra`
+  y la excepción si la hay), fácil de buscar en los logs de la plataforma.
+- ManejadorEnCola: el hilo que registra solo encola (sin formatear ni escribir); un hilo
+  aparte formatea y escribe a stderr. Si la cola se llena se descarta el registro en vez de
+  bloquear la petición (quedan contados en `descartados`).
+- FiltroMuestreo: deja pasar solo una fracción de los registros por debajo de WARNING por
+  prefijo de logger (LOG_MUESTREO="core.peticiones=0.1"). WARNING o más siempre pasa.
+
+El nivel por módulo se sube con LOG_NIVELES="core.views=DEBUG,core.media=DEBUG".
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+# Atributos propios de LogRecord: el resto vino por `extra=`
+_ATRIBUTOS_RECORD = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def parsear_pares(valor: str) -> dict:
+    """'a=1,b=2' -> {'a': '1', 'b': '2'} (formato de LOG_NIVELES / LOG_MUESTREO; sin '=' se ignora)."""
+    pares = {}
+    for item in valor.split(','):
+        clave, igual, dato = item.partition('=')
+        if igual:
+            pares[clave.strip()] = dato.strip()
+    return pares
+
+
+class FormatoJSON(logging.Formatter):
+
+    def format(self, record):
+        datos = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensaje': record.getMessage(),
+        }
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS_RECORD and not clave.startswith('_'):
+                datos[clave] = valor
+        if record.exc_info:
+            datos['excepcion'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            datos['excepcion'] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class FiltroMuestreo(logging.Filter):
+
+    def __init__(self, tasas=None):
+        super().__init__()
+        if isinstance(tasas, str):
+            tasas = parsear_pares(tasas)
+        # prefijo más largo primero
+        self.tasas = sorted(((p, float(t)) for p, t in (tasas or {}).items()), key=lambda x: -len(x[0]))
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        for prefijo, tasa in self.tasas:
+            if record.name == prefijo or record.name.startswith(prefijo + '.'):
+                return random.random() < tasa
+        return True
+
+
+class ManejadorEnCola(logging.handlers.QueueHandler):
+    """
+    QueueHandler + QueueListener propio hacia stderr. El formatter configurado se aplica en
+    el hilo del listener; en el hilo que registra solo se resuelve el mensaje.
+    """
+
+    def __init__(self, tamano=10000):
+        super().__init__(queue.Queue(maxsize=tamano))
+        self.destino = logging.StreamHandler(sys.stderr)
+        self.descartados = 0
+        self._iniciar()
+        atexit.register(self._detener)  # vacía la cola al salir
+
+    def _iniciar(self):
+        self._pid = os.getpid()
+        self.listener = logging.handlers.QueueListener(self.queue, self.destino)
+        self.listener.start()
+
+    def _detener(self):
+        if self._pid == os.getpid() and self.listener._thread is not None:
+            self.listener.stop()
+
+    def setFormatter(self, fmt):
+        self.destino.setFormatter(fmt)
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()  # args mutables: se fijan ahora
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            # proceso hijo de un fork (gunicorn --preload): el hilo del listener no se heredó
+            self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self._iniciar()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+    def close(self):
+        self._detener()
+        super().close()
@@ -0,0 +1,59 @@
+# core/management/commands/actualizar_estados.py
+import time
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services import ejecutar_actualizacion_estados
+
+
+class Command(BaseCommand):
+    help = (
+        "Ejecuta las transiciones de estado de cuotas y préstamos una vez por día "
+        "(marca de agua persistida). Usar desde cron o con --continuo como scheduler."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fecha', help='Fecha a procesar (YYYY-MM-DD, hasta hoy). Por defecto hoy.')
+        parser.add_argument('--forzar', action='store_true',
+                            help='Procesa aunque la fecha ya figure como procesada.')
+        parser.add_argument('--continuo', action='store_true',
+                            help='Se queda en ejecución revisando cada --intervalo segundos.')
+        parser.add_argument('--intervalo', type=int,
+                            default=getattr(settings, 'ESTADOS_INTERVALO_SEGUNDOS', 3600),
+                            help='Segundos entre revisiones en modo --continuo.')
+
+    def handle(self, *args, **options):
+        fecha = None
+        if options['fecha']:
+            try:
+                fecha = date.fromisoformat(options['fecha'])
+            except ValueError:
+                raise CommandError('--fecha debe tener formato YYYY-MM-DD')
+            if fecha > date.today():
+                # Adelantaría la marca de agua: las corridas diarias saltarían los días intermedios
+                raise CommandError('--fecha no puede ser posterior a hoy')
+
+        if not options['continuo']:
+            self._ejecutar(fecha, options['forzar'])
+            return
+
+        if options['intervalo'] <= 0:
+            raise CommandError('--intervalo debe ser > 0')
+
+        # Scheduler simple: la marca de agua garantiza una sola corrida por día
+        while True:
+            self._ejecutar(fecha, options['forzar'])
+            time.sleep(options['intervalo'])
+
+    def _ejecutar(self, fecha, forzar):
+        resultado = ejecutar_actualizacion_estados(hoy=fecha, forzar=forzar)
+        if resultado is None:
+            self.stdout.write('Estados ya actualizados para la fecha, nada que hacer.')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['fecha']}: cuotas a mora={resultado['cuotas_mora']}, "
+            f"préstamos a mora={resultado['prestamos_mora']}, "
+            f"préstamos pagados={resultado['prestamos_pagados']}"
+        ))
@@ -0,0 +1,145 @@
+# core/management/commands/benchmark.py
+import itertools
+import json
+import math
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import redirect_stdout
+from datetime import date
+
+import django.test.signals  # noqa: F401  (reinicia cachés al cambiar CACHES con override_settings)
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from core.models import Cartera, CarteraMiembro, Prestamo
+from core.semillas import sembrar_libro
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano (p en 0..100)."""
+    ordenados = sorted(valores)
+    return ordenados[max(math.ceil(p / 100 * len(ordenados)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Siembra una cartera sintética en una base de pruebas nueva (SQLite o PostgreSQL según "
+        "DATABASES) y mide consultas, latencia p50/p95 y tamaño de respuesta de los endpoints "
+        "principales. Emite un reporte JSON comparable entre commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carteras', type=int, default=3)
+        parser.add_argument('--clientes', type=int, default=200)
+        parser.add_argument('--prestamos', type=int, default=500)
+        parser.add_argument('--cuotas', type=int, default=12, help='Máximo de cuotas por préstamo.')
+        parser.add_argument('--pagos', type=int, default=6, help='Máximo de pagos históricos por préstamo.')
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--salida', help='Archivo JSON de salida (por defecto stdout).')
+
+    def handle(self, *args, **opts):
+        nombre_original = connection.settings_dict['NAME']
+        # Base descartable: nunca toca los datos reales
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # cualquier salida de diagnóstico a stderr para no mezclarse con el JSON
+            with redirect_stdout(sys.stderr), override_settings(
+                ALLOWED_HOSTS=['testserver'],
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            ):
+                volumen = self._sembrar(opts)
+                endpoints = self._medir(opts)
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+        reporte = json.dumps({
+            'meta': {
+                'commit': self._commit(),
+                'motor': connection.vendor,
+                'repeticiones': opts['repeticiones'],
+                'volumen': volumen,
+            },
+            'endpoints': endpoints,
+        }, indent=2, sort_keys=True, ensure_ascii=False)
+
+        if opts['salida']:
+            with open(opts['salida'], 'w', encoding='utf-8') as f:
+                f.write(reporte + '\n')
+            self.stderr.write(f"Reporte escrito en {opts['salida']}")
+        else:
+            self.stdout.write(reporte)
+
+    # --- Datos ----------------------------------------------------------------------
+
+    def _sembrar(self, opts):
+        volumen = sembrar_libro(
+            carteras=opts['carteras'], clientes=opts['clientes'], prestamos=opts['prestamos'],
+            cuotas=opts['cuotas'], pagos=opts['pagos'], semilla=opts['semilla'], prefijo='bench',
+        )
+        self.usuario = get_user_model().objects.create_superuser('benchmark', 'bench@example.com', 'x')
+        CarteraMiembro.objects.bulk_create(
+            [CarteraMiembro(cartera=c, usuario=self.usuario, rol=CarteraMiembro.RolEnCartera.OPERADOR)
+             for c in Cartera.objects.all()])
+        self.prestamos = list(Prestamo.objects
+                              .exclude(estado=Prestamo.Estado.PAGADO)
+                              .order_by('id')
+                              .only('id'))
+        return volumen
+
+    # --- Medición -------------------------------------------------------------------
+
+    def _medir(self, opts):
+        client = APIClient()
+        client.force_authenticate(self.usuario)
+        candidatos = itertools.cycle(self.prestamos)
+
+        def pago():
+            p = next(candidatos)
+            return client.post('/api/pagos/', {
+                'prestamo': str(p.pk), 'fecha_pago': date.today().isoformat(), 'monto': '1.00',
+            }, format='json')
+
+        def dashboard_frio():
+            cache.clear()
+            return client.get('/api/dashboard/')
+
+        casos = {
+            'GET /api/prestamos/': lambda: client.get('/api/prestamos/'),
+            'GET /api/cuotas/': lambda: client.get('/api/cuotas/'),
+            'GET /api/dashboard/ (sin caché)': dashboard_frio,
+            'GET /api/dashboard/ (caché)': lambda: client.get('/api/dashboard/'),
+            'POST /api/pagos/': pago,
+            'POST /api/actualizar-estados/': lambda: client.post('/api/actualizar-estados/'),
+        }
+        return {nombre: self._medir_caso(fn, opts['repeticiones']) for nombre, fn in casos.items()}
+
+    def _medir_caso(self, fn, repeticiones):
+        fn()  # calentamiento (conexión, cachés de Django)
+        tiempos, consultas = [], []
+        for _ in range(repeticiones):
+            with CaptureQueriesContext(connection) as q:
+                inicio = time.perf_counter()
+                resp = fn()
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+            consultas.append(len(q.captured_queries))
+        return {
+            'status': resp.status_code,
+            'consultas': max(consultas),
+            'p50_ms': round(statistics.median(tiempos), 2),
+            'p95_ms': round(percentil(tiempos, 95), 2),
+            'bytes': len(resp.content),
+        }
+
+    def _commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                  text=True, timeout=5).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
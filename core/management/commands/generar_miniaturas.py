@@ -0,0 +1,32 @@
+# core/management/commands/generar_miniaturas.py
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from core.imagenes import CAMPOS_MINIATURA, actualizar_miniaturas
+from core.models import Cliente
+
+
+class Command(BaseCommand):
+    help = "Genera las miniaturas de fotos de clientes subidas antes de existir el pipeline (o todas con --todas)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true',
+                            help='Regenera también las que ya tienen miniatura (p.ej. tras cambiar MINIATURA_LADO).')
+
+    def handle(self, *args, **options):
+        clientes = Cliente.objects.all()
+        if not options['todas']:
+            faltantes = Q()
+            for campo, campo_thumb in CAMPOS_MINIATURA.items():
+                faltantes |= ~Q(**{campo: ''}) & ~Q(**{f'{campo}__isnull': True}) & (
+                    Q(**{campo_thumb: ''}) | Q(**{f'{campo_thumb}__isnull': True}))
+            clientes = clientes.filter(faltantes)
+
+        total = 0
+        for cliente in clientes.iterator(chunk_size=200):
+            cambiados = actualizar_miniaturas(cliente, forzar=True)
+            if cambiados:
+                Cliente.objects.filter(pk=cliente.pk).update(
+                    **{campo: getattr(cliente, campo).name or None for campo in cambiados})
+                total += 1
+        self.stdout.write(self.style.SUCCESS(f'Miniaturas generadas para {total} clientes.'))
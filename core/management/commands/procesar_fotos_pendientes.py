@@ -0,0 +1,24 @@
+# core/management/commands/procesar_fotos_pendientes.py
+from django.core.management.base import BaseCommand
+
+from core.imagenes import subir_fotos_pendientes
+from core.models import Cliente
+
+
+class Command(BaseCommand):
+    help = (
+        "Sube las fotos de clientes que quedaron en staging (p.ej. el proceso se reinició "
+        "antes de que el hilo en segundo plano terminara). Ejecutar tras cada arranque o por cron."
+    )
+
+    def handle(self, *args, **options):
+        ids = list(Cliente.objects.exclude(fotos_pendientes={}).values_list('pk', flat=True))
+        subidas = errores = 0
+        for cliente_id in ids:
+            try:
+                subidas += len(subir_fotos_pendientes(cliente_id))
+            except Exception as e:
+                errores += 1
+                self.stderr.write(f'{cliente_id}: {e}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{subidas} fotos subidas de {len(ids)} clientes pendientes ({errores} con error).'))
@@ -0,0 +1,16 @@
+# core/management/commands/reconstruir_metricas.py
+from django.core.management.base import BaseCommand
+
+from core.services import reconstruir_metricas
+
+
+class Command(BaseCommand):
+    help = "Recalcula CarteraMetricas desde cuotas y pagos (reparación del resumen materializado)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cartera', action='append', dest='carteras', metavar='UUID',
+                            help='Cartera a reconstruir (repetible). Por defecto todas.')
+
+    def handle(self, *args, **options):
+        total = reconstruir_metricas(options['carteras'])
+        self.stdout.write(self.style.SUCCESS(f'Métricas reconstruidas para {total} carteras.'))
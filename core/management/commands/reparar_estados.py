@@ -0,0 +1,19 @@
+# core/management/commands/reparar_estados.py
+from django.core.management.base import BaseCommand
+
+from core.services import actualizar_estados_prestamos, reparar_estados_cuotas
+
+
+class Command(BaseCommand):
+    help = (
+        "Reparación de estados sobre toda la tabla de cuotas (MORA pendientes y PAGADA sin saldo) "
+        "y de los préstamos derivados. No es parte del job diario: usar tras cargas o ediciones manuales."
+    )
+
+    def handle(self, *args, **options):
+        cuotas_mora, cuotas_pagadas = reparar_estados_cuotas()
+        prestamos_mora, prestamos_pagados = actualizar_estados_prestamos()
+        self.stdout.write(self.style.SUCCESS(
+            f"cuotas a mora={cuotas_mora}, cuotas pagadas={cuotas_pagadas}, "
+            f"préstamos a mora={prestamos_mora}, préstamos pagados={prestamos_pagados}"
+        ))
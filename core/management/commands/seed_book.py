@@ -0,0 +1,42 @@
+# core/management/commands/seed_book.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.semillas import sembrar_libro
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera un libro sintético (carteras con miembros, intereses, clientes, préstamos con "
+        "calendario e historial de pagos) en la base configurada. Determinista por --semilla."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carteras', type=int, default=3)
+        parser.add_argument('--miembros', type=int, default=2, help='Usuarios gestores por cartera.')
+        parser.add_argument('--clientes', type=int, default=1000)
+        parser.add_argument('--prestamos', type=int, default=5000)
+        parser.add_argument('--cuotas', type=int, default=12, help='Máximo de cuotas por préstamo.')
+        parser.add_argument('--pagos', type=int, default=6, help='Máximo de pagos por préstamo.')
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--prefijo', default='seed',
+                            help='Prefijo de nombres únicos (cambiarlo para sembrar de nuevo la misma base).')
+        parser.add_argument('--lote', type=int, default=2000, help='Préstamos por transacción.')
+
+    def handle(self, *args, **opts):
+        if min(opts['carteras'], opts['clientes'], opts['lote'], opts['cuotas']) < 1:
+            raise CommandError('--carteras, --clientes, --cuotas y --lote deben ser >= 1')
+
+        inicio = time.perf_counter()
+
+        def progreso(hechos, total):
+            self.stdout.write(f'  {hechos}/{total} préstamos ({time.perf_counter() - inicio:.1f}s)')
+
+        totales = sembrar_libro(
+            carteras=opts['carteras'], miembros=opts['miembros'], clientes=opts['clientes'],
+            prestamos=opts['prestamos'], cuotas=opts['cuotas'], pagos=opts['pagos'],
+            semilla=opts['semilla'], prefijo=opts['prefijo'], lote=opts['lote'], progreso=progreso,
+        )
+        resumen = ', '.join(f'{k}={v}' for k, v in totales.items())
+        self.stdout.write(self.style.SUCCESS(f'Libro generado en {time.perf_counter() - inicio:.1f}s: {resumen}'))
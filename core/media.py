@@ -0,0 +1,224 @@
+# core/media.py
+"""
+Proxy de imágenes remotas (Cloudinary) para /api/secure-media/ en modo proxy.
+
+- Una sola `requests.Session` por proceso con pool de conexiones (keep-alive hacia el origen).
+- Respuestas en streaming por bloques: la imagen nunca se carga entera en memoria.
+- Peticiones condicionales: ETag/If-None-Match → 304 y Range → 206, tanto desde la caché
+  como reenviadas al origen.
+- Caché LRU en disco (SECURE_MEDIA_CACHE_DIR) acotada a SECURE_MEDIA_CACHE_MAX_BYTES:
+  cada acierto actualiza el mtime del archivo y al superar el tope se borran los más viejos.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from requests.adapters import HTTPAdapter
+
+from .metricas import MEDIA_ORIGEN_SEGUNDOS
+
+BLOQUE = 64 * 1024
+
+_sesion = None
+_sesion_lock = threading.Lock()
+_desalojo_lock = threading.Lock()
+
+
+def sesion() -> requests.Session:
+    """Sesión HTTP compartida por el proceso (se crea en el primer uso)."""
+    global _sesion
+    if _sesion is None:
+        with _sesion_lock:
+            if _sesion is None:
+                s = requests.Session()
+                pool = settings.SECURE_MEDIA_POOL_SIZE
+                adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool)
+                s.mount('https://', adapter)
+                s.mount('http://', adapter)
+                _sesion = s
+    return _sesion
+
+
+# --- Caché en disco ----------------------------------------------------------------
+
+def _rutas(url):
+    """(datos, metadatos) del archivo de caché para `url`, o (None, None) si está desactivada."""
+    directorio = settings.SECURE_MEDIA_CACHE_DIR
+    if not directorio:
+        return None, None
+    base = os.path.join(directorio, hashlib.sha256(url.encode()).hexdigest())
+    return base + '.bin', base + '.json'
+
+
+def _leer_cache(url):
+    datos, meta = _rutas(url)
+    if not datos:
+        return None
+    try:
+        with open(meta) as f:
+            info = json.load(f)
+        info['ruta'] = datos
+        info['tamano'] = os.path.getsize(datos)
+        os.utime(datos)  # LRU: último acceso = mtime
+    except (OSError, ValueError):
+        return None
+    return info
+
+
+def desalojar(max_bytes=None):
+    """Borra los archivos usados hace más tiempo hasta quedar por debajo del tope."""
+    directorio = settings.SECURE_MEDIA_CACHE_DIR
+    max_bytes = settings.SECURE_MEDIA_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    with _desalojo_lock:
+        try:
+            entradas = [e for e in os.scandir(directorio) if e.name.endswith('.bin')]
+        except OSError:
+            return
+        archivos = sorted(((e.stat().st_mtime, e.stat().st_size, e.path) for e in entradas))
+        total = sum(tamano for _, tamano, _ in archivos)
+        for _, tamano, ruta in archivos:
+            if total <= max_bytes:
+                break
+            for r in (ruta, ruta[:-4] + '.json'):
+                try:
+                    os.remove(r)
+                except OSError:
+                    pass
+            total -= tamano
+
+
+def _guardar_streaming(upstream, url, info):
+    """Generador que reenvía los bloques al cliente y a la vez los escribe en la caché."""
+    datos, meta = _rutas(url)
+    tmp = f'{datos}.{os.getpid()}.{threading.get_ident()}.tmp'
+    completo = False
+    try:
+        os.makedirs(os.path.dirname(datos), exist_ok=True)
+        with open(tmp, 'wb') as f:
+            for bloque in upstream.iter_content(BLOQUE):
+                f.write(bloque)
+                yield bloque
+        completo = True
+    finally:
+        upstream.close()
+        if completo:
+            with open(meta, 'w') as f:
+                json.dump(info, f)
+            os.replace(tmp, datos)
+            desalojar()
+        elif os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _reenviar(upstream):
+    try:
+        yield from upstream.iter_content(BLOQUE)
+    finally:
+        upstream.close()
+
+
+def _leer_archivo(ruta, inicio, fin):
+    with open(ruta, 'rb') as f:
+        f.seek(inicio)
+        restante = fin - inicio + 1
+        while restante > 0:
+            bloque = f.read(min(BLOQUE, restante))
+            if not bloque:
+                break
+            restante -= len(bloque)
+            yield bloque
+
+
+# --- Respuestas ----------------------------------------------------------------------
+
+def _rango(cabecera, tamano):
+    """Un solo rango 'bytes=a-b' → (inicio, fin). None si no hay rango usable."""
+    m = re.fullmatch(r'bytes=(\d*)-(\d*)', (cabecera or '').strip())
+    if not m or m.groups() == ('', ''):
+        return None
+    a, b = m.groups()
+    if a == '':  # sufijo: últimos b bytes
+        return max(tamano - int(b), 0), tamano - 1
+    if b and int(b) < int(a):
+        return None
+    return int(a), min(int(b), tamano - 1) if b else tamano - 1
+
+
+def _cabeceras(response, etag=None):
+    if etag:
+        response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = 'private, max-age=3600'
+    response['X-Content-Type-Options'] = 'nosniff'
+    response['X-Frame-Options'] = 'DENY'
+    return response
+
+
+def _desde_cache(request, info):
+    etag = info.get('etag')
+    if etag and request.headers.get('If-None-Match') == etag:
+        return _cabeceras(HttpResponse(status=304), etag)
+
+    tamano = info['tamano']
+    rango = _rango(request.headers.get('Range'), tamano)
+    if rango and rango[0] >= tamano:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{tamano}'
+        return _cabeceras(response, etag)
+
+    inicio, fin = rango or (0, tamano - 1)
+    response = StreamingHttpResponse(_leer_archivo(info['ruta'], inicio, fin),
+                                     status=206 if rango else 200,
+                                     content_type=info.get('content_type') or 'application/octet-stream')
+    response['Content-Length'] = fin - inicio + 1
+    if rango:
+        response['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+    response['X-Media-Cache'] = 'HIT'
+    return _cabeceras(response, etag)
+
+
+def servir_remoto(request, url):
+    """
+    Sirve `url` en streaming pasando por la caché en disco.
+    Lanza Http404 si el origen no tiene el archivo y deja pasar requests.RequestException.
+    """
+    info = _leer_cache(url)
+    if info:
+        return _desde_cache(request, info)
+
+    reenviar = {h: request.headers[h] for h in ('Range', 'If-None-Match') if h in request.headers}
+    inicio = time.perf_counter()
+    try:
+        upstream = sesion().get(url, headers=reenviar, stream=True, timeout=settings.SECURE_MEDIA_TIMEOUT)
+    except requests.RequestException:
+        MEDIA_ORIGEN_SEGUNDOS.observar(time.perf_counter() - inicio, status='error')
+        raise
+    MEDIA_ORIGEN_SEGUNDOS.observar(time.perf_counter() - inicio, status=upstream.status_code)
+
+    etag = upstream.headers.get('ETag')
+    if upstream.status_code == 304:
+        upstream.close()
+        return _cabeceras(HttpResponse(status=304), etag)
+    if upstream.status_code not in (200, 206):
+        upstream.close()
+        raise Http404("Archivo no encontrado en el origen")
+
+    content_type = upstream.headers.get('Content-Type', 'image/jpeg')
+    if upstream.status_code == 200 and _rutas(url)[0]:
+        cuerpo = _guardar_streaming(upstream, url, {'etag': etag, 'content_type': content_type})
+    else:
+        cuerpo = _reenviar(upstream)
+
+    response = StreamingHttpResponse(cuerpo, status=upstream.status_code, content_type=content_type)
+    for h in ('Content-Length', 'Content-Range'):
+        # con Content-Encoding requests ya descomprimió: el largo original no aplica
+        if h in upstream.headers and 'Content-Encoding' not in upstream.headers:
+            response[h] = upstream.headers[h]
+    response['X-Media-Cache'] = 'MISS'
+    return _cabeceras(response, etag)
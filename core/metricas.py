@@ -0,0 +1,216 @@
+# core/metricas.py
+"""
+Métricas de negocio y rendimiento en formato de exposición de Prometheus (GET /metrics).
+
+Sin dependencias ni servicios externos: cada proceso acumula sus contadores/histogramas en
+memoria y los vuelca a su propio archivo JSON en METRICAS_DIR (como mucho cada
+METRICAS_FLUSH_SEGUNDOS y al terminar). El worker que atiende /metrics suma los archivos
+de todos los procesos, así que funciona con varios workers de gunicorn.
+Los archivos de procesos ya terminados se siguen sumando (los contadores no retroceden):
+vaciar METRICAS_DIR al arrancar el servicio. Con METRICAS_DIR vacío solo se expone el
+proceso actual.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registro = {}           # nombre -> métrica (para HELP/TYPE y el orden de exposición)
+_valores = {}            # (nombre, etiquetas) -> float | {'buckets': [...], 'sum', 'count'}
+_lock = threading.Lock()
+_proceso = {'pid': None, 'archivo': None, 'volcado': 0.0}
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre, self.ayuda, self.etiquetas = nombre, ayuda, tuple(etiquetas)
+        _registro[nombre] = self
+
+    def _clave(self, valores):
+        if set(valores) != set(self.etiquetas):
+            raise ValueError(f'{self.nombre} espera las etiquetas {self.etiquetas}')
+        return self.nombre, tuple(str(valores[e]) for e in self.etiquetas)
+
+
+class Contador(_Metrica):
+    tipo = 'counter'
+
+    def inc(self, n=1, **etiquetas):
+        if not n:
+            return
+        clave = self._clave(etiquetas)
+        with _lock:
+            _verificar_proceso()
+            _valores[clave] = _valores.get(clave, 0) + n
+        _volcar_si_toca()
+
+
+class Histograma(_Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(buckets)
+
+    def observar(self, valor, **etiquetas):
+        clave = self._clave(etiquetas)
+        with _lock:
+            _verificar_proceso()
+            datos = _valores.setdefault(clave, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    datos['buckets'][i] += 1  # no acumulado: se acumula al exponer
+                    break
+            datos['sum'] += valor
+            datos['count'] += 1
+        _volcar_si_toca()
+
+    @contextmanager
+    def medir(self, **etiquetas):
+        """Observa la duración del bloque en segundos (también si lanza excepción)."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **etiquetas)
+
+
+# --- Métricas de la app -----------------------------------------------------------
+
+PAGOS_APLICADOS = Contador(
+    'avanza_pagos_aplicados_total', 'Pagos aplicados a préstamos.', ['origen'])
+APLICAR_PAGO_SEGUNDOS = Histograma(
+    'avanza_aplicar_pago_segundos', 'Duración de aplicar_pago (cascada + escritura).')
+TRANSICIONES_ESTADO = Contador(
+    'avanza_transiciones_estado_total', 'Transiciones del job de estados.', ['entidad', 'estado'])
+CORRIDAS_ESTADOS = Contador(
+    'avanza_estados_corridas_total', 'Corridas del job de estados (omitida = día ya procesado).', ['resultado'])
+DASHBOARD_CACHE = Contador(
+    'avanza_dashboard_cache_total', 'Bloques del dashboard servidos desde caché o calculados.', ['resultado'])
+MEDIA_ORIGEN_SEGUNDOS = Histograma(
+    'avanza_media_origen_segundos', 'Latencia hasta la respuesta del origen de media (proxy).', ['status'])
+
+
+# --- Multiproceso ------------------------------------------------------------------
+
+def _verificar_proceso():
+    """Tras un fork (gunicorn --preload) el hijo no hereda los valores del padre."""
+    pid = os.getpid()
+    if _proceso['pid'] != pid:
+        _valores.clear()
+        _proceso.update(pid=pid, archivo=f'{pid}_{uuid.uuid4().hex[:8]}.json', volcado=time.monotonic())
+
+
+def _volcar_si_toca():
+    if time.monotonic() - _proceso['volcado'] >= settings.METRICAS_FLUSH_SEGUNDOS:
+        try:
+            volcar()
+        except OSError:
+            pass  # sin disco no se pierde nada: se reintenta en el próximo volcado
+
+
+def volcar():
+    """Escribe los valores del proceso en su archivo de METRICAS_DIR (reemplazo atómico)."""
+    directorio = settings.METRICAS_DIR
+    with _lock:
+        _verificar_proceso()
+        _proceso['volcado'] = time.monotonic()
+        if not directorio:
+            return
+        filas = [[nombre, list(etiquetas), valor] for (nombre, etiquetas), valor in _valores.items()]
+        archivo = _proceso['archivo']
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, archivo)
+    tmp = f'{ruta}.{threading.get_ident()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(filas, f)
+    os.replace(tmp, ruta)
+
+
+atexit.register(lambda: _proceso['pid'] == os.getpid() and volcar())
+
+
+def _sumar(total, clave, valor):
+    if isinstance(valor, dict):
+        actual = total.setdefault(clave, {'buckets': [0] * len(valor['buckets']), 'sum': 0.0, 'count': 0})
+        actual['buckets'] = [a + b for a, b in zip(actual['buckets'], valor['buckets'])]
+        actual['sum'] += valor['sum']
+        actual['count'] += valor['count']
+    else:
+        total[clave] = total.get(clave, 0) + valor
+
+
+def recolectar() -> dict:
+    """Valores sumados de todos los procesos: {(nombre, etiquetas): valor}."""
+    directorio = settings.METRICAS_DIR
+    if not directorio:
+        with _lock:
+            _verificar_proceso()
+            total = {}
+            for clave, valor in _valores.items():
+                _sumar(total, clave, valor)  # copia: se lee fuera del lock
+            return total
+
+    volcar()
+    total = {}
+    for nombre in os.listdir(directorio):
+        if not nombre.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directorio, nombre), encoding='utf-8') as f:
+                filas = json.load(f)
+        except (OSError, ValueError):
+            continue  # borrado o a medio escribir por otro proceso
+        for metrica, etiquetas, valor in filas:
+            _sumar(total, (metrica, tuple(etiquetas)), valor)
+    return total
+
+
+# --- Exposición --------------------------------------------------------------------
+
+def _escapar(valor):
+    return valor.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _etiquetas(nombres, valores, extra=None):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+def _numero(x):
+    return repr(float(x)) if isinstance(x, float) else str(x)
+
+
+def exponer() -> str:
+    """Texto en formato de exposición de Prometheus (text/plain; version=0.0.4)."""
+    valores = recolectar()
+    lineas = []
+    for nombre, metrica in _registro.items():
+        lineas.append(f'# HELP {nombre} {metrica.ayuda}')
+        lineas.append(f'# TYPE {nombre} {metrica.tipo}')
+        series = sorted(((etq, v) for (n, etq), v in valores.items() if n == nombre), key=lambda s: s[0])
+        for etiquetas, valor in series:
+            if metrica.tipo == 'counter':
+                lineas.append(f'{nombre}{_etiquetas(metrica.etiquetas, etiquetas)} {_numero(valor)}')
+                continue
+            acumulado = 0
+            for limite, n in zip(metrica.buckets, valor['buckets']):
+                acumulado += n
+                le = f'le="{_numero(float(limite))}"'
+                lineas.append(f'{nombre}_bucket{_etiquetas(metrica.etiquetas, etiquetas, le)} {acumulado}')
+            le = 'le="+Inf"'
+            lineas.append(f'{nombre}_bucket{_etiquetas(metrica.etiquetas, etiquetas, le)} {valor["count"]}')
+            lineas.append(f'{nombre}_sum{_etiquetas(metrica.etiquetas, etiquetas)} {_numero(valor["sum"])}')
+            lineas.append(f'{nombre}_count{_etiquetas(metrica.etiquetas, etiquetas)} {valor["count"]}')
+    return '\n'.join(lineas) + '\n'
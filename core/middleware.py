@@ -0,0 +1,126 @@
+# core/middleware.py
+"""
+Instrumentación por petición: consultas SQL, tiempo en base de datos, tiempo en Python
+y tamaño de la respuesta.
+
+- Cabecera `Server-Timing` (visible en la pestaña Network del navegador): solo con
+  INSTRUMENTACION_HEADER (por defecto en DEBUG) o para usuarios staff.
+- Una línea de log estructurada por petición en el logger `core.peticiones`
+  (los campos van en `extra['peticion']`).
+- Presupuesto de consultas: PETICION_PRESUPUESTO_CONSULTAS por defecto, o el de la vista
+  con @presupuesto_consultas(n). Si se supera, log WARNING con las sentencias más repetidas
+  (así aparece un N+1) y cabecera `X-Query-Budget-Exceeded`.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('core.peticiones')
+
+_LITERALES = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def presupuesto_consultas(maximo: int | None):
+    """Decorador de vista o acción: presupuesto de consultas propio (None = sin límite)."""
+    def decorador(vista):
+        vista.presupuesto_consultas = maximo
+        return vista
+    return decorador
+
+
+class _Medidor:
+    """execute_wrapper: cuenta y cronometra cada sentencia de la petición."""
+
+    def __init__(self, guardar_sql):
+        self.consultas = 0
+        self.segundos = 0.0
+        self.sentencias = Counter() if guardar_sql else None
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.segundos += time.perf_counter() - inicio
+            self.consultas += 1
+            if self.sentencias is not None:
+                # misma forma de sentencia con distintos literales = misma clave
+                self.sentencias[_LITERALES.sub('?', sql)] += 1
+
+
+def _cabeceras_visibles(request):
+    """Los tiempos y consultas no se exponen a clientes anónimos en producción."""
+    if settings.INSTRUMENTACION_HEADER:
+        return True
+    usuario = getattr(request, 'user', None)  # DRF lo deja en el request al autenticar
+    return bool(usuario and usuario.is_authenticated and usuario.is_staff)
+
+
+class InstrumentacionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.INSTRUMENTACION_ACTIVA:
+            return self.get_response(request)
+
+        request.presupuesto_consultas = settings.PETICION_PRESUPUESTO_CONSULTAS
+        medidor = _Medidor(guardar_sql=True)
+        inicio = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(medidor))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - inicio) * 1000
+        db_ms = medidor.segundos * 1000
+
+        tamano = None if response.streaming else len(response.content)
+        cabeceras = _cabeceras_visibles(request)
+        if cabeceras:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={db_ms:.1f};desc="{medidor.consultas} consultas"',
+                f'app;dur={total_ms - db_ms:.1f}',
+                f'total;dur={total_ms:.1f}',
+            ])
+
+        datos = {
+            'metodo': request.method,
+            'ruta': request.path,
+            'status': response.status_code,
+            'consultas': medidor.consultas,
+            'db_ms': round(db_ms, 1),
+            'app_ms': round(total_ms - db_ms, 1),
+            'total_ms': round(total_ms, 1),
+            'bytes': tamano,
+        }
+
+        presupuesto = request.presupuesto_consultas
+        if presupuesto is not None and medidor.consultas > presupuesto:
+            if cabeceras:
+                response['X-Query-Budget-Exceeded'] = f'{medidor.consultas}/{presupuesto}'
+            datos['presupuesto'] = presupuesto
+            datos['repetidas'] = [{'n': n, 'sql': sql[:300]}
+                                  for sql, n in medidor.sentencias.most_common(3) if n > 1]
+            logger.warning('%(metodo)s %(ruta)s superó el presupuesto: %(consultas)s/%(presupuesto)s consultas',
+                           datos, extra={'peticion': datos})
+        else:
+            logger.info('%(metodo)s %(ruta)s %(status)s %(total_ms)sms %(consultas)sq',
+                        datos, extra={'peticion': datos})
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not hasattr(request, 'presupuesto_consultas'):
+            return None
+        # ViewSets: el decorador puede estar en la acción (método) o el atributo en la clase
+        cls = getattr(view_func, 'cls', None)
+        accion = getattr(view_func, 'actions', {}).get(request.method.lower())
+        for origen in (getattr(cls, accion, None) if accion else None, cls, view_func):
+            if origen is not None and hasattr(origen, 'presupuesto_consultas'):
+                request.presupuesto_consultas = origen.presupuesto_consultas
+                break
+        return None
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-17 19:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcesoProgramado',
+            fields=[
+                ('nombre', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('ultima_fecha', models.DateField(blank=True, null=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'procesos_programados',
+            },
+        ),
+    ]
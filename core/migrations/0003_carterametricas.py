@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-17 19:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_procesoprogramado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarteraMetricas',
+            fields=[
+                ('cartera', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='metricas', serialize=False, to='core.cartera')),
+                ('dinero_disponible', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('capital_pendiente', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('interes_pendiente', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('interes_devengado', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('clientes_activos', models.PositiveIntegerField(default=0)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'cartera_metricas',
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-17 19:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_carterametricas'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cuota',
+            index=models.Index(fields=['fecha_vencimiento', 'estado'], name='idx_cuota_venc_estado'),
+        ),
+    ]
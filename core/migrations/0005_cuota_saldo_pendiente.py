@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-17 20:00
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def llenar_saldo_pendiente(apps, schema_editor):
+    Cuota = apps.get_model('core', 'Cuota')
+    Cuota.objects.update(saldo_pendiente=F('capital_programado') + F('interes_programado')
+                                         - F('capital_pagado') - F('interes_pagado'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_cuota_idx_venc_estado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cuota',
+            name='saldo_pendiente',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.RunPython(llenar_saldo_pendiente, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='cuota',
+            index=models.Index(condition=models.Q(('saldo_pendiente__gt', 0)), fields=['fecha_vencimiento'], name='idx_cuota_abierta_venc'),
+        ),
+    ]
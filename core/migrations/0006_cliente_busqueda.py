@@ -0,0 +1,63 @@
+# Generated by Django 5.2.5 on 2026-10-17 20:01
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normalizar_texto(texto):
+    # Copia de core.models.normalizar_texto tal como estaba al crear la migración
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower().strip()
+
+
+def llenar_nombre_normalizado(apps, schema_editor):
+    Cliente = apps.get_model('core', 'Cliente')
+    lote = []
+    for cliente in Cliente.objects.only('id', 'nombre').iterator(chunk_size=2000):
+        cliente.nombre_normalizado = normalizar_texto(cliente.nombre)
+        lote.append(cliente)
+        if len(lote) >= 2000:
+            Cliente.objects.bulk_update(lote, ['nombre_normalizado'])
+            lote = []
+    Cliente.objects.bulk_update(lote, ['nombre_normalizado'])
+
+
+# Solo PostgreSQL: trigram (LIKE '%x%') sobre el nombre y pattern_ops (LIKE 'x%') para
+# identificación. En SQLite la búsqueda funciona igual, con recorrido de la tabla.
+INDICES_PG = [
+    'CREATE INDEX IF NOT EXISTS idx_clientes_nombre_trgm ON clientes USING gin (nombre_normalizado gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS idx_clientes_ident_prefijo ON clientes (identificacion varchar_pattern_ops)',
+]
+
+
+def crear_indices_pg(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for sql in INDICES_PG:
+        schema_editor.execute(sql)
+
+
+def borrar_indices_pg(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS idx_clientes_nombre_trgm')
+    schema_editor.execute('DROP INDEX IF EXISTS idx_clientes_ident_prefijo')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_cuota_saldo_pendiente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='nombre_normalizado',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(llenar_nombre_normalizado, migrations.RunPython.noop),
+        migrations.RunPython(crear_indices_pg, borrar_indices_pg),
+    ]
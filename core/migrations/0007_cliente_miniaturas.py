@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-17 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_cliente_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='foto_cliente_thumb',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='clientes/thumbs/%Y/%m/%d'),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='foto_dni_1_thumb',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='clientes/thumbs/%Y/%m/%d'),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='foto_dni_2_thumb',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='clientes/thumbs/%Y/%m/%d'),
+        ),
+    ]
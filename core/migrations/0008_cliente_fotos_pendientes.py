@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 20:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_cliente_miniaturas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='fotos_pendientes',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-17 20:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_cliente_fotos_pendientes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['created_at', 'id'], name='idx_clientes_created_id'),
+        ),
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(fields=['created_at', 'id'], name='idx_pagos_created_id'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['created_at', 'id'], name='idx_prestamos_created_id'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-17 20:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_indices_cursor_fecha'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pago',
+            name='referencia',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddConstraint(
+            model_name='pago',
+            constraint=models.UniqueConstraint(condition=models.Q(('referencia', ''), _negated=True), fields=('prestamo', 'referencia'), name='uniq_pago_prestamo_referencia'),
+        ),
+    ]
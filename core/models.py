@@ -4,6 +4,13 @@ from datetime import date
 from django.db import models
 from django.conf import settings
 from decimal import Decimal
+import unicodedata
+
+
+def normalizar_texto(texto: str) -> str:
+    """Minúsculas y sin tildes: 'José Peña' -> 'jose pena' (búsqueda insensible a acentos)."""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower().strip()
 
 
 # core/models.py
@@ -21,6 +28,13 @@ class Cliente(models.Model):
     foto_dni_1         = models.ImageField(upload_to='clientes/%Y/%m/%d', null=True, blank=True)
     foto_dni_2         = models.ImageField(upload_to='clientes/%Y/%m/%d', null=True, blank=True)
 
+    # Miniaturas generadas al subir cada foto (core/imagenes.py)
+    foto_cliente_thumb = models.ImageField(upload_to='clientes/thumbs/%Y/%m/%d', null=True, blank=True, editable=False)
+    foto_dni_1_thumb   = models.ImageField(upload_to='clientes/thumbs/%Y/%m/%d', null=True, blank=True, editable=False)
+    foto_dni_2_thumb   = models.ImageField(upload_to='clientes/thumbs/%Y/%m/%d', null=True, blank=True, editable=False)
+    # Fotos en staging local esperando subida en segundo plano: {campo: {ruta, nombre}}
+    fotos_pendientes   = models.JSONField(default=dict, blank=True, editable=False)
+
     # Datos del garante embebidos (siguen igual)
     garante_identificacion = models.CharField(max_length=128, blank=True, default='')
     garante_nombre         = models.CharField(max_length=255, blank=True, default='')
@@ -31,11 +45,15 @@ class Cliente(models.Model):
     activo       = models.BooleanField(default=True)
     created_at   = models.DateTimeField(auto_now_add=True)
 
+    # Copia de `nombre` para ?q= (ver normalizar_texto). Índices trigram en la migración 0006
+    nombre_normalizado = models.CharField(max_length=255, blank=True, default='', editable=False)
+
     class Meta:
         db_table = 'clientes'
         indexes = [
             models.Index(fields=['identificacion'], name='idx_clientes_identificacion'),
             models.Index(fields=['email'], name='idx_clientes_email'),
+            models.Index(fields=['created_at', 'id'], name='idx_clientes_created_id'),  # CursorPorFecha
         ]
 
     def __str__(self):
@@ -43,7 +61,20 @@ class Cliente(models.Model):
     
     def save(self, *args, **kwargs):
         self.activo = True
+        from .imagenes import preparar_miniaturas, subir_miniaturas
+        from .tareas import encolar_al_confirmar
+
+        self.nombre_normalizado = normalizar_texto(self.nombre)
+        quitadas, miniaturas = preparar_miniaturas(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            extra = {'nombre_normalizado'} if 'nombre' in update_fields else set()
+            kwargs['update_fields'] = {*update_fields, *extra, *quitadas}
         super().save(*args, **kwargs)
+        if miniaturas:
+            # Las miniaturas se suben solo si el guardado confirma
+            encolar_al_confirmar(subir_miniaturas, self.pk,
+                                 {campo: (getattr(self, campo).name, m) for campo, m in miniaturas.items()})
 """
 Modelo: Cartera
 Requisitos:
@@ -141,6 +172,7 @@ class Prestamo(models.Model):
             models.Index(fields=['cliente'],    name='idx_prestamos_cliente'),
             models.Index(fields=['estado'],     name='idx_prestamos_estado'),
             models.Index(fields=['created_at'], name='idx_prestamos_created'),
+            models.Index(fields=['created_at', 'id'], name='idx_prestamos_created_id'),  # CursorPorFecha
         ]
 
     def __str__(self):
@@ -165,17 +197,32 @@ class Cuota(models.Model):
 
     estado             = models.CharField(max_length=16, choices=Estado.choices, default=Estado.PENDIENTE)
 
+    # Desnormalizado: programado - pagado. Lo mantienen save() y los servicios (bulk)
+    saldo_pendiente    = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+
     class Meta:
         db_table = 'cuotas'
         unique_together = ('prestamo', 'numero')
         indexes = [
             models.Index(fields=['prestamo', 'numero'], name='idx_cuota_prestamo_num'),
             models.Index(fields=['prestamo', 'estado'], name='idx_cuota_prestamo_estado'),
+            # Ruta de cobro: cuotas que vencen hasta una fecha y siguen abiertas
+            models.Index(fields=['fecha_vencimiento', 'estado'], name='idx_cuota_venc_estado'),
+            # Parcial: solo cuotas abiertas (vencidas con saldo = range scan por fecha)
+            models.Index(fields=['fecha_vencimiento'], name='idx_cuota_abierta_venc',
+                         condition=models.Q(saldo_pendiente__gt=0)),
         ]
 
     def __str__(self):
         return f'Cuota {self.numero} de {self.prestamo_id}'
 
+    def save(self, *args, **kwargs):
+        self.saldo_pendiente = self.saldo_capital + self.saldo_interes
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'saldo_pendiente' not in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'saldo_pendiente'}
+        super().save(*args, **kwargs)
+
     @property
     def saldo_capital(self):
         return self.capital_programado - self.capital_pagado
@@ -190,11 +237,21 @@ class Pago(models.Model):
     monto       = models.DecimalField(max_digits=12, decimal_places=2)
     metodo_pago = models.CharField(max_length=50, blank=True, default='')
     observacion = models.CharField(max_length=255, blank=True, default='')
+    # Referencia externa opcional (recibo, id de la transferencia): reintentar una importación
+    # con las mismas referencias no duplica pagos
+    referencia  = models.CharField(max_length=100, blank=True, default='')
     created_at  = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = 'pagos'
-        indexes  = [models.Index(fields=['prestamo', 'fecha_pago'], name='idx_pagos_prestamo_fecha')]
+        constraints = [
+            models.UniqueConstraint(fields=['prestamo', 'referencia'], condition=~models.Q(referencia=''),
+                                    name='uniq_pago_prestamo_referencia'),
+        ]
+        indexes  = [
+            models.Index(fields=['prestamo', 'fecha_pago'], name='idx_pagos_prestamo_fecha'),
+            models.Index(fields=['created_at', 'id'], name='idx_pagos_created_id'),  # CursorPorFecha
+        ]
 
     def __str__(self):
         return f'Pago {self.monto} a {self.prestamo_id}'
@@ -208,3 +265,44 @@ class PagoDetalle(models.Model):
     class Meta:
         db_table = 'pagos_detalle'
         indexes  = [models.Index(fields=['cuota'], name='idx_pago_detalle_cuota')]
+class ProcesoProgramado(models.Model):
+    """
+    Marca de agua de los procesos periódicos (p.ej. actualización diaria de estados).
+    ultima_fecha: último día procesado por completo.
+    """
+    nombre       = models.CharField(max_length=64, primary_key=True)
+    ultima_fecha = models.DateField(null=True, blank=True)
+    actualizado  = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'procesos_programados'
+
+    def __str__(self):
+        return f'{self.nombre} (hasta {self.ultima_fecha})'
+class CarteraMetricas(models.Model):
+    """
+    Resumen materializado del dashboard por cartera. Lo mantienen con deltas
+    generar_calendario, aplicar_pago y el job diario; `manage.py reconstruir_metricas` lo repara.
+    interes_devengado: interés pendiente de cuotas vencidas hasta la fecha de corte del job.
+    """
+    cartera            = models.OneToOneField(Cartera, on_delete=models.CASCADE, primary_key=True, related_name='metricas')
+    dinero_disponible  = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    capital_pendiente  = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    interes_pendiente  = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    interes_devengado  = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    clientes_activos   = models.PositiveIntegerField(default=0)
+    actualizado        = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'cartera_metricas'
+
+    def __str__(self):
+        return f'Métricas de {self.cartera_id}'
+
+    @property
+    def cartera_por_cobrar_contable(self):
+        return self.capital_pendiente + self.interes_devengado
+
+    @property
+    def saldo_contractual_pendiente(self):
+        return self.capital_pendiente + self.interes_pendiente
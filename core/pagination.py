@@ -0,0 +1,29 @@
+# core/pagination.py
+"""
+Paginación por cursor (keyset) para los viewsets de core.
+
+El cursor guarda la posición del primer campo del ordering, así que cada página es un
+`WHERE campo > posición ORDER BY ... LIMIT n` que usa índice y no se degrada en páginas
+profundas como OFFSET. El segundo campo solo desempata.
+"""
+from rest_framework.pagination import CursorPagination
+
+
+class CursorBase(CursorPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class CursorPorFecha(CursorBase):
+    """Más recientes primero: (created_at, id)."""
+    ordering = ('-created_at', '-id')
+
+
+class CursorCuotas(CursorBase):
+    """Calendario en orden: (prestamo, numero)."""
+    ordering = ('prestamo_id', 'numero')
+
+
+class CursorPorNombre(CursorBase):
+    """Catálogos con nombre único (carteras, intereses)."""
+    ordering = ('nombre',)
@@ -0,0 +1,150 @@
+# core/semillas.py
+"""
+Generador de datos sintéticos (carteras, miembros, clientes, préstamos, pagos) para
+pruebas de carga, benchmark y reproducir problemas de volumen en local.
+
+Usa la misma lógica de dominio que la API: calendario con construir_cuotas y pagos con
+la cascada de aplicar_cascada, pero todo en memoria y persistido con bulk_create por
+lotes, así que un millón de cuotas se genera en minutos. Con la misma semilla y el mismo
+día produce exactamente los mismos datos (incluidos los UUID).
+"""
+import random
+import uuid
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from .models import Cartera, CarteraMiembro, Cliente, Cuota, Interes, Pago, PagoDetalle, Prestamo, normalizar_texto
+from .services import aplicar_cascada, calcular_saldos, construir_cuotas, marcar_mora, reconstruir_metricas
+
+NOMBRES = ['José', 'María', 'Ana', 'Luis', 'Sofía', 'Andrés', 'Camila', 'Jesús', 'Lucía', 'Martín',
+           'Valentina', 'Óscar', 'Ramón', 'Inés', 'Julián', 'Paula', 'Héctor', 'Daniela', 'Tomás', 'Elena']
+APELLIDOS = ['García', 'Rodríguez', 'Pérez', 'Gómez', 'Martínez', 'López', 'Hernández', 'Díaz', 'Muñoz',
+             'Ramírez', 'Castaño', 'Peña', 'Vásquez', 'Rojas', 'Álvarez', 'Ortiz', 'Suárez', 'Ríos']
+TASAS = ['0.10', '0.15', '0.20', '0.25']
+CENTAVO = Decimal('0.01')
+DIAS_FRECUENCIA = {Prestamo.Frecuencia.SEMANAL: 7, Prestamo.Frecuencia.QUINCENAL: 15, Prestamo.Frecuencia.MENSUAL: 30}
+
+
+def _uuid(rnd: random.Random) -> uuid.UUID:
+    return uuid.UUID(int=rnd.getrandbits(128), version=4)
+
+
+def sembrar_libro(carteras=3, miembros=2, clientes=200, prestamos=500, cuotas=12, pagos=6,
+                  semilla=42, prefijo='seed', lote=2000, progreso=None) -> dict:
+    """
+    Inserta un libro sintético y devuelve los conteos generados.
+    - miembros: usuarios gestores por cartera (usuario `{prefijo}_{cartera}_{n}`, clave = prefijo).
+    - cuotas: máximo de cuotas por préstamo (cada préstamo toma entre 4 y `cuotas`).
+    - pagos: máximo de pagos históricos por préstamo (solo sobre cuotas ya vencidas).
+    - prefijo: distingue nombres/identificaciones únicas si se siembra dos veces en la misma base.
+    - progreso: callable(insertados, total) opcional, llamado tras cada lote de préstamos.
+    """
+    rnd = random.Random(semilla)
+    hoy = date.today()
+    User = get_user_model()
+
+    with transaction.atomic():
+        intereses = [Interes.objects.get_or_create(nombre=f'{int(Decimal(t) * 100)}%',
+                                                   defaults={'tasa_decimal': Decimal(t)})[0]
+                     for t in TASAS]
+
+        lista_carteras = Cartera.objects.bulk_create([
+            Cartera(id=_uuid(rnd), nombre=f'{prefijo} cartera {i + 1}') for i in range(carteras)])
+
+        clave = make_password(prefijo)  # un solo hash: PBKDF2 por usuario domina el tiempo
+        usuarios = User.objects.bulk_create([
+            User(username=f'{prefijo}_{c + 1}_{n + 1}', password=clave)
+            for c in range(carteras) for n in range(miembros)])
+        CarteraMiembro.objects.bulk_create([
+            CarteraMiembro(id=_uuid(rnd), cartera=lista_carteras[i // miembros], usuario=u,
+                           rol=CarteraMiembro.RolEnCartera.GESTOR)
+            for i, u in enumerate(usuarios)])
+
+        lista_clientes = []
+        for i in range(clientes):
+            nombre = f'{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}'
+            lista_clientes.append(Cliente(
+                id=_uuid(rnd), nombre=nombre, nombre_normalizado=normalizar_texto(nombre),
+                identificacion=f'{prefijo}-{i + 1:08d}', telefono=f'3{rnd.randrange(10**9):09d}',
+                direccion=f'Calle {rnd.randint(1, 120)} # {rnd.randint(1, 99)}-{rnd.randint(1, 99)}'))
+        Cliente.objects.bulk_create(lista_clientes, batch_size=1000)
+
+    totales = {'carteras': carteras, 'usuarios': len(usuarios), 'clientes': clientes,
+               'prestamos': 0, 'cuotas': 0, 'pagos': 0}
+
+    for inicio in range(0, prestamos, lote):
+        filas_prestamos, filas_cuotas, filas_pagos, filas_detalles = [], [], [], []
+        for _ in range(min(lote, prestamos - inicio)):
+            prestamo, calendario, historial, detalles = _generar_prestamo(
+                rnd, hoy, lista_clientes, lista_carteras, intereses, cuotas, pagos)
+            filas_prestamos.append(prestamo)
+            filas_cuotas.extend(calendario)
+            filas_pagos.extend(historial)
+            filas_detalles.extend(detalles)
+
+        with transaction.atomic():
+            Prestamo.objects.bulk_create(filas_prestamos, batch_size=1000)
+            Cuota.objects.bulk_create(filas_cuotas, batch_size=2000)
+            Pago.objects.bulk_create(filas_pagos, batch_size=2000)
+            PagoDetalle.objects.bulk_create(filas_detalles, batch_size=2000)
+
+        totales['prestamos'] += len(filas_prestamos)
+        totales['cuotas'] += len(filas_cuotas)
+        totales['pagos'] += len(filas_pagos)
+        if progreso:
+            progreso(totales['prestamos'], prestamos)
+
+    # Resumen materializado de las carteras nuevas en una sola pasada agregada
+    reconstruir_metricas([c.pk for c in lista_carteras])
+    return totales
+
+
+def _generar_prestamo(rnd, hoy, clientes, carteras, intereses, max_cuotas, max_pagos):
+    """Un préstamo con su calendario e historial de pagos, todo en memoria (sin guardar)."""
+    frecuencia = rnd.choice(list(DIAS_FRECUENCIA))
+    n_cuotas = rnd.randint(min(4, max_cuotas), max_cuotas)
+    # Desde recién originados (primera cuota futura) hasta calendarios ya vencidos
+    atraso = rnd.randint(-14, DIAS_FRECUENCIA[frecuencia] * n_cuotas)
+    prestamo = Prestamo(
+        id=_uuid(rnd),
+        cliente=rnd.choice(clientes),
+        cartera=rnd.choice(carteras),
+        interes=rnd.choice(intereses),
+        monto=Decimal(rnd.randrange(200, 5000, 50)),
+        cuotas_totales=n_cuotas,
+        frecuencia=frecuencia,
+        primera_cuota_fecha=hoy - timedelta(days=atraso),
+    )
+    cuotas = construir_cuotas(prestamo)
+    for c in cuotas:
+        c.id = _uuid(rnd)
+
+    # Pagos sobre cuotas vencidas: algunos tarde, parciales o de más; algunas cuotas sin pagar
+    vencidas = [c for c in cuotas if c.fecha_vencimiento <= hoy]
+    n_pagos = rnd.randint(0, min(max_pagos, len(vencidas)))
+    fechas = sorted(min(c.fecha_vencimiento + timedelta(days=rnd.randint(-2, 10)), hoy)
+                    for c in vencidas[:n_pagos])
+
+    pagos, detalles = [], []
+    for fecha in fechas:
+        saldo = sum((c.saldo_pendiente for c in cuotas), Decimal(0))
+        base = cuotas[0].capital_programado + cuotas[0].interes_programado
+        monto = base * Decimal(rnd.choice(['0.5', '1', '1', '1', '1.5']))
+        monto = min(monto.quantize(CENTAVO, ROUND_HALF_UP), saldo)
+        if monto <= 0:
+            break
+        pago = Pago(id=_uuid(rnd), prestamo=prestamo, fecha_pago=fecha, monto=monto,
+                    metodo_pago=rnd.choice(['efectivo', 'transferencia']))
+        aplicados, _ = aplicar_cascada(pago, cuotas, hoy)
+        for d in aplicados:
+            d.id = _uuid(rnd)
+        pagos.append(pago)
+        detalles.extend(aplicados)
+
+    marcar_mora(cuotas, hoy)
+    calcular_saldos(prestamo, cuotas)
+    return prestamo, cuotas, pagos, detalles
@@ -12,6 +12,12 @@ class ClienteSerializer(serializers.ModelSerializer):
     foto_cliente_secure_url = serializers.SerializerMethodField()
     foto_dni_1_secure_url = serializers.SerializerMethodField()
     foto_dni_2_secure_url = serializers.SerializerMethodField()
+    # Miniaturas (listados / avatares); None si la foto aún no tiene miniatura
+    foto_cliente_thumb_secure_url = serializers.SerializerMethodField()
+    foto_dni_1_thumb_secure_url = serializers.SerializerMethodField()
+    foto_dni_2_thumb_secure_url = serializers.SerializerMethodField()
+    # Fotos recibidas que todavía se están subiendo al almacenamiento (campos, sin rutas)
+    fotos_pendientes = serializers.SerializerMethodField()
     
     class Meta:
         model = Cliente
@@ -24,7 +30,9 @@ class ClienteSerializer(serializers.ModelSerializer):
             # Campos originales de archivos (para subida)
             'foto_cliente', 'foto_dni_1', 'foto_dni_2',
             # URLs seguras (para visualización)
-            'foto_cliente_secure_url', 'foto_dni_1_secure_url', 'foto_dni_2_secure_url'
+            'foto_cliente_secure_url', 'foto_dni_1_secure_url', 'foto_dni_2_secure_url',
+            'foto_cliente_thumb_secure_url', 'foto_dni_1_thumb_secure_url', 'foto_dni_2_thumb_secure_url',
+            'fotos_pendientes'
         ]
     
     def _get_secure_url(self, image_field):
@@ -86,6 +94,18 @@ class ClienteSerializer(serializers.ModelSerializer):
     
     def get_foto_dni_2_secure_url(self, obj):
         return self._get_secure_url(obj.foto_dni_2)
+
+    def get_foto_cliente_thumb_secure_url(self, obj):
+        return self._get_secure_url(obj.foto_cliente_thumb)
+
+    def get_foto_dni_1_thumb_secure_url(self, obj):
+        return self._get_secure_url(obj.foto_dni_1_thumb)
+
+    def get_foto_dni_2_thumb_secure_url(self, obj):
+        return self._get_secure_url(obj.foto_dni_2_thumb)
+
+    def get_fotos_pendientes(self, obj):
+        return sorted(obj.fotos_pendientes or {})
 class CarteraMiembroSerializer(serializers.ModelSerializer):
     usuario_email = serializers.EmailField(source='usuario.email', read_only=True)
     usuario_id    = serializers.PrimaryKeyRelatedField(source='usuario', read_only=True)
@@ -106,7 +126,10 @@ class CarteraSerializer(serializers.ModelSerializer):
         read_only_fields = ('miembros', 'created_at')
 
     def get_miembros(self, obj: Cartera):
-        asignaciones = obj.asignaciones.select_related('usuario').all()
+        # Si la vista hizo prefetch de asignaciones__usuario se usa la caché (sin consultas)
+        asignaciones = obj.asignaciones.all()
+        if 'asignaciones' not in getattr(obj, '_prefetched_objects_cache', {}):
+            asignaciones = asignaciones.select_related('usuario')
         return CarteraMiembroSerializer(asignaciones, many=True).data
     
 class PrestamoSerializer(serializers.ModelSerializer):
@@ -188,6 +211,57 @@ class PrestamoSerializer(serializers.ModelSerializer):
         model = Prestamo
         fields = "__all__"
 
+class PrestamoListaSerializer(serializers.ModelSerializer):
+    """
+    Representación compacta para el listado de préstamos. Los bloques anidados
+    (cuotas, cliente, cartera) se agregan solo si vienen en context['expand'].
+    """
+    cliente_nombre      = serializers.CharField(source='cliente.nombre', read_only=True)
+    cartera_nombre      = serializers.CharField(source='cartera.nombre', read_only=True)
+    proxima_cuota_fecha = serializers.DateField(read_only=True)
+
+    EXPANSIONES = {
+        'cuotas':  lambda: CuotaSerializer(many=True, read_only=True),
+        'cliente': lambda: ClienteSerializer(read_only=True),
+        'cartera': lambda: CarteraSerializer(read_only=True),
+    }
+
+    class Meta:
+        model = Prestamo
+        fields = ('id', 'cliente_id', 'cliente_nombre', 'cartera_id', 'cartera_nombre',
+                  'monto', 'estado', 'saldo_capital', 'saldo_interes',
+                  'proxima_cuota_fecha', 'created_at')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for nombre in self.context.get('expand', ()):
+            self.fields[nombre] = self.EXPANSIONES[nombre]()
+
+class PrestamoLoteSerializer(serializers.Serializer):
+    """
+    Fila de originación masiva. Solo valida formato: las referencias (cliente, cartera,
+    interés) se resuelven todas juntas en services.crear_prestamos_lote.
+    """
+    cliente_id          = serializers.UUIDField()
+    cartera_id          = serializers.UUIDField()
+    interes_id          = serializers.UUIDField()
+    monto               = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal('0.01'))
+    cuotas_totales      = serializers.IntegerField(min_value=1)
+    frecuencia          = serializers.ChoiceField(choices=Prestamo.Frecuencia.choices, default=Prestamo.Frecuencia.MENSUAL)
+    primera_cuota_fecha = serializers.DateField()
+
+class PagoLoteSerializer(serializers.Serializer):
+    """
+    Fila de conciliación masiva de pagos. Las reglas de saldo se validan al aplicar
+    (services.aplicar_pagos_lote), ya con las cuotas bloqueadas.
+    """
+    prestamo    = serializers.UUIDField()
+    fecha_pago  = serializers.DateField()
+    monto       = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal('0.01'))
+    metodo_pago = serializers.CharField(max_length=50, required=False, allow_blank=True, default='')
+    observacion = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
+    referencia  = serializers.CharField(max_length=100, required=False, allow_blank=True, default='')
+
 class PagoDetalleSerializer(serializers.ModelSerializer):
     class Meta:
         model = PagoDetalle
@@ -1,44 +1,67 @@
 # apps/cobros/services.py
+import logging
 from decimal import Decimal, ROUND_HALF_UP
 from datetime import date, timedelta
 from dateutil.relativedelta import relativedelta
 from django.db import transaction
-from .models import Prestamo, Cuota, Pago, PagoDetalle
+from .cache import invalidar_cartera
+from .metricas import APLICAR_PAGO_SEGUNDOS, CORRIDAS_ESTADOS, PAGOS_APLICADOS, TRANSICIONES_ESTADO
+from .models import Cliente, Cartera, CarteraMetricas, Interes, Prestamo, Cuota, Pago, PagoDetalle, ProcesoProgramado
 
-def _recalcular_saldos_prestamo(prestamo: Prestamo):
-    qs = prestamo.cuotas.all()
-    prestamo.saldo_capital = _r2(sum((c.saldo_capital for c in qs), Decimal(0)))
-    prestamo.saldo_interes = _r2(sum((c.saldo_interes for c in qs), Decimal(0)))
-    prestamo.save(update_fields=['saldo_capital', 'saldo_interes'])
+logger = logging.getLogger(__name__)
+
+PROCESO_ESTADOS = 'actualizar_estados'
+PROCESO_METRICAS = 'metricas_carteras'  # ultima_fecha = fecha de corte del interés devengado
+
+CAMPOS_PAGO_CUOTA = ['capital_pagado', 'interes_pagado', 'saldo_pendiente', 'estado']
+
+def marcar_mora(cuotas: list[Cuota], hoy: date) -> set[Cuota]:
+    """En memoria: pasa a MORA las cuotas abiertas vencidas. Devuelve las modificadas."""
+    cambiadas = set()
+    for c in cuotas:
+        if c.estado == Cuota.Estado.PENDIENTE and c.fecha_vencimiento < hoy:
+            c.estado = Cuota.Estado.MORA
+            cambiadas.add(c)
+    return cambiadas
+
+def calcular_saldos(prestamo: Prestamo, cuotas: list[Cuota]):
+    """En memoria: saldos y estado del préstamo a partir de TODAS sus cuotas."""
+    prestamo.saldo_capital = _r2(sum((c.saldo_capital for c in cuotas), Decimal(0)))
+    prestamo.saldo_interes = _r2(sum((c.saldo_interes for c in cuotas), Decimal(0)))
 
     if prestamo.saldo_capital == 0 and prestamo.saldo_interes == 0:
-        nuevo = Prestamo.Estado.PAGADO
+        prestamo.estado = Prestamo.Estado.PAGADO
     else:
         # si alguna cuota está en MORA → MORA, si no → PENDIENTE
-        nuevo = Prestamo.Estado.MORA if qs.filter(estado=Cuota.Estado.MORA).exists() else Prestamo.Estado.PENDIENTE
+        en_mora = any(c.estado == Cuota.Estado.MORA for c in cuotas)
+        prestamo.estado = Prestamo.Estado.MORA if en_mora else Prestamo.Estado.PENDIENTE
+
+def _fijar_saldos(prestamo: Prestamo, cuotas: list[Cuota]):
+    """calcular_saldos y los persiste con un único UPDATE."""
+    calcular_saldos(prestamo, cuotas)
+    Prestamo.objects.filter(pk=prestamo.pk).update(
+        saldo_capital=prestamo.saldo_capital,
+        saldo_interes=prestamo.saldo_interes,
+        estado=prestamo.estado,
+    )
+
+def _bloquear_cuotas(prestamo: Prestamo) -> list[Cuota]:
+    return list(Cuota.objects
+                .select_for_update()
+                .filter(prestamo_id=prestamo.pk)
+                .order_by('numero'))
 
-    if prestamo.estado != nuevo:
-        prestamo.estado = nuevo
-        prestamo.save(update_fields=['estado'])
+def _recalcular_saldos_prestamo(prestamo: Prestamo):
+    _fijar_saldos(prestamo, list(prestamo.cuotas.all()))
 
 def actualizar_estado_por_mora(prestamo: Prestamo, hoy: date | None = None):
     hoy = hoy or date.today()
-    cuotas = prestamo.cuotas.select_for_update()
-    hay_mora = False
-
-    for c in cuotas:
-        if c.estado != Cuota.Estado.PAGADA and c.fecha_vencimiento < hoy:
-            if c.estado != Cuota.Estado.MORA:
-                c.estado = Cuota.Estado.MORA
-                c.save(update_fields=['estado'])
-            hay_mora = True
 
-    if hay_mora:
-        prestamo.estado = Prestamo.Estado.MORA
-    else:
-        # recalculamos saldo y decidimos
-        _recalcular_saldos_prestamo(prestamo)
-    prestamo.save(update_fields=['estado'])
+    with transaction.atomic():
+        cuotas = _bloquear_cuotas(prestamo)
+        cambiadas = marcar_mora(cuotas, hoy)
+        Cuota.objects.bulk_update(cambiadas, fields=['estado'])
+        _fijar_saldos(prestamo, cuotas)
 
 def _r2(x):  # 2 decimales
     return Decimal(x).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
@@ -50,13 +73,13 @@ def _next_date(freq: str, d: date) -> date:
         return d + relativedelta(days=15)
     return d + relativedelta(months=1)  # mensual
 
-def generar_calendario(prestamo: Prestamo):
+def construir_cuotas(prestamo: Prestamo) -> list[Cuota]:
     """
+    Arma en memoria (sin guardar) las cuotas del calendario y deja en el préstamo
+    los saldos iniciales y el estado (PENDIENTE, o MORA si ya hay cuotas vencidas).
     Interés plano: interes_total = monto * tasa_decimal (sobre el total).
     Se reparte capital e interés por partes iguales (última cuota ajusta).
     """
-    prestamo.cuotas.all().delete()
-
     N = prestamo.cuotas_totales
     monto = Decimal(prestamo.monto)
     tasa  = Decimal(prestamo.interes.tasa_decimal)
@@ -70,138 +93,576 @@ def generar_calendario(prestamo: Prestamo):
     caps.append(_r2(monto - sum(caps, Decimal(0))))
     ints.append(_r2(interes_total - sum(ints, Decimal(0))))
 
+    cuotas = []
     fecha = prestamo.primera_cuota_fecha
+    for i in range(N):
+        cuotas.append(Cuota(
+            prestamo=prestamo,
+            numero=i + 1,
+            fecha_vencimiento=fecha,
+            capital_programado=caps[i],
+            interes_programado=ints[i],
+            saldo_pendiente=caps[i] + ints[i],
+        ))
+        fecha = _next_date(prestamo.frecuencia, fecha)
+
+    # Calendario recién generado: nada pagado. Las cuotas que ya vencieron (préstamo con
+    # fecha atrasada) nacen en MORA: el job diario solo revisa lo vencido desde su última corrida.
+    en_mora = marcar_mora(cuotas, date.today())
+    prestamo.saldo_capital = _r2(sum(caps, Decimal(0)))
+    prestamo.saldo_interes = _r2(sum(ints, Decimal(0)))
+    if prestamo.saldo_capital == 0 and prestamo.saldo_interes == 0:
+        prestamo.estado = Prestamo.Estado.PAGADO
+    elif en_mora:
+        prestamo.estado = Prestamo.Estado.MORA
+    else:
+        prestamo.estado = Prestamo.Estado.PENDIENTE
+    return cuotas
+
+def generar_calendario(prestamo: Prestamo):
+    """
+    Regenera el calendario del préstamo con un único bulk_create de cuotas.
+    """
+    with transaction.atomic():
+        borradas, _ = prestamo.cuotas.all().delete()
+
+        cuotas = construir_cuotas(prestamo)
+        Cuota.objects.bulk_create(cuotas)
+        prestamo.save(update_fields=['saldo_capital', 'saldo_interes', 'estado'])
+
+        if borradas:
+            # Regeneración (pudo borrar pagos aplicados): se recalcula la cartera
+            reconstruir_metricas([prestamo.cartera_id])
+        else:
+            _registrar_originacion([(prestamo, cuotas)])
+
+def crear_prestamos_lote(filas: list[dict]):
+    """
+    Originación masiva. `filas` son dicts ya validados (cliente_id, cartera_id, interes_id,
+    monto, cuotas_totales, frecuencia, primera_cuota_fecha).
+    Resuelve todas las referencias con una consulta por modelo y, si todas existen, inserta
+    préstamos y cuotas con bulk_create en una sola transacción (todo o nada).
+    Devuelve (prestamos, errores) donde errores = {indice_fila: {campo: [mensajes]}}.
+    """
+    clientes = Cliente.objects.in_bulk({f['cliente_id'] for f in filas})
+    carteras = Cartera.objects.in_bulk({f['cartera_id'] for f in filas})
+    intereses = Interes.objects.in_bulk({f['interes_id'] for f in filas})
+
+    errores = {}
+    for i, f in enumerate(filas):
+        err = {}
+        if f['cliente_id'] not in clientes:
+            err['cliente_id'] = ['Cliente no existe.']
+        if f['cartera_id'] not in carteras:
+            err['cartera_id'] = ['Cartera no existe.']
+        if f['interes_id'] not in intereses:
+            err['interes_id'] = ['Interés no existe.']
+        if err:
+            errores[i] = err
+    if errores:
+        return [], errores
+
+    prestamos, cuotas, originados = [], [], []
+    for f in filas:
+        prestamo = Prestamo(
+            cliente=clientes[f['cliente_id']],
+            cartera=carteras[f['cartera_id']],
+            interes=intereses[f['interes_id']],
+            monto=f['monto'],
+            cuotas_totales=f['cuotas_totales'],
+            frecuencia=f['frecuencia'],
+            primera_cuota_fecha=f['primera_cuota_fecha'],
+        )
+        calendario = construir_cuotas(prestamo)
+        cuotas.extend(calendario)
+        prestamos.append(prestamo)
+        originados.append((prestamo, calendario))
+
+    with transaction.atomic():
+        Prestamo.objects.bulk_create(prestamos, batch_size=500)
+        Cuota.objects.bulk_create(cuotas, batch_size=1000)
+        _registrar_originacion(originados)
+
+    return prestamos, {}
+
+def aplicar_cascada(pago: Pago, cuotas: list[Cuota], hoy: date) -> tuple[list[PagoDetalle], set[Cuota]]:
+    """
+    En memoria: reparte el monto del pago sobre las cuotas abiertas en orden
+    (interés y luego capital de cada cuota). `cuotas` debe venir ordenada por número.
+    El estado de las cuotas con saldo se decide con `hoy`, no con fecha_pago: un pago
+    fechado en el pasado no puede devolver a PENDIENTE una cuota que el job ya pasó a MORA.
+    Devuelve los PagoDetalle sin guardar y las cuotas modificadas.
+    """
+    monto = Decimal(pago.monto)
+    detalles, tocadas = [], set()
+
+    for c in cuotas:
+        if monto <= 0:
+            break
+        if c.estado not in (Cuota.Estado.PENDIENTE, Cuota.Estado.MORA):
+            continue
+
+        # 1) Interés de la cuota
+        a_int = min(monto, c.saldo_interes)
+        monto -= a_int
+
+        # 2) Capital de la cuota
+        a_cap = min(monto, c.saldo_capital)
+        monto -= a_cap
+
+        if a_int > 0 or a_cap > 0:
+            detalles.append(PagoDetalle(
+                pago=pago, cuota=c,
+                interes_aplicado=_r2(a_int),
+                capital_aplicado=_r2(a_cap),
+            ))
+
+            c.interes_pagado = _r2(c.interes_pagado + a_int)
+            c.capital_pagado = _r2(c.capital_pagado + a_cap)
+            c.saldo_pendiente = c.saldo_capital + c.saldo_interes
+
+            # estado de la cuota
+            if c.saldo_interes == 0 and c.saldo_capital == 0:
+                c.estado = Cuota.Estado.PAGADA
+            else:
+                # si sigue vencida: MORA; si no, PENDIENTE
+                c.estado = Cuota.Estado.MORA if c.fecha_vencimiento < hoy else Cuota.Estado.PENDIENTE
+            tocadas.add(c)
+
+    return detalles, tocadas
+
+def aplicar_pago(pago: Pago, hoy: date | None = None):
+    """
+    Aplica el pago en cascada sobre las cuotas. Todo se calcula en memoria y se persiste con
+    un bulk_update de cuotas, un bulk_create de PagoDetalle y un UPDATE del préstamo,
+    para mantener los bloqueos de fila el menor tiempo posible.
+    """
+    hoy = hoy or date.today()
+    prestamo = pago.prestamo
+
+    with APLICAR_PAGO_SEGUNDOS.medir(), transaction.atomic():
+        cuotas = _bloquear_cuotas(prestamo)
+
+        sucias = marcar_mora(cuotas, hoy)
+        detalles, tocadas = aplicar_cascada(pago, cuotas, hoy)
+        sucias |= tocadas
+
+        Cuota.objects.bulk_update(sucias, fields=CAMPOS_PAGO_CUOTA)
+        PagoDetalle.objects.bulk_create(detalles)
+        _fijar_saldos(prestamo, cuotas)
+        _sumar_metricas(prestamo.cartera_id, **_deltas_pago(detalles, _corte_metricas()))
+    PAGOS_APLICADOS.inc(origen='individual')
+
+def aplicar_pagos_lote(filas: list[dict], hoy: date | None = None) -> list[dict]:
+    """
+    Conciliación masiva de pagos. `filas` son dicts ya validados
+    (prestamo, fecha_pago, monto, metodo_pago, observacion, referencia).
+    Agrupa por préstamo y, por cada uno, en su propia transacción: bloquea cuotas una sola vez,
+    aplica los pagos en orden de fecha_pago y persiste todo con inserciones/updates masivos.
+    Una fila cuya `referencia` ya existe para el préstamo no se aplica de nuevo ('duplicado').
+    Si un préstamo falla, solo sus filas quedan en 'error' (su transacción se revierte) y el
+    resto del lote sigue: el resultado refleja exactamente lo que quedó guardado.
+    Devuelve un resultado por fila, en el orden de entrada.
+    """
+    hoy = hoy or date.today()
+    resultados: list[dict | None] = [None] * len(filas)
+
+    por_prestamo: dict = {}
+    for i, f in enumerate(filas):
+        por_prestamo.setdefault(f['prestamo'], []).append(i)
+
+    existentes = Prestamo.objects.in_bulk(list(por_prestamo))
+    corte = _corte_metricas()
 
+    for prestamo_id, indices in por_prestamo.items():
+        prestamo = existentes.get(prestamo_id)
+        if prestamo is None:
+            for i in indices:
+                resultados[i] = {'fila': i, 'estado': 'rechazado', 'errores': ['El préstamo no existe.']}
+            continue
+
+        # orden estable: fecha_pago y, a igual fecha, orden de llegada
+        indices.sort(key=lambda i: filas[i]['fecha_pago'])
+
+        try:
+            aplicados = _aplicar_pagos_prestamo(prestamo, filas, indices, resultados, hoy, corte)
+        except Exception:
+            logger.exception('Lote de pagos: falló el préstamo %s', prestamo_id,
+                             extra={'prestamo_id': str(prestamo_id), 'filas': indices})
+            for i in indices:
+                resultados[i] = {'fila': i, 'estado': 'error',
+                                 'errores': ['No se pudo aplicar (no se guardó nada de este préstamo). Reintente estas filas.']}
+            continue
+        PAGOS_APLICADOS.inc(aplicados, origen='lote')
+
+    return resultados
+
+def _aplicar_pagos_prestamo(prestamo, filas, indices, resultados, hoy, corte) -> int:
+    """Una transacción de aplicar_pagos_lote: los pagos de `indices` sobre un préstamo."""
     with transaction.atomic():
-        for i in range(N):
-            Cuota.objects.create(
+        cuotas = _bloquear_cuotas(prestamo)
+        # Con las cuotas bloqueadas: otra importación del mismo préstamo ya terminó o espera
+        referencias = dict(Pago.objects
+                           .filter(prestamo_id=prestamo.pk,
+                                   referencia__in={filas[i].get('referencia', '') for i in indices} - {''})
+                           .values_list('referencia', 'id'))
+        sucias = marcar_mora(cuotas, hoy)
+        pagos, detalles = [], []
+
+        for i in indices:
+            f = filas[i]
+            referencia = f.get('referencia', '')
+            if referencia and referencia in referencias:
+                resultados[i] = {'fila': i, 'estado': 'duplicado', 'id': str(referencias[referencia])}
+                continue
+
+            monto = Decimal(f['monto'])
+            saldo = sum((c.saldo_capital + c.saldo_interes for c in cuotas), Decimal(0))
+
+            if saldo <= 0:
+                error = 'El préstamo no tiene saldo pendiente. No se aceptan más pagos.'
+            elif monto > saldo:
+                error = f'El monto ({monto}) excede el saldo ({saldo}). Registre un pago por el saldo exacto.'
+            else:
+                error = None
+
+            if error:
+                resultados[i] = {'fila': i, 'estado': 'rechazado', 'errores': [error]}
+                continue
+
+            pago = Pago(
                 prestamo=prestamo,
-                numero=i + 1,
-                fecha_vencimiento=fecha,
-                capital_programado=caps[i],
-                interes_programado=ints[i],
+                fecha_pago=f['fecha_pago'],
+                monto=monto,
+                metodo_pago=f.get('metodo_pago', ''),
+                observacion=f.get('observacion', ''),
+                referencia=referencia,
             )
-            fecha = _next_date(prestamo.frecuencia, fecha)
+            dets, tocadas = aplicar_cascada(pago, cuotas, hoy)
+            pagos.append(pago)
+            detalles.extend(dets)
+            sucias |= tocadas
+            if referencia:
+                referencias[referencia] = pago.id  # repetida dentro del mismo lote
+            resultados[i] = {'fila': i, 'estado': 'aplicado', 'id': str(pago.id)}
 
-        _recalcular_saldos_prestamo(prestamo)
+        Pago.objects.bulk_create(pagos)
+        Cuota.objects.bulk_update(sucias, fields=CAMPOS_PAGO_CUOTA)
+        PagoDetalle.objects.bulk_create(detalles)
+        _fijar_saldos(prestamo, cuotas)
+        _sumar_metricas(prestamo.cartera_id, **_deltas_pago(detalles, corte))
+    return len(pagos)
 
-def aplicar_pago(pago: Pago):
-    prestamo = pago.prestamo
-    monto = Decimal(pago.monto)
+def _agregar_metricas(cartera_ids, corte: date) -> dict:
+    """
+    Recalcula desde cero los componentes de CarteraMetricas con agregados agrupados
+    por cartera (número constante de consultas). El interés devengado es el de las cuotas
+    vencidas hasta `corte`.
+    """
+    from django.db.models import Count, F, Q, Sum
+
+    cartera_ids = list(cartera_ids)
+    cero = Decimal(0)
+
+    # Programado por cartera (total y vencido hasta el corte)
+    programado = {
+        r['prestamo__cartera_id']: r for r in (
+            Cuota.objects
+            .filter(prestamo__cartera_id__in=cartera_ids)
+            .values('prestamo__cartera_id')
+            .annotate(
+                capital=Sum('capital_programado'),
+                interes=Sum('interes_programado'),
+                interes_vencido=Sum('interes_programado', filter=Q(fecha_vencimiento__lte=corte)),
+            )
+            .order_by()
+        )
+    }
 
+    # Aplicado por cartera (total cobrado, y lo aplicado a cuotas vencidas)
+    aplicado = {
+        r['cuota__prestamo__cartera_id']: r for r in (
+            PagoDetalle.objects
+            .filter(cuota__prestamo__cartera_id__in=cartera_ids)
+            .values('cuota__prestamo__cartera_id')
+            .annotate(
+                cobrado=Sum(F('capital_aplicado') + F('interes_aplicado')),
+                capital=Sum('capital_aplicado'),
+                interes=Sum('interes_aplicado'),
+                interes_vencido=Sum('interes_aplicado', filter=Q(cuota__fecha_vencimiento__lte=corte)),
+            )
+            .order_by()
+        )
+    }
+
+    clientes = dict(
+        Prestamo.objects
+        .filter(cartera_id__in=cartera_ids, cliente__activo=True)
+        .values('cartera_id')
+        .annotate(n=Count('cliente_id', distinct=True))
+        .order_by()
+        .values_list('cartera_id', 'n')
+    )
+
+    componentes = {}
+    for cid in cartera_ids:
+        prog = programado.get(cid, {})
+        apl = aplicado.get(cid, {})
+        componentes[cid] = {
+            'dinero_disponible': _r2(apl.get('cobrado') or cero),
+            'capital_pendiente': _r2((prog.get('capital') or cero) - (apl.get('capital') or cero)),
+            'interes_pendiente': _r2((prog.get('interes') or cero) - (apl.get('interes') or cero)),
+            'interes_devengado': _r2((prog.get('interes_vencido') or cero) - (apl.get('interes_vencido') or cero)),
+            'clientes_activos': clientes.get(cid, 0),
+        }
+    return componentes
+
+def _corte_metricas() -> date:
+    corte = (ProcesoProgramado.objects
+             .filter(nombre=PROCESO_METRICAS)
+             .values_list('ultima_fecha', flat=True)
+             .first())
+    return corte or date.today()
+
+def reconstruir_metricas(cartera_ids=None, invalidar=True) -> int:
+    """
+    Reparación: recalcula CarteraMetricas desde Cuota/PagoDetalle para las carteras dadas
+    (todas si None). Devuelve cuántas filas escribió.
+    `invalidar=False` para el dashboard, que construye la fila al leer y cachea el bloque
+    recién calculado (invalidarlo al confirmar tiraría ese mismo bloque).
+    """
     with transaction.atomic():
-        actualizar_estado_por_mora(prestamo)
+        proceso, _ = (ProcesoProgramado.objects
+                      .select_for_update()
+                      .get_or_create(nombre=PROCESO_METRICAS))
+        if proceso.ultima_fecha is None:
+            proceso.ultima_fecha = date.today()
+            proceso.save(update_fields=['ultima_fecha', 'actualizado'])
 
-        cuotas = (prestamo.cuotas
-                  .select_for_update()
-                  .filter(estado__in=[Cuota.Estado.PENDIENTE, Cuota.Estado.MORA])
-                  .order_by('numero'))
+        if cartera_ids is None:
+            cartera_ids = Cartera.objects.values_list('id', flat=True)
+        componentes = _agregar_metricas(cartera_ids, proceso.ultima_fecha)
 
-        for c in cuotas:
-            if monto <= 0:
-                break
+        CarteraMetricas.objects.filter(cartera_id__in=list(componentes)).delete()
+        CarteraMetricas.objects.bulk_create(
+            [CarteraMetricas(cartera_id=cid, **vals) for cid, vals in componentes.items()]
+        )
+        if invalidar:
+            _invalidar_al_confirmar(list(componentes))
+    return len(componentes)
 
-            # 1) Interés de la cuota
-            a_int = min(monto, c.saldo_interes)
-            monto -= a_int
+def _invalidar_al_confirmar(cartera_ids):
+    """Invalida la caché del dashboard de esas carteras cuando la transacción confirme."""
+    def invalidar():
+        for cid in cartera_ids:
+            invalidar_cartera(cid)
+    transaction.on_commit(invalidar)
 
-            # 2) Capital de la cuota
-            a_cap = min(monto, c.saldo_capital)
-            monto -= a_cap
+def _sumar_metricas(cartera_id, **deltas):
+    """Aplica deltas (UPDATE ... SET x = x + d) a la fila de métricas; si no existe, la reconstruye."""
+    from django.db.models import F
 
-            if a_int > 0 or a_cap > 0:
-                PagoDetalle.objects.create(
-                    pago=pago, cuota=c,
-                    interes_aplicado=_r2(a_int),
-                    capital_aplicado=_r2(a_cap),
-                )
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    actualizadas = (CarteraMetricas.objects
+                    .filter(cartera_id=cartera_id)
+                    .update(**{k: F(k) + v for k, v in deltas.items()}))
+    if not actualizadas:
+        reconstruir_metricas([cartera_id])
+    else:
+        _invalidar_al_confirmar([cartera_id])
+
+def _deltas_calendario(cuotas: list[Cuota], corte: date) -> dict:
+    """Deltas de métricas por un calendario nuevo (todavía sin pagos)."""
+    return {
+        'capital_pendiente': sum((c.capital_programado for c in cuotas), Decimal(0)),
+        'interes_pendiente': sum((c.interes_programado for c in cuotas), Decimal(0)),
+        'interes_devengado': sum((c.interes_programado for c in cuotas if c.fecha_vencimiento <= corte), Decimal(0)),
+    }
 
-                c.interes_pagado = _r2(c.interes_pagado + a_int)
-                c.capital_pagado = _r2(c.capital_pagado + a_cap)
+def _deltas_pago(detalles: list[PagoDetalle], corte: date) -> dict:
+    """Deltas de métricas por lo aplicado en un pago."""
+    capital = sum((d.capital_aplicado for d in detalles), Decimal(0))
+    interes = sum((d.interes_aplicado for d in detalles), Decimal(0))
+    return {
+        'dinero_disponible': capital + interes,
+        'capital_pendiente': -capital,
+        'interes_pendiente': -interes,
+        'interes_devengado': -sum((d.interes_aplicado for d in detalles if d.cuota.fecha_vencimiento <= corte), Decimal(0)),
+    }
 
-                # estado de la cuota
-                if c.saldo_interes == 0 and c.saldo_capital == 0:
-                    c.estado = Cuota.Estado.PAGADA
-                else:
-                    # si sigue vencida: MORA; si no, PENDIENTE
-                    c.estado = Cuota.Estado.MORA if c.fecha_vencimiento < pago.fecha_pago else Cuota.Estado.PENDIENTE
-                c.save()
+def _registrar_originacion(originados: list[tuple[Prestamo, list[Cuota]]]):
+    """Deltas de métricas por préstamos nuevos (ya insertados), agrupados por cartera."""
+    corte = _corte_metricas()
+    nuevos = [p.pk for p, _ in originados]
+    # Mismo predicado que _agregar_metricas: solo cuentan clientes activos
+    activos = set(Cliente.objects
+                  .filter(pk__in={p.cliente_id for p, _ in originados}, activo=True)
+                  .values_list('pk', flat=True))
+    # Pares (cartera, cliente) que ya tenían préstamo: no suman clientes activos
+    existentes = set(
+        Prestamo.objects
+        .filter(cartera_id__in={p.cartera_id for p, _ in originados},
+                cliente_id__in={p.cliente_id for p, _ in originados})
+        .exclude(pk__in=nuevos)
+        .values_list('cartera_id', 'cliente_id')
+    )
 
-        _recalcular_saldos_prestamo(prestamo)
+    por_cartera: dict = {}
+    for prestamo, cuotas in originados:
+        deltas = por_cartera.setdefault(prestamo.cartera_id, {'clientes_activos': 0})
+        for campo, valor in _deltas_calendario(cuotas, corte).items():
+            deltas[campo] = deltas.get(campo, Decimal(0)) + valor
+        par = (prestamo.cartera_id, prestamo.cliente_id)
+        if prestamo.cliente_id in activos and par not in existentes:
+            existentes.add(par)
+            deltas['clientes_activos'] += 1
 
-def actualizar_estados_cuotas():
+    for cartera_id, deltas in por_cartera.items():
+        _sumar_metricas(cartera_id, **deltas)
+
+def devengar_metricas(hoy: date | None = None) -> int:
     """
-    Actualiza los estados de las cuotas individuales basándose en fechas de vencimiento
+    Job diario: mueve la fecha de corte hasta `hoy` sumando al interés devengado de cada
+    cartera el interés pendiente de las cuotas que vencieron en la ventana (corte, hoy].
+    """
+    from django.db.models import F, Sum
+
+    hoy = hoy or date.today()
+    with transaction.atomic():
+        proceso, _ = (ProcesoProgramado.objects
+                      .select_for_update()
+                      .get_or_create(nombre=PROCESO_METRICAS))
+        desde = proceso.ultima_fecha
+        if desde is None:
+            # Nunca se materializó: se construye completo con corte = hoy
+            return reconstruir_metricas()
+        if desde >= hoy:
+            return 0
+
+        # El corte avanza primero: una fila faltante se reconstruye ya con corte = hoy
+        proceso.ultima_fecha = hoy
+        proceso.save(update_fields=['ultima_fecha', 'actualizado'])
+
+        ventana = list(Cuota.objects
+                       .filter(fecha_vencimiento__gt=desde, fecha_vencimiento__lte=hoy)
+                       .values('prestamo__cartera_id')
+                       .annotate(devengado=Sum(F('interes_programado') - F('interes_pagado')))
+                       .order_by())
+        for r in ventana:
+            _sumar_metricas(r['prestamo__cartera_id'], interes_devengado=r['devengado'])
+    return len(ventana)
+
+def actualizar_estados_cuotas(hoy: date | None = None, desde: date | None = None) -> int:
+    """
+    Pasa a MORA las cuotas PENDIENTE con saldo que vencieron antes de `hoy`.
+    Con `desde` (la última fecha procesada) solo mira la ventana [desde, hoy) usando
+    idx_cuota_venc_estado; lo anterior ya se procesó en corridas previas.
+    Devuelve la cantidad de cuotas actualizadas.
+    """
+    hoy = hoy or date.today()
+
+    vencidas = Cuota.objects.filter(fecha_vencimiento__lt=hoy, estado=Cuota.Estado.PENDIENTE,
+                                    saldo_pendiente__gt=0)
+    if desde is not None:
+        vencidas = vencidas.filter(fecha_vencimiento__gte=desde)
+
+    return vencidas.update(estado=Cuota.Estado.MORA)
+
+def reparar_estados_cuotas(hoy: date | None = None):
+    """
+    Reparación explícita (comando reparar_estados): recorre toda la tabla de cuotas.
+    - MORA para cualquier cuota vencida con saldo que haya quedado PENDIENTE.
+    - PAGADA para cuotas abiertas sin saldo (aplicar_pago ya las deja así; solo corrige
+      datos cargados o editados por fuera de los servicios).
+    Devuelve (mora, pagadas).
     """
-    from .models import Cuota
     from django.db.models import F
-    
-    # Cuotas que deben estar en MORA (vencidas y no pagadas completamente)
-    cuotas_para_mora = Cuota.objects.filter(
-        fecha_vencimiento__lt=date.today(),
-        estado=Cuota.Estado.PENDIENTE
-    ).annotate(
-        saldo_total=F('capital_programado') + F('interes_programado') - F('capital_pagado') - F('interes_pagado')
-    ).filter(saldo_total__gt=0)
-    
-    count_mora = cuotas_para_mora.update(estado=Cuota.Estado.MORA)
-    print(f"✅ Actualizadas {count_mora} cuotas a MORA")
-    
-    # Cuotas que deben estar PAGADAS (sin saldo pendiente)
-    cuotas_para_pagadas = Cuota.objects.filter(
-        estado__in=[Cuota.Estado.PENDIENTE, Cuota.Estado.MORA]
-    ).annotate(
-        saldo_total=F('capital_programado') + F('interes_programado') - F('capital_pagado') - F('interes_pagado')
-    ).filter(saldo_total=0)
-    
-    count_pagadas = cuotas_para_pagadas.update(estado=Cuota.Estado.PAGADA)
-    print(f"✅ Actualizadas {count_pagadas} cuotas a PAGADA")
-    
+    with transaction.atomic():
+        # Primero la columna desnormalizada, por si se editaron montos con UPDATE directo
+        (Cuota.objects
+         .exclude(saldo_pendiente=F('capital_programado') + F('interes_programado') - F('capital_pagado') - F('interes_pagado'))
+         .update(saldo_pendiente=F('capital_programado') + F('interes_programado') - F('capital_pagado') - F('interes_pagado')))
+        count_mora = actualizar_estados_cuotas(hoy)
+        count_pagadas = (Cuota.objects
+                         .filter(estado__in=[Cuota.Estado.PENDIENTE, Cuota.Estado.MORA], saldo_pendiente=0)
+                         .update(estado=Cuota.Estado.PAGADA))
     return count_mora, count_pagadas
 
 def actualizar_estados_prestamos():
     """
-    Actualiza automáticamente los estados de los préstamos basándose en el estado de sus cuotas
+    Actualiza automáticamente los estados de los préstamos basándose en el estado de sus cuotas.
+    Set-based: dos UPDATE ... WHERE [NOT] EXISTS(...) sobre todos los préstamos activos,
+    sin iterar préstamo por préstamo.
     """
     from .models import Prestamo, Cuota
-    from django.db.models import F
-    
-    count_mora = 0
-    count_pagados = 0
-    
-    # Obtener todos los préstamos que no están en estado final
-    prestamos_activos = Prestamo.objects.filter(
-        estado__in=[Prestamo.Estado.PENDIENTE, Prestamo.Estado.MORA]
-    ).prefetch_related('cuotas')
-    
-    for prestamo in prestamos_activos:
-        # Verificar si tiene cuotas en mora
-        tiene_cuotas_mora = prestamo.cuotas.filter(
-            estado=Cuota.Estado.MORA
-        ).exists()
-        
-        # Verificar si todas las cuotas están pagadas
-        cuotas_pendientes = prestamo.cuotas.filter(
-            estado__in=[Cuota.Estado.PENDIENTE, Cuota.Estado.MORA]
-        ).annotate(
-            saldo_total=F('capital_programado') + F('interes_programado') - F('capital_pagado') - F('interes_pagado')
-        ).filter(saldo_total__gt=0)
-        
-        # Actualizar estado según corresponda
-        if not cuotas_pendientes.exists():
-            # Todas las cuotas están pagadas
-            if prestamo.estado != Prestamo.Estado.PAGADO:
-                prestamo.estado = Prestamo.Estado.PAGADO
-                prestamo.save(update_fields=['estado'])
-                count_pagados += 1
-                print(f"✅ Préstamo {prestamo.id} actualizado a PAGADO")
-                
-        elif tiene_cuotas_mora and prestamo.estado != Prestamo.Estado.MORA:
-            # Tiene cuotas en mora
-            prestamo.estado = Prestamo.Estado.MORA
-            prestamo.save(update_fields=['estado'])
-            count_mora += 1
-            print(f"⚠️  Préstamo {prestamo.id} actualizado a MORA")
-    
-    print(f"📊 Resumen: {count_mora} préstamos a MORA, {count_pagados} préstamos PAGADOS")
+    from django.db.models import Exists, OuterRef
+
+    activos = [Prestamo.Estado.PENDIENTE, Prestamo.Estado.MORA]
+
+    cuotas_con_saldo = Cuota.objects.filter(
+        prestamo=OuterRef('pk'),
+        estado__in=[Cuota.Estado.PENDIENTE, Cuota.Estado.MORA],
+        saldo_pendiente__gt=0,
+    )
+
+    cuotas_en_mora = Cuota.objects.filter(
+        prestamo=OuterRef('pk'),
+        estado=Cuota.Estado.MORA
+    )
+
+    with transaction.atomic():
+        # 1) Sin cuotas con saldo → PAGADO
+        count_pagados = (Prestamo.objects
+                         .filter(estado__in=activos)
+                         .filter(~Exists(cuotas_con_saldo))
+                         .update(estado=Prestamo.Estado.PAGADO))
+
+        # 2) Con saldo y alguna cuota en MORA → MORA (los PAGADO ya salieron del filtro)
+        count_mora = (Prestamo.objects
+                      .filter(estado=Prestamo.Estado.PENDIENTE)
+                      .filter(Exists(cuotas_en_mora))
+                      .update(estado=Prestamo.Estado.MORA))
+
+    logger.info('Estados de préstamos: %s a MORA, %s PAGADOS', count_mora, count_pagados,
+                extra={'prestamos_mora': count_mora, 'prestamos_pagados': count_pagados})
     return count_mora, count_pagados
+
+
+def ejecutar_actualizacion_estados(hoy: date | None = None, forzar: bool = False):
+    """
+    Job periódico de transiciones de estado (cuotas → MORA, préstamos → MORA/PAGADO).
+    Usa la marca de agua de ProcesoProgramado: si el día ya fue procesado no hace nada
+    (salvo forzar=True). Devuelve None si se omitió, o un dict con los conteos.
+    """
+    hoy = hoy or date.today()
+
+    with transaction.atomic():
+        proceso, _ = (ProcesoProgramado.objects
+                      .select_for_update()
+                      .get_or_create(nombre=PROCESO_ESTADOS))
+
+        if not forzar and proceso.ultima_fecha and proceso.ultima_fecha >= hoy:
+            CORRIDAS_ESTADOS.inc(resultado='omitida')
+            return None
+
+        # Solo las cuotas que vencieron desde la última corrida (sin marca o forzado: tabla completa)
+        cuotas_mora = actualizar_estados_cuotas(hoy, desde=None if forzar else proceso.ultima_fecha)
+        prestamos_mora, prestamos_pagados = actualizar_estados_prestamos()
+        carteras_devengadas = devengar_metricas(hoy)
+
+        proceso.ultima_fecha = hoy
+        proceso.save(update_fields=['ultima_fecha', 'actualizado'])
+
+    CORRIDAS_ESTADOS.inc(resultado='ejecutada')
+    TRANSICIONES_ESTADO.inc(cuotas_mora, entidad='cuota', estado='mora')
+    TRANSICIONES_ESTADO.inc(prestamos_mora, entidad='prestamo', estado='mora')
+    TRANSICIONES_ESTADO.inc(prestamos_pagados, entidad='prestamo', estado='pagado')
+    return {
+        'fecha': hoy,
+        'cuotas_mora': cuotas_mora,
+        'prestamos_mora': prestamos_mora,
+        'prestamos_pagados': prestamos_pagados,
+        'carteras_devengadas': carteras_devengadas,
+    }
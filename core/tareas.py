@@ -0,0 +1,51 @@
+# core/tareas.py
+"""
+Ejecución en segundo plano dentro del mismo proceso (pool de hilos).
+
+Sirve para trabajo de E/S que no debe bloquear la respuesta (p.ej. subir fotos a
+Cloudinary). No hay cola persistente: si el proceso se reinicia, lo que quedó a medias
+se recupera con su comando de reproceso (ver procesar_fotos_pendientes).
+Con TAREAS_SINCRONAS=True las tareas corren en línea (tests, scripts).
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=settings.TAREAS_WORKERS,
+                                           thread_name_prefix='avanza-tarea')
+    return _pool
+
+
+def _ejecutar(fn, *args):
+    try:
+        fn(*args)
+    except Exception:
+        logger.exception('Tarea %s%s falló', fn.__name__, args, extra={'tarea': fn.__name__})
+    finally:
+        connection.close()  # cada hilo abre su propia conexión
+
+
+def encolar(fn, *args):
+    """Ejecuta fn(*args) en el pool (o en línea con TAREAS_SINCRONAS)."""
+    if settings.TAREAS_SINCRONAS:
+        return fn(*args)
+    return _executor().submit(_ejecutar, fn, *args)
+
+
+def encolar_al_confirmar(fn, *args):
+    """Encola cuando la transacción actual confirma (la tarea ve los datos ya guardados)."""
+    transaction.on_commit(lambda: encolar(fn, *args))
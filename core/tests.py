@@ -1,3 +1,1031 @@
-from django.test import TestCase
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import services
+from .cache import estadisticas
+from .imagenes import subir_fotos_pendientes
+from .logs import FiltroMuestreo, FormatoJSON, ManejadorEnCola, parsear_pares
+from .media import desalojar, servir_remoto
+from .models import (Cartera, CarteraMetricas, CarteraMiembro, Cliente, Cuota, Interes, Pago, Prestamo,
+                     ProcesoProgramado)
+from .semillas import sembrar_libro
+from .serializers import ClienteSerializer
+from .services import (aplicar_pago, ejecutar_actualizacion_estados, generar_calendario, reconstruir_metricas,
+                       reparar_estados_cuotas)
+
+User = get_user_model()
+
+
+class DatosBaseMixin:
+    """Usuario miembro de una cartera con un préstamo ya originado."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='cobrador', password='x')
+        self.cartera = Cartera.objects.create(nombre='Centro')
+        CarteraMiembro.objects.create(cartera=self.cartera, usuario=self.user,
+                                      rol=CarteraMiembro.RolEnCartera.OPERADOR)
+        self.interes = Interes.objects.create(nombre='20%', tasa_decimal=Decimal('0.20'))
+        self.cliente = Cliente.objects.create(nombre='Ana', identificacion='100')
+        self.prestamo = self.crear_prestamo(self.cliente)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def crear_prestamo(self, cliente, monto='1000', cuotas=4, primera=None):
+        prestamo = Prestamo.objects.create(
+            cliente=cliente, cartera=self.cartera, interes=self.interes,
+            monto=Decimal(monto), cuotas_totales=cuotas,
+            frecuencia=Prestamo.Frecuencia.SEMANAL,
+            primera_cuota_fecha=primera or date.today() + timedelta(days=7),
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            generar_calendario(prestamo)
+        return prestamo
+
+    def metricas(self):
+        return CarteraMetricas.objects.filter(cartera=self.cartera).values(
+            'dinero_disponible', 'capital_pendiente', 'interes_pendiente', 'interes_devengado',
+            'clientes_activos').get()
+
+
+class DashboardCacheTests(DatosBaseMixin, TestCase):
+
+    def test_segunda_lectura_sale_de_cache(self):
+        self.client.get('/api/dashboard/')
+        with self.assertNumQueries(1):  # solo las asignaciones del usuario
+            resp = self.client.get('/api/dashboard/')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['carteras'][0]['metricas']['saldo_contractual_pendiente'], 1200.0)
+        self.assertEqual(estadisticas()['hits'], 1)
+        self.assertEqual(estadisticas()['misses'], 1)
+
+    def test_consultas_constantes_con_mas_carteras(self):
+        def medir():
+            cache.clear()
+            with self.assertNumQueries(2):  # asignaciones + métricas materializadas (in_bulk)
+                self.assertEqual(self.client.get('/api/dashboard/').status_code, 200)
+            # savepoint + proceso (FOR UPDATE) + carteras + 3 agregados agrupados + delete + insert + release
+            with self.assertNumQueries(9):
+                reconstruir_metricas()
+
+        medir()  # 1 cartera
+        for i in range(3):
+            cartera = Cartera.objects.create(nombre=f'Zona {i}')
+            CarteraMiembro.objects.create(cartera=cartera, usuario=self.user, rol=CarteraMiembro.RolEnCartera.OPERADOR)
+            prestamo = self.crear_prestamo(Cliente.objects.create(nombre=f'C{i}', identificacion=f'40{i}'))
+            Prestamo.objects.filter(pk=prestamo.pk).update(cartera=cartera)
+        reconstruir_metricas()
+
+        medir()  # 4 carteras
+        self.assertEqual(len(self.client.get('/api/dashboard/').data['carteras']), 4)
+
+    def test_metricas_construidas_al_leer_quedan_en_cache(self):
+        CarteraMetricas.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get('/api/dashboard/')
+
+        with self.assertNumQueries(1):
+            resp = self.client.get('/api/dashboard/')
+        self.assertEqual(resp.data['carteras'][0]['metricas']['saldo_contractual_pendiente'], 1200.0)
+        self.assertEqual(estadisticas()['hits'], 1)
+
+    def test_pago_invalida_la_cartera(self):
+        self.client.get('/api/dashboard/')
+
+        pago = Pago.objects.create(prestamo=self.prestamo, fecha_pago=date.today(), monto=Decimal('300'))
+        with self.captureOnCommitCallbacks(execute=True):
+            aplicar_pago(pago)
+
+        metricas = self.client.get('/api/dashboard/').data['carteras'][0]['metricas']
+        self.assertEqual(metricas['dinero_disponible'], 300.0)
+        self.assertEqual(metricas['saldo_contractual_pendiente'], 900.0)
+        self.assertEqual(estadisticas()['misses'], 2)
+
+    def test_borrar_pago_corrige_el_dashboard(self):
+        pago = Pago.objects.create(prestamo=self.prestamo, fecha_pago=date.today(), monto=Decimal('300'))
+        with self.captureOnCommitCallbacks(execute=True):
+            aplicar_pago(pago)
+        self.assertEqual(self.client.get('/api/dashboard/').data['carteras'][0]['metricas']['dinero_disponible'], 300.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.delete(f'/api/pagos/{pago.pk}/')
+
+        self.assertEqual(resp.status_code, 204)
+        metricas = self.client.get('/api/dashboard/').data['carteras'][0]['metricas']
+        self.assertEqual(metricas['dinero_disponible'], 0.0)
+        self.assertEqual(metricas['saldo_contractual_pendiente'], 1200.0)
+
+
+class AplicarPagoQueriesTests(DatosBaseMixin, TestCase):
+
+    def test_consultas_constantes_sin_importar_las_cuotas(self):
+        otro = self.crear_prestamo(Cliente.objects.create(nombre='Beto', identificacion='200'), cuotas=12)
+        for prestamo, monto in ((self.prestamo, '100'), (otro, '1000')):  # 1 cuota vs. 10 cuotas
+            pago = Pago.objects.create(prestamo=prestamo, fecha_pago=date.today(), monto=Decimal(monto))
+            # savepoint + cuotas (FOR UPDATE) + bulk_update + detalles + préstamo + corte + métricas + release
+            with self.assertNumQueries(8):
+                aplicar_pago(pago)
+        self.assertEqual(otro.cuotas.filter(aplicaciones__isnull=False).distinct().count(), 10)
+
+
+class GenerarCalendarioTests(DatosBaseMixin, TestCase):
+
+    def test_un_solo_insert_con_saldos(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        prestamo = Prestamo.objects.create(
+            cliente=self.cliente, cartera=self.cartera, interes=self.interes, monto=Decimal('1200'),
+            cuotas_totales=12, frecuencia=Prestamo.Frecuencia.SEMANAL,
+            primera_cuota_fecha=date.today() + timedelta(days=7))
+        with CaptureQueriesContext(connection) as q, self.captureOnCommitCallbacks(execute=True):
+            generar_calendario(prestamo)
+
+        inserts = [c['sql'] for c in q.captured_queries if c['sql'].startswith('INSERT INTO "cuotas"')]
+        self.assertEqual(len(inserts), 1)
+        cuotas = list(prestamo.cuotas.order_by('numero'))
+        self.assertEqual([c.numero for c in cuotas], list(range(1, 13)))
+        self.assertTrue(all((c.capital_programado, c.interes_programado, c.saldo_pendiente)
+                            == (Decimal('100'), Decimal('20'), Decimal('120')) for c in cuotas))
+        self.assertEqual(cuotas[1].fecha_vencimiento - cuotas[0].fecha_vencimiento, timedelta(days=7))
+
+        prestamo.refresh_from_db()
+        self.assertEqual((prestamo.saldo_capital, prestamo.saldo_interes), (Decimal('1200'), Decimal('240')))
+        self.assertEqual(prestamo.estado, Prestamo.Estado.PENDIENTE)
+
+
+class MetricasIncrementalesTests(DatosBaseMixin, TestCase):
+
+    def test_originacion_y_pagos_igual_a_reconstruir(self):
+        inactivo = Cliente.objects.create(nombre='Beto', identificacion='200')
+        Cliente.objects.filter(pk=inactivo.pk).update(activo=False)
+        self.crear_prestamo(inactivo, primera=date.today() - timedelta(days=8))
+
+        pago = Pago.objects.create(prestamo=self.prestamo, fecha_pago=date.today(), monto=Decimal('450'))
+        with self.captureOnCommitCallbacks(execute=True):
+            aplicar_pago(pago)
+
+        incremental = self.metricas()
+        self.assertEqual(incremental['clientes_activos'], 1)
+        reconstruir_metricas([self.cartera.pk])
+        self.assertEqual(self.metricas(), incremental)
+
+
+class PrestamoListQueriesTests(DatosBaseMixin, TestCase):
+
+    URL_EXPANDIDA = '/api/prestamos/?expand=cuotas,cliente,cartera'
+
+    def test_listado_no_crece_con_la_cantidad_de_prestamos(self):
+        # préstamo + cuotas (prefetch) + miembros de la cartera (prefetch)
+        with self.assertNumQueries(3):
+            resp = self.client.get(self.URL_EXPANDIDA)
+        self.assertEqual(len(resp.data['results']), 1)
+
+        otro = User.objects.create_user(username='gestor', password='x')
+        CarteraMiembro.objects.create(cartera=self.cartera, usuario=otro)
+        for i in range(5):
+            cliente = Cliente.objects.create(nombre=f'Cliente {i}', identificacion=f'20{i}')
+            self.crear_prestamo(cliente)
+
+        with self.assertNumQueries(3):
+            resp = self.client.get(self.URL_EXPANDIDA)
+        self.assertEqual(len(resp.data['results']), 6)
+        self.assertEqual(len(resp.data['results'][0]['cuotas']), 4)
+        self.assertEqual(len(resp.data['results'][0]['cartera']['miembros']), 2)
+
+    def test_listado_compacto_por_defecto(self):
+        with self.assertNumQueries(1):
+            resp = self.client.get('/api/prestamos/')
+
+        fila = resp.data['results'][0]
+        self.assertNotIn('cuotas', fila)
+        self.assertNotIn('cliente', fila)
+        self.assertEqual(fila['cliente_nombre'], 'Ana')
+        self.assertEqual(fila['proxima_cuota_fecha'], (date.today() + timedelta(days=7)).isoformat())
+
+
+class PrestamosLoteTests(DatosBaseMixin, TestCase):
+
+    URL = '/api/prestamos/bulk/'
+
+    def fila(self, **cambios):
+        return {'cliente_id': str(self.cliente.pk), 'cartera_id': str(self.cartera.pk),
+                'interes_id': str(self.interes.pk), 'monto': '500', 'cuotas_totales': 5,
+                'frecuencia': 'semanal', 'primera_cuota_fecha': (date.today() + timedelta(days=7)).isoformat(),
+                **cambios}
+
+    def test_crea_prestamos_cuotas_y_metricas(self):
+        otro = Cliente.objects.create(nombre='Beto', identificacion='200')
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(self.URL, {'prestamos': [self.fila(), self.fila(cliente_id=str(otro.pk),
+                                                                                   cuotas_totales=3)]},
+                                    format='json')
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual([p['fila'] for p in resp.data['prestamos']], [0, 1])
+        ids = [p['id'] for p in resp.data['prestamos']]
+        self.assertEqual(Cuota.objects.filter(prestamo_id__in=ids).count(), 8)
+
+        incremental = self.metricas()
+        self.assertEqual(incremental['capital_pendiente'], Decimal('2000'))
+        self.assertEqual(incremental['clientes_activos'], 2)
+        reconstruir_metricas([self.cartera.pk])
+        self.assertEqual(self.metricas(), incremental)
+
+    def test_todo_o_nada_con_errores_por_fila(self):
+        resp = self.client.post(self.URL, [self.fila(), self.fila(monto='0'), self.fila(frecuencia='diaria')],
+                                format='json')
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.data['creados'], 0)
+        self.assertEqual([e['fila'] for e in resp.data['errores']], [1, 2])
+        self.assertIn('monto', resp.data['errores'][0]['errores'])
+        self.assertEqual(Prestamo.objects.count(), 1)
+
+    def test_referencias_inexistentes(self):
+        ajena = str(uuid.uuid4())
+        resp = self.client.post(self.URL, [self.fila(), self.fila(cliente_id=ajena, cartera_id=ajena)],
+                                format='json')
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.data['errores'], [{'fila': 1, 'errores': {'cliente_id': ['Cliente no existe.'],
+                                                                       'cartera_id': ['Cartera no existe.']}}])
+        self.assertEqual(Prestamo.objects.count(), 1)
+        self.assertEqual(Cuota.objects.count(), 4)
+
+
+class PagosLoteTests(DatosBaseMixin, TestCase):
+
+    URL = '/api/pagos/bulk/'
+
+    def fila(self, prestamo=None, dias=0, prestamo_id=None, **cambios):
+        return {'prestamo': prestamo_id or str((prestamo or self.prestamo).pk), 'monto': '100',
+                'fecha_pago': (date.today() - timedelta(days=dias)).isoformat(), **cambios}
+
+    def enviar(self, filas):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.URL, filas, format='json')
+
+    def test_orden_por_fecha_dentro_del_prestamo(self):
+        # Saldo 1200: aplicado primero el pago de ayer, el de hoy ya excede el saldo
+        resp = self.enviar([self.fila(monto='1200'), self.fila(dias=1)])
+
+        self.assertEqual([r['estado'] for r in resp.data['resultados']], ['rechazado', 'aplicado'])
+        self.assertIn('excede el saldo (1100', resp.data['resultados'][0]['errores'][0])
+
+    def test_rechazo_por_fila_y_forma_del_resultado(self):
+        resp = self.enviar({'pagos': [self.fila(), self.fila(prestamo_id=str(uuid.uuid4())), self.fila(monto='x')]})
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual((resp.data['aplicados'], resp.data['duplicados'], resp.data['rechazados']), (1, 0, 2))
+        aplicado, sin_prestamo, invalido = resp.data['resultados']
+        self.assertEqual(aplicado, {'fila': 0, 'estado': 'aplicado', 'id': aplicado['id']})
+        self.assertTrue(Pago.objects.filter(pk=aplicado['id']).exists())
+        self.assertEqual(sin_prestamo['errores'], ['El préstamo no existe.'])
+        self.assertEqual((invalido['fila'], invalido['estado']), (2, 'rechazado'))
+        self.assertIn('monto', invalido['errores'])
+
+    def test_csv(self):
+        contenido = (f'prestamo,fecha_pago,monto,referencia\n'
+                     f'{self.prestamo.pk},{date.today().isoformat()},150,R-1\n'
+                     f'{self.prestamo.pk},07/10/2025,150,R-2\n')
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post('/api/pagos/bulk-csv/', {'archivo': SimpleUploadedFile('pagos.csv', contenido.encode())})
+        self.assertEqual([r['estado'] for r in resp.data['resultados']], ['aplicado', 'rechazado'])
+        self.assertIn('fecha_pago', resp.data['resultados'][1]['errores'])
+
+        for cuerpo in ('prestamo,fecha_pago,monto\n'.encode(), 'fecha;ñ'.encode('latin-1')):
+            resp = self.client.post('/api/pagos/bulk-csv/', {'archivo': SimpleUploadedFile('pagos.csv', cuerpo)})
+            self.assertEqual(resp.status_code, 400)
+
+    def test_reintento_con_referencia_no_duplica(self):
+        filas = [self.fila(referencia='R-1'), self.fila(referencia='R-2')]
+        primero = self.enviar(filas)
+        self.assertEqual(primero.data['aplicados'], 2)
+
+        segundo = self.enviar(filas + [self.fila(referencia='R-2')])
+        self.assertEqual(segundo.status_code, 200)
+        self.assertEqual([r['estado'] for r in segundo.data['resultados']], ['duplicado'] * 3)
+        self.assertEqual(segundo.data['resultados'][0]['id'], primero.data['resultados'][0]['id'])
+        self.assertEqual(Pago.objects.count(), 2)
+
+    def test_fallo_de_un_prestamo_no_pierde_lo_guardado(self):
+        otro = self.crear_prestamo(Cliente.objects.create(nombre='Beto', identificacion='200'))
+        real = services._deltas_pago
+        llamadas = []
+
+        def falla_la_segunda(*args):
+            llamadas.append(1)
+            if len(llamadas) == 2:
+                raise RuntimeError('caída')
+            return real(*args)
+
+        with mock.patch.object(services, '_deltas_pago', falla_la_segunda), self.assertLogs('core.services', 'ERROR'):
+            resp = self.enviar([self.fila(), self.fila(prestamo=otro)])
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual([r['estado'] for r in resp.data['resultados']], ['aplicado', 'error'])
+        self.assertEqual(list(Pago.objects.values_list('prestamo_id', flat=True)), [self.prestamo.pk])
+        otro.refresh_from_db()
+        self.assertEqual(otro.saldo_capital + otro.saldo_interes, Decimal('1200'))
+
+
+class PaginacionCursorTests(DatosBaseMixin, TestCase):
+
+    def test_recorre_todas_las_cuotas_sin_repetir(self):
+        for i in range(2):
+            cliente = Cliente.objects.create(nombre=f'Cliente {i}', identificacion=f'30{i}')
+            self.crear_prestamo(cliente, cuotas=5)
+
+        vistos, url = [], '/api/cuotas/?page_size=3'
+        while url:
+            resp = self.client.get(url)
+            self.assertLessEqual(len(resp.data['results']), 3)
+            vistos += [(c['prestamo'], c['numero']) for c in resp.data['results']]
+            url = resp.data['next']
+
+        self.assertEqual(len(vistos), 4 + 5 + 5)
+        self.assertEqual(len(set(vistos)), len(vistos))
+        self.assertEqual(vistos, sorted(vistos, key=lambda v: (str(v[0]), v[1])))
+
+
+class EstadosVentanaTests(DatosBaseMixin, TestCase):
+
+    def estados(self):
+        return list(self.prestamo.cuotas.order_by('numero').values_list('estado', flat=True))
+
+    def ejecutar(self, dias):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ejecutar_actualizacion_estados(hoy=date.today() + timedelta(days=dias))
+
+    def test_solo_revisa_lo_vencido_desde_la_ultima_corrida(self):
+        self.assertEqual(self.ejecutar(10)['cuotas_mora'], 1)  # sin marca: tabla completa
+
+        # Cuota anterior a la marca que quedó PENDIENTE por fuera de los servicios
+        self.prestamo.cuotas.filter(numero=1).update(estado=Cuota.Estado.PENDIENTE)
+        self.assertEqual(self.ejecutar(17)['cuotas_mora'], 1)  # solo la cuota 2
+        self.assertEqual(self.estados()[:2], [Cuota.Estado.PENDIENTE, Cuota.Estado.MORA])
+
+        self.assertEqual(reparar_estados_cuotas(date.today() + timedelta(days=17)), (1, 0))
+        self.assertEqual(self.estados()[:2], [Cuota.Estado.MORA, Cuota.Estado.MORA])
+
+    def test_dia_ya_procesado_se_omite_salvo_forzado(self):
+        cliente = Cliente.objects.create(nombre='Beto', identificacion='200')
+        prestamo = self.crear_prestamo(cliente, primera=date.today() - timedelta(days=8))
+        self.ejecutar(0)
+
+        # Cuotas vencidas antes de la marca que quedaron PENDIENTE por fuera de los servicios
+        prestamo.cuotas.filter(estado=Cuota.Estado.MORA).update(estado=Cuota.Estado.PENDIENTE)
+        self.assertIsNone(self.ejecutar(0))
+        self.assertEqual(prestamo.cuotas.filter(estado=Cuota.Estado.MORA).count(), 0)
+
+        self.assertEqual(self.client.post('/api/actualizar-estados/').status_code, 403)  # no admin
+        self.assertEqual(APIClient().post('/api/actualizar-estados/').status_code, 403)
+
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post('/api/actualizar-estados/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['resultados']['cuotas'], {'actualizadas_a_mora': 2})
+        self.assertEqual(prestamo.cuotas.filter(estado=Cuota.Estado.MORA).count(), 2)
+
+    def test_comando_rechaza_fecha_futura(self):
+        from django.core.management.base import CommandError
+
+        manana = (date.today() + timedelta(days=1)).isoformat()
+        with self.assertRaisesMessage(CommandError, 'posterior a hoy'):
+            call_command('actualizar_estados', '--fecha', manana, stdout=io.StringIO())
+        self.assertFalse(ProcesoProgramado.objects.filter(nombre=services.PROCESO_ESTADOS).exists())
+
+    def test_estados_de_prestamos_en_dos_updates(self):
+        def nuevo(identificacion, estado=Prestamo.Estado.PENDIENTE, cuotas=None):
+            prestamo = self.crear_prestamo(Cliente.objects.create(nombre='X', identificacion=identificacion))
+            Prestamo.objects.filter(pk=prestamo.pk).update(estado=estado)
+            if cuotas == 'mora':
+                prestamo.cuotas.filter(numero=1).update(estado=Cuota.Estado.MORA)
+            elif cuotas == 'pagadas':
+                prestamo.cuotas.update(estado=Cuota.Estado.PAGADA, saldo_pendiente=0)
+            return prestamo
+
+        a_mora = nuevo('201', cuotas='mora')
+        a_pagado = nuevo('202', cuotas='pagadas')
+        mora_a_pagado = nuevo('203', Prestamo.Estado.MORA, cuotas='pagadas')
+        ya_pagado = nuevo('204', Prestamo.Estado.PAGADO, cuotas='mora')  # inconsistente: no se toca
+
+        with self.assertNumQueries(4):  # savepoint + PAGADO + MORA + release
+            self.assertEqual(services.actualizar_estados_prestamos(), (1, 2))
+
+        estados = dict(Prestamo.objects.values_list('pk', 'estado'))
+        self.assertEqual(estados[self.prestamo.pk], Prestamo.Estado.PENDIENTE)
+        self.assertEqual(estados[a_mora.pk], Prestamo.Estado.MORA)
+        self.assertEqual(estados[a_pagado.pk], Prestamo.Estado.PAGADO)
+        self.assertEqual(estados[mora_a_pagado.pk], Prestamo.Estado.PAGADO)
+        self.assertEqual(estados[ya_pagado.pk], Prestamo.Estado.PAGADO)
+
+    def test_prestamo_con_fecha_atrasada_nace_en_mora(self):
+        cliente = Cliente.objects.create(nombre='Beto', identificacion='200')
+        prestamo = self.crear_prestamo(cliente, primera=date.today() - timedelta(days=8))
+
+        prestamo.refresh_from_db()
+        self.assertEqual(prestamo.estado, Prestamo.Estado.MORA)
+        self.assertEqual(prestamo.cuotas.filter(estado=Cuota.Estado.MORA).count(), 2)
+
+    def test_saldo_pendiente_sigue_a_los_pagos(self):
+        pago = Pago.objects.create(prestamo=self.prestamo, fecha_pago=date.today(), monto=Decimal('400'))
+        with self.captureOnCommitCallbacks(execute=True):
+            aplicar_pago(pago)
+
+        saldos = list(self.prestamo.cuotas.order_by('numero').values_list('saldo_pendiente', flat=True))
+        self.assertEqual(saldos, [Decimal('0'), Decimal('200'), Decimal('300'), Decimal('300')])
+        self.assertEqual(reparar_estados_cuotas(), (0, 0))
+
+
+    def test_pago_parcial_con_fecha_de_vencimiento_no_saca_de_mora(self):
+        # Importación de fin de día: fecha_pago = fecha de vencimiento, aplicada después del job
+        cliente = Cliente.objects.create(nombre='Beto', identificacion='200')
+        prestamo = self.crear_prestamo(cliente, primera=date.today() - timedelta(days=8))
+        vencimiento = prestamo.cuotas.get(numero=1).fecha_vencimiento
+        self.ejecutar(0)
+
+        pago = Pago.objects.create(prestamo=prestamo, fecha_pago=vencimiento, monto=Decimal('100'))
+        with self.captureOnCommitCallbacks(execute=True):
+            aplicar_pago(pago)
+        self.ejecutar(1)
+
+        cuota = prestamo.cuotas.get(numero=1)
+        prestamo.refresh_from_db()
+        self.assertEqual((cuota.estado, cuota.saldo_pendiente), (Cuota.Estado.MORA, Decimal('200')))
+        self.assertEqual(prestamo.estado, Prestamo.Estado.MORA)
+
+
+class RutaCarteraTests(DatosBaseMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = f'/api/carteras/{self.cartera.pk}/ruta/'
+        self.fecha = (date.today() + timedelta(days=14)).isoformat()
+
+    def test_requiere_ser_miembro(self):
+        self.assertEqual(APIClient().get(self.url).status_code, 401)
+
+        ajeno = APIClient()
+        ajeno.force_authenticate(User.objects.create_user(username='ajeno', password='x'))
+        self.assertEqual(ajeno.get(self.url).status_code, 403)
+
+    def test_cuotas_del_dia_y_atrasadas_paginadas(self):
+        resp = self.client.get(self.url, {'fecha': self.fecha, 'limite': 1})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual((resp.data['total_cuotas'], resp.data['total_a_cobrar']), (2, Decimal('600')))
+        cuota = resp.data['cuotas'][0]
+        self.assertEqual((cuota['numero'], cuota['saldo'], cuota['dias_atraso']), (1, Decimal('300'), 7))
+        self.assertEqual(cuota['cliente']['nombre'], 'Ana')
+
+        with self.assertNumQueries(4):  # cartera + permiso (2) + página, sin totales
+            resp = self.client.get(self.url, {'fecha': self.fecha, 'limite': 1,
+                                              'despues_de': resp.data['siguiente']})
+        self.assertEqual([c['numero'] for c in resp.data['cuotas']], [2])
+        self.assertIsNone(resp.data['siguiente'])
+        self.assertNotIn('total_cuotas', resp.data)
+
+    def test_cursor_desempata_cuotas_del_mismo_dia(self):
+        for i in range(3):
+            self.crear_prestamo(Cliente.objects.create(nombre=f'Cliente {i}', identificacion=f'30{i}'))
+
+        vistas, params = [], {'fecha': self.fecha, 'limite': 3}
+        while True:
+            resp = self.client.get(self.url, params)
+            vistas += [c['cuota_id'] for c in resp.data['cuotas']]
+            if resp.data['siguiente'] is None:
+                break
+            params['despues_de'] = resp.data['siguiente']
+
+        self.assertEqual(len(vistas), 8)
+        self.assertEqual(len(set(vistas)), 8)
+        self.assertEqual(self.client.get(self.url, {'despues_de': 'x'}).status_code, 400)
+
+
+class BusquedaClientesTests(TestCase):
+
+    def setUp(self):
+        Cliente.objects.create(nombre='José Peña', identificacion='1045')
+        Cliente.objects.create(nombre='Maria Lopez', identificacion='2045')
+        Cliente.objects.create(nombre='Pedro Jose', identificacion='1099')
+
+    def buscar(self, q):
+        resp = self.client.get('/api/clientes/', {'q': q})
+        return sorted(c['identificacion'] for c in resp.data['results'])
+
+    def test_nombre_sin_tildes_ni_mayusculas(self):
+        self.assertEqual(self.buscar('JOSE'), ['1045', '1099'])
+        self.assertEqual(self.buscar('peña'), ['1045'])
+
+    def test_identificacion_por_prefijo(self):
+        self.assertEqual(self.buscar('10'), ['1045', '1099'])
+        self.assertEqual(self.buscar('045'), [])
+
+
+@override_settings(SECURE_MEDIA_MODO='redirect', SECURE_MEDIA_SENDFILE='x-accel')
+class SecureMediaRedirectTests(TestCase):
+    """Modo redirect: el worker autentica y delega, nunca transfiere los bytes."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        os.makedirs(os.path.join(self.media_root, 'clientes'))
+        with open(os.path.join(self.media_root, 'clientes', 'foto.jpg'), 'wb') as f:
+            f.write(b'\xff\xd8jpeg')
+
+        user = User.objects.create_user(username='visor', password='x')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+
+    def test_local_delega_al_servidor_web(self):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            resp = self.client.get('/api/secure-media/clientes/foto.jpg', **self.auth)
+            fuera = self.client.get('/api/secure-media/../secreto.txt', **self.auth)
+            sin_token = self.client.get('/api/secure-media/clientes/foto.jpg')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['X-Accel-Redirect'], '/protected-media/clientes/foto.jpg')
+        self.assertEqual(resp.content, b'')
+        self.assertEqual(fuera.status_code, 404)
+        self.assertEqual(sin_token.status_code, 401)
+
+    @override_settings(USE_CLOUDINARY=True, SECURE_MEDIA_URL_TTL=120,
+                       CLOUDINARY_STORAGE={'CLOUD_NAME': 'demo', 'API_KEY': '123', 'API_SECRET': 'abc'})
+    def test_cloudinary_redirige_a_url_firmada(self):
+        resp = self.client.get('/api/secure-media/media/clientes/foto_x1.jpg', **self.auth)
+
+        self.assertEqual(resp.status_code, 302)
+        url = urlparse(resp['Location'])
+        params = parse_qs(url.query)
+        self.assertEqual(url.netloc, 'api.cloudinary.com')
+        self.assertEqual(params['public_id'], ['media/clientes/foto_x1'])
+        self.assertIn('signature', params)
+        self.assertLessEqual(int(params['expires_at'][0]) - time.time(), 120)
+        self.assertIn('max-age=90', resp['Cache-Control'])
+
+
+class _OrigenFalso(BaseHTTPRequestHandler):
+    """Stand-in de Cloudinary: una imagen con ETag y contador de peticiones."""
+    cuerpo = bytes(range(256)) * 40
+    etag = '"v1"'
+    peticiones = 0
+
+    def do_GET(self):
+        type(self).peticiones += 1
+        if self.path != '/foto.jpg':
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.send_header('ETag', self.etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(self.cuerpo)))
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+        self.wfile.write(self.cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+class MediaProxyCacheTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.servidor = ThreadingHTTPServer(('127.0.0.1', 0), _OrigenFalso)
+        threading.Thread(target=cls.servidor.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.servidor.server_port}/foto.jpg'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.servidor.shutdown()
+        cls.servidor.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        _OrigenFalso.peticiones = 0
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        ajustes = self.settings(SECURE_MEDIA_CACHE_DIR=directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.factory = RequestFactory()
+
+    def pedir(self, url=None, **headers):
+        resp = servir_remoto(self.factory.get('/', headers=headers), url or self.url)
+        return resp, b''.join(resp.streaming_content) if resp.streaming else resp.content
+
+    def test_segunda_vista_sale_de_disco(self):
+        resp, cuerpo = self.pedir()
+        self.assertEqual((resp.status_code, resp['X-Media-Cache']), (200, 'MISS'))
+        self.assertEqual(cuerpo, _OrigenFalso.cuerpo)
+
+        resp, cuerpo = self.pedir()
+        self.assertEqual((resp.status_code, resp['X-Media-Cache']), (200, 'HIT'))
+        self.assertEqual(cuerpo, _OrigenFalso.cuerpo)
+        self.assertEqual(resp['ETag'], '"v1"')
+        self.assertEqual(_OrigenFalso.peticiones, 1)
+
+    def test_condicionales_y_rangos(self):
+        resp, _ = self.pedir(If_None_Match='"v1"')  # sin caché: se reenvía al origen
+        self.assertEqual(resp.status_code, 304)
+
+        self.pedir()
+        resp, _ = self.pedir(If_None_Match='"v1"')
+        self.assertEqual(resp.status_code, 304)
+        resp, cuerpo = self.pedir(Range='bytes=10-19')
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp['Content-Range'], f'bytes 10-19/{len(_OrigenFalso.cuerpo)}')
+        self.assertEqual(cuerpo, _OrigenFalso.cuerpo[10:20])
+        self.assertEqual(_OrigenFalso.peticiones, 2)
+
+    def test_desalojo_por_tamano(self):
+        self.pedir()
+        desalojar(max_bytes=len(_OrigenFalso.cuerpo) - 1)
+        resp, _ = self.pedir()
+        self.assertEqual(resp['X-Media-Cache'], 'MISS')
+
+        with self.assertRaises(Http404):
+            self.pedir(self.url.replace('foto', 'otra'))
+
+
+class MediaTemporalMixin:
+    """Almacenamiento local en un directorio temporal (stand-in de Cloudinary)."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        ajustes = self.settings(MEDIA_ROOT=self.media_root, STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                        'OPTIONS': {'location': self.media_root}},
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        })
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def foto(self, nombre='dni.jpg', tamano=(2000, 1500)):
+        buffer = io.BytesIO()
+        Image.new('RGB', tamano, (200, 30, 30)).save(buffer, format='JPEG')
+        return SimpleUploadedFile(nombre, buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(TAREAS_SINCRONAS=True)
+class MiniaturasClienteTests(MediaTemporalMixin, TestCase):
+
+    def crear(self, **fotos):
+        with self.captureOnCommitCallbacks(execute=True):
+            cliente = Cliente.objects.create(nombre='Ana', identificacion='1', **fotos)
+        cliente.refresh_from_db()
+        return cliente
+
+    def test_miniatura_al_subir(self):
+        cliente = self.crear(foto_dni_1=self.foto())
+
+        self.assertFalse(cliente.foto_cliente_thumb)
+        with Image.open(cliente.foto_dni_1_thumb.path) as thumb:
+            self.assertEqual(thumb.format, 'WEBP')
+            self.assertEqual(thumb.size, (320, 240))
+        with Image.open(cliente.foto_dni_1.path) as original:
+            self.assertEqual(original.size, (2000, 1500))
+
+        request = RequestFactory().get('/')
+        request.user = User.objects.create_user(username='visor', password='x')
+        data = ClienteSerializer(cliente, context={'request': request}).data
+        self.assertIn('/api/secure-media/clientes/thumbs/', data['foto_dni_1_thumb_secure_url'])
+        self.assertIsNone(data['foto_cliente_thumb_secure_url'])
+
+    def test_reemplazar_y_borrar_foto(self):
+        cliente = self.crear(foto_cliente=self.foto())
+        primera = cliente.foto_cliente_thumb.name
+        self.assertTrue(primera)
+
+        cliente.foto_cliente = self.foto('nueva.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            cliente.save(update_fields=['foto_cliente'])
+        cliente.refresh_from_db()
+        self.assertNotEqual(cliente.foto_cliente_thumb.name, primera)
+
+        cliente.foto_cliente = None
+        cliente.save()
+        cliente.refresh_from_db()
+        self.assertFalse(cliente.foto_cliente_thumb)
+
+    def test_sin_subidas_si_la_transaccion_falla(self):
+        from django.db import transaction
+
+        with mock.patch('core.imagenes.subir_miniaturas') as subir, self.assertRaises(RuntimeError):
+            with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+                Cliente.objects.create(nombre='Ana', identificacion='1', foto_dni_1=self.foto())
+                raise RuntimeError('rollback')
+
+        subir.assert_not_called()
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'clientes', 'thumbs')))
+
+
+class FotosAsincronasTests(MediaTemporalMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.staging = os.path.join(self.media_root, 'staging')
+        ajustes = self.settings(FOTOS_SUBIDA_ASINCRONA=True, TAREAS_SINCRONAS=True,
+                                FOTOS_STAGING_DIR=self.staging)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def crear(self):
+        return self.client.post('/api/clientes/', {
+            'nombre': 'Ana', 'identificacion': '1', 'foto_dni_1': self.foto(),
+        })
+
+    def test_responde_antes_de_subir_y_completa_despues(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            resp = self.crear()
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.data['fotos_pendientes'], ['foto_dni_1'])
+        self.assertIsNone(resp.data['foto_dni_1'])
+        self.assertEqual(len(os.listdir(self.staging)), 1)
+
+        for callback in callbacks:
+            callback()
+        cliente = Cliente.objects.get(pk=resp.data['id'])
+        self.assertEqual(cliente.fotos_pendientes, {})
+        self.assertTrue(cliente.foto_dni_1.name.endswith('dni.jpg'))
+        self.assertTrue(cliente.foto_dni_1_thumb)
+        self.assertEqual(os.listdir(self.staging), [])
+
+    def test_sube_fuera_de_la_transaccion(self):
+        from django.core.files.storage import FileSystemStorage
+        from django.db import connection
+
+        with self.captureOnCommitCallbacks():
+            resp = self.crear()
+        fuera = len(connection.atomic_blocks)  # los de la propia TestCase
+        niveles = []
+        guardar = FileSystemStorage._save
+
+        def _save(storage, name, content):
+            niveles.append(len(connection.atomic_blocks))
+            return guardar(storage, name, content)
+
+        with mock.patch.object(FileSystemStorage, '_save', _save):
+            self.assertEqual(subir_fotos_pendientes(resp.data['id']), ['foto_dni_1'])
+        self.assertEqual(niveles, [fuera, fuera])  # foto y miniatura
+        cliente = Cliente.objects.get(pk=resp.data['id'])
+        self.assertEqual(cliente.fotos_pendientes, {})
+        self.assertTrue(cliente.foto_dni_1_thumb.name.endswith('_thumb.webp'))
+
+    def test_foto_reemplazada_en_staging_se_borra(self):
+        with self.captureOnCommitCallbacks():
+            resp = self.crear()
+        primera = os.listdir(self.staging)
+
+        with mock.patch('core.views.subir_fotos_pendientes'), self.captureOnCommitCallbacks(execute=True):
+            APIClient().patch(f"/api/clientes/{resp.data['id']}/", {'foto_dni_1': self.foto('dni2.jpg')},
+                              format='multipart')
+
+        restantes = os.listdir(self.staging)
+        self.assertEqual(len(restantes), 1)
+        self.assertNotEqual(restantes, primera)
+        self.assertEqual(Cliente.objects.get(pk=resp.data['id']).fotos_pendientes['foto_dni_1']['nombre'],
+                         'dni2.jpg')
+
+    def test_fallo_a_mitad_conserva_lo_ya_subido(self):
+        from django.core.files.storage import FileSystemStorage
+
+        with self.captureOnCommitCallbacks():
+            resp = self.client.post('/api/clientes/', {
+                'nombre': 'Ana', 'identificacion': '1', 'foto_dni_1': self.foto(), 'foto_dni_2': self.foto('dni2.jpg'),
+            })
+        guardar = FileSystemStorage._save
+
+        def _save(storage, name, content):
+            if 'dni2' in name:
+                raise OSError('sin conexión')
+            return guardar(storage, name, content)
+
+        with mock.patch.object(FileSystemStorage, '_save', _save), self.assertRaises(OSError):
+            subir_fotos_pendientes(resp.data['id'])
+        cliente = Cliente.objects.get(pk=resp.data['id'])
+        self.assertTrue(cliente.foto_dni_1 and cliente.foto_dni_1_thumb)
+        self.assertEqual(list(cliente.fotos_pendientes), ['foto_dni_2'])
+
+        # Reintento: solo se sube lo que faltaba (foto y miniatura de dni2)
+        with mock.patch.object(FileSystemStorage, '_save', side_effect=guardar, autospec=True) as save:
+            self.assertEqual(subir_fotos_pendientes(resp.data['id']), ['foto_dni_2'])
+        self.assertEqual(save.call_count, 2)
+        self.assertEqual(os.listdir(self.staging), [])
+
+    def test_staging_perdido_se_registra(self):
+        with self.captureOnCommitCallbacks():
+            resp = self.crear()
+        shutil.rmtree(self.staging)
+
+        with self.assertLogs('core.imagenes', 'ERROR'):
+            self.assertEqual(subir_fotos_pendientes(resp.data['id']), [])
+        self.assertEqual(Cliente.objects.get(pk=resp.data['id']).fotos_pendientes, {})
+
+    def test_comando_reprocesa_lo_que_quedo_en_staging(self):
+        with self.captureOnCommitCallbacks():  # el hilo "se perdió"
+            resp = self.crear()
+
+        call_command('procesar_fotos_pendientes', stdout=io.StringIO())
+        cliente = Cliente.objects.get(pk=resp.data['id'])
+        self.assertEqual(cliente.fotos_pendientes, {})
+        self.assertTrue(cliente.foto_dni_1)
+
+
+class SemillasTests(TestCase):
+
+    def test_libro_consistente(self):
+        totales = sembrar_libro(carteras=2, miembros=1, clientes=20, prestamos=60, cuotas=6, pagos=4, lote=25)
+
+        self.assertEqual(totales['prestamos'], Prestamo.objects.count())
+        self.assertEqual(totales['cuotas'], Cuota.objects.count())
+        self.assertEqual(totales['pagos'], Pago.objects.count())
+        # El libro sembrado ya está en el estado que dejaría la API: nada que reparar
+        self.assertEqual(reparar_estados_cuotas(), (0, 0))
+        campos = ('cartera_id', 'capital_pendiente', 'interes_pendiente', 'interes_devengado',
+                  'dinero_disponible', 'clientes_activos')
+        antes = list(CarteraMetricas.objects.order_by('pk').values_list(*campos))
+        reconstruir_metricas()
+        self.assertEqual(list(CarteraMetricas.objects.order_by('pk').values_list(*campos)), antes)
+
+
+class BenchmarkTests(TestCase):
+
+    def test_reporte_con_volumen_minimo(self):
+        from django.db import connection
+
+        salida = io.StringIO()
+        # Ya corremos sobre la base de pruebas (SQLite en memoria: create_test_db devolvería
+        # esta misma base y los datos sembrados quedarían para los demás tests)
+        with mock.patch.object(connection.creation, 'create_test_db'), \
+                mock.patch.object(connection.creation, 'destroy_test_db'):
+            call_command('benchmark', '--carteras', '1', '--clientes', '3', '--prestamos', '5',
+                         '--repeticiones', '1', stdout=salida, stderr=io.StringIO())
+
+        reporte = json.loads(salida.getvalue())
+        self.assertEqual(set(reporte['meta']), {'commit', 'motor', 'repeticiones', 'volumen'})
+        self.assertEqual((reporte['meta']['motor'], reporte['meta']['repeticiones']), ('sqlite', 1))
+        self.assertEqual(len(reporte['endpoints']), 6)
+        for nombre, datos in reporte['endpoints'].items():
+            self.assertEqual(set(datos), {'status', 'consultas', 'p50_ms', 'p95_ms', 'bytes'}, nombre)
+            self.assertLess(datos['status'], 400, nombre)
+
+
+class InstrumentacionTests(DatosBaseMixin, TestCase):
+
+    def test_server_timing_cuenta_las_consultas(self):
+        with self.assertLogs('core.peticiones', 'INFO') as logs:
+            resp = self.client.get('/api/prestamos/')
+
+        self.assertIn('db;dur=', resp['Server-Timing'])
+        self.assertIn('desc="1 consultas"', resp['Server-Timing'])
+        self.assertNotIn('X-Query-Budget-Exceeded', resp)
+        datos = logs.records[0].peticion
+        self.assertEqual((datos['ruta'], datos['status'], datos['consultas']), ('/api/prestamos/', 200, 1))
+        self.assertEqual(datos['bytes'], len(resp.content))
+
+    @override_settings(INSTRUMENTACION_HEADER=False)
+    def test_cabecera_solo_para_staff(self):
+        self.assertNotIn('Server-Timing', APIClient().get('/api/prestamos/'))
+        self.assertNotIn('Server-Timing', self.client.get('/api/prestamos/'))
+
+        self.user.is_staff = True
+        self.user.save()
+        self.assertIn('Server-Timing', self.client.get('/api/prestamos/'))
+
+    @override_settings(PETICION_PRESUPUESTO_CONSULTAS=1)
+    def test_sobre_presupuesto_marca_la_respuesta(self):
+        for i in range(3):
+            self.crear_prestamo(Cliente.objects.create(nombre=f'Cliente {i}', identificacion=f'30{i}'))
+
+        with self.assertLogs('core.peticiones', 'WARNING') as logs:
+            resp = self.client.get('/api/prestamos/?expand=cuotas,cliente,cartera')
+
+        self.assertEqual(resp['X-Query-Budget-Exceeded'], '3/1')
+        self.assertEqual(logs.records[0].peticion['presupuesto'], 1)
+
+    @override_settings(PETICION_PRESUPUESTO_CONSULTAS=1)
+    def test_importaciones_masivas_sin_presupuesto(self):
+        fila = {'prestamo': str(self.prestamo.pk), 'fecha_pago': date.today().isoformat(), 'monto': '100'}
+        with self.assertLogs('core.peticiones', 'INFO') as logs:
+            resp = self.client.post('/api/pagos/bulk/', [fila, fila], format='json')
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertNotIn('X-Query-Budget-Exceeded', resp)
+        self.assertEqual(logs.records[0].levelname, 'INFO')
+        self.assertGreater(logs.records[0].peticion['consultas'], 1)
+
+
+class MetricasTests(DatosBaseMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        ajustes = override_settings(METRICAS_DIR=self.dir, METRICAS_TOKEN='secreto')
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def valor(self, serie):
+        resp = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secreto')
+        self.assertEqual(resp.status_code, 200)
+        for linea in resp.content.decode().splitlines():
+            if linea.startswith(serie + ' '):
+                return float(linea.split()[-1])
+        return 0.0
+
+    def test_pago_y_latencia(self):
+        pagos = self.valor('avanza_pagos_aplicados_total{origen="individual"}')
+        latencias = self.valor('avanza_aplicar_pago_segundos_count')
+
+        resp = self.client.post('/api/pagos/', {'prestamo': str(self.prestamo.pk),
+                                                'fecha_pago': date.today().isoformat(), 'monto': '100'})
+        self.assertEqual(resp.status_code, 201)
+
+        self.assertEqual(self.valor('avanza_pagos_aplicados_total{origen="individual"}'), pagos + 1)
+        self.assertEqual(self.valor('avanza_aplicar_pago_segundos_count'), latencias + 1)
+        self.assertEqual(self.valor('avanza_aplicar_pago_segundos_bucket{le="+Inf"}'), latencias + 1)
+
+    def test_suma_los_archivos_de_otros_workers(self):
+        base = self.valor('avanza_dashboard_cache_total{resultado="miss"}')
+        with open(os.path.join(self.dir, '99999_otro.json'), 'w') as f:
+            json.dump([['avanza_dashboard_cache_total', ['miss'], 5]], f)
+
+        self.client.get('/api/dashboard/')
+        self.assertEqual(self.valor('avanza_dashboard_cache_total{resultado="miss"}'), base + 6)
+
+    def test_requiere_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+
+
+class LogsTests(SimpleTestCase):
+
+    def registro(self, nombre='core.views', nivel=logging.INFO, mensaje='Media %s', args=('a.jpg',), **extra):
+        record = logging.LogRecord(nombre, nivel, __file__, 1, mensaje, args, None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_json_en_hilo_aparte_con_extra(self):
+        salida = io.StringIO()
+        manejador = ManejadorEnCola()
+        manejador.destino.setStream(salida)
+        manejador.setFormatter(FormatoJSON())
+        manejador.handle(self.registro(cliente_id='c1'))
+        manejador.close()  # vacía la cola
+
+        linea = json.loads(salida.getvalue())
+        self.assertEqual((linea['nivel'], linea['logger'], linea['mensaje']), ('INFO', 'core.views', 'Media a.jpg'))
+        self.assertEqual(linea['cliente_id'], 'c1')
+
+    def test_parsear_pares(self):
+        self.assertEqual(parsear_pares(' core.views = DEBUG,,basura,core.media=0.5'),
+                         {'core.views': 'DEBUG', 'core.media': '0.5'})
+
+    def test_cola_llena_descarta_sin_bloquear(self):
+        manejador = ManejadorEnCola(tamano=1)
+        manejador.listener.stop()  # nadie consume
+        for _ in range(3):
+            manejador.handle(self.registro())
+        self.assertEqual(manejador.descartados, 2)
+        manejador.close()
+
+    def test_muestreo_por_prefijo(self):
+        filtro = FiltroMuestreo('core.peticiones=0,core=1')
+        self.assertFalse(filtro.filter(self.registro('core.peticiones')))
+        self.assertTrue(filtro.filter(self.registro('core.peticiones', logging.WARNING)))
+        self.assertTrue(filtro.filter(self.registro('core.views')))
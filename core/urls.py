@@ -1,7 +1,7 @@
 # core/urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ClienteViewSet, CarteraViewSet, PrestamoViewSet, PagoViewSet, InteresViewSet, PrestamoViewSet, CuotaViewSet, PagoViewSet, dashboard_view, actualizar_estados_view, secure_media_proxy, test_auth, debug_frontend
+from .views import ClienteViewSet, CarteraViewSet, PrestamoViewSet, PagoViewSet, InteresViewSet, PrestamoViewSet, CuotaViewSet, PagoViewSet, dashboard_view, dashboard_cache_view, actualizar_estados_view, secure_media_proxy, test_auth, debug_frontend
 from rest_framework_simplejwt.views import (TokenObtainPairView, TokenRefreshView, TokenVerifyView)
 
 router = DefaultRouter()
@@ -15,6 +15,7 @@ router.register('pagos',    PagoViewSet,    basename='pagos')
 urlpatterns = [
     path('', include(router.urls)),
     path('dashboard/', dashboard_view, name='dashboard'),
+    path('dashboard/cache/', dashboard_cache_view, name='dashboard-cache'),
     path('actualizar-estados/', actualizar_estados_view, name='actualizar-estados'),
     path('secure-media/<path:path>', secure_media_proxy, name='secure-media'),
     path('test-auth/', test_auth, name='test-auth'),
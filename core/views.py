@@ -1,42 +1,99 @@
 # core/views.py
 from rest_framework import viewsets, permissions,status
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import QuerySet
-from django.db import connection
-from .models import Cliente, Cartera, Pago, Prestamo, Interes, Prestamo, Cuota, Pago, PagoDetalle
-from .serializers import ClienteSerializer, CarteraSerializer, PrestamoSerializer, PagoSerializer, InteresSerializer, PrestamoSerializer, CuotaSerializer, PagoSerializer
+from django.db.models import Q, QuerySet, Prefetch, OuterRef, Subquery
+from django.db import connection, transaction
+from .models import normalizar_texto, Cliente, Cartera, CarteraMetricas, CarteraMiembro, Pago, Prestamo, Interes, Prestamo, Cuota, Pago
+from .serializers import ClienteSerializer, CarteraSerializer, PrestamoSerializer, PagoSerializer, InteresSerializer, PrestamoSerializer, CuotaSerializer, PagoSerializer, PrestamoLoteSerializer, PagoLoteSerializer, CarteraAsignarMiembroSerializer, PrestamoListaSerializer
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
 from rest_framework.decorators import action, api_view, permission_classes
 from django.utils import timezone
+from .pagination import CursorPorFecha, CursorCuotas, CursorPorNombre
 from .permissions import IsCarteraMemberOrAdmin, IsSystemAdmin, IsMemberOfCarteraOrAdmin,es_admin
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
-from .services import generar_calendario, aplicar_pago, actualizar_estado_por_mora
+from .cache import invalidar_cartera, obtener_bloques, estadisticas as estadisticas_cache
+from .imagenes import descartar_staging, preparar_fotos, subir_fotos_pendientes
+from .metricas import exponer
+from .middleware import presupuesto_consultas
+from .tareas import encolar_al_confirmar
+from .services import generar_calendario, aplicar_pago, actualizar_estado_por_mora, crear_prestamos_lote, aplicar_pagos_lote, reconstruir_metricas
+
+from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework_simplejwt.authentication import JWTAuthentication
+import csv
+import hmac
+import io
+import logging
+from decimal import Decimal
 
 # Importaciones para el proxy de media seguro
 import requests
 from django.http import HttpResponse, Http404
-from django.views.decorators.cache import cache_control
 from django.conf import settings
 
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 
 class InteresViewSet(viewsets.ModelViewSet):
     queryset = Interes.objects.all().order_by('nombre')
     serializer_class = InteresSerializer
+    pagination_class = CursorPorNombre
 @method_decorator(csrf_exempt, name='dispatch')
 class ClienteViewSet(viewsets.ModelViewSet):
     queryset = Cliente.objects.all().order_by('-created_at')
     serializer_class = ClienteSerializer
+    pagination_class = CursorPorFecha
     authentication_classes = [] 
     permission_classes = [permissions.AllowAny]  # abierto mientras pruebas
 
+    def get_queryset(self):
+        """
+        ?q= busca por prefijo de identificación o por parte del nombre (sin tildes ni
+        mayúsculas). Los N primeros salen con ?page_size=N.
+        """
+        qs = super().get_queryset()
+        q = self.request.query_params.get('q', '').strip()
+        if q:
+            qs = qs.filter(Q(identificacion__startswith=q) |
+                           Q(nombre_normalizado__contains=normalizar_texto(q)))
+        return qs
+
+    def perform_create(self, serializer):
+        self._guardar_con_fotos(serializer)
+
+    def perform_update(self, serializer):
+        self._guardar_con_fotos(serializer)
+
+    def _guardar_con_fotos(self, serializer):
+        """
+        Con FOTOS_SUBIDA_ASINCRONA las fotos quedan en staging y se responde sin esperar
+        al almacenamiento; un hilo las sube al confirmar la transacción.
+        """
+        if not settings.FOTOS_SUBIDA_ASINCRONA:
+            serializer.save()
+            return
+        pendientes = preparar_fotos(serializer.validated_data)
+        if not pendientes:
+            serializer.save()
+            return
+        with transaction.atomic():
+            anteriores = serializer.instance.fotos_pendientes if serializer.instance else {}
+            cliente = serializer.save(fotos_pendientes={**anteriores, **pendientes})
+            # La foto nueva reemplaza a la que seguía en staging para el mismo campo
+            reemplazadas = [anteriores[c] for c in pendientes if c in anteriores]
+            transaction.on_commit(lambda: descartar_staging(reemplazadas))
+            encolar_al_confirmar(subir_fotos_pendientes, cliente.pk)
+
 class CarteraViewSet(viewsets.ModelViewSet):
-    queryset = Cartera.objects.all().order_by('id')
+    queryset = Cartera.objects.prefetch_related(
+        Prefetch('asignaciones', queryset=CarteraMiembro.objects.select_related('usuario'))
+    ).order_by('id')
     serializer_class   = CarteraSerializer
+    pagination_class   = CursorPorNombre
     authentication_classes = [] 
     permission_classes = [permissions.AllowAny]
 
@@ -57,6 +114,10 @@ class CarteraViewSet(viewsets.ModelViewSet):
     # update/partial_update/destroy: también solo admin (en has_object_permission lo negamos a no-admin)
     # Si quieres permitir a gestores editar descripción, ajusta el permiso.
 
+    def perform_update(self, serializer):
+        cartera = serializer.save()
+        invalidar_cartera(cartera.id)  # nombre/descripción van en el bloque del dashboard
+
     @action(detail=True, methods=['post'], url_path='asignar', permission_classes=[permissions.AllowAny])
     def asignar_miembro(self, request, pk=None):
         cartera = self.get_object()
@@ -68,8 +129,88 @@ class CarteraViewSet(viewsets.ModelViewSet):
         if not created:
             asign.rol = rol
             asign.save()
+        invalidar_cartera(cartera.id)  # el bloque del dashboard incluye el rol
         return Response({'ok': True, 'miembro': {'usuario_id': usuario.id, 'rol': rol}})
 
+    @action(detail=True, methods=['get'], url_path='ruta',
+            authentication_classes=[JWTAuthentication], permission_classes=[IsCarteraMemberOrAdmin])
+    def ruta(self, request, pk=None):
+        """
+        GET /api/carteras/{id}/ruta/?fecha=YYYY-MM-DD (por defecto hoy)&limite=N&despues_de=C
+        Cuotas abiertas que vencen hasta la fecha (del día y atrasadas) con los datos de
+        contacto del cliente, en una sola consulta con joins. Solo miembros de la cartera o admin.
+        Páginas de `limite` cuotas (máximo RUTA_CUOTAS_MAX) por keyset sobre
+        (fecha_vencimiento, id): `siguiente` es el `despues_de` de la próxima página.
+        Los totales de toda la ruta vienen solo en la primera página.
+        """
+        from datetime import date
+        from uuid import UUID
+        from django.db.models import Count, Sum
+        from rest_framework.generics import get_object_or_404
+
+        fecha_param = request.query_params.get('fecha')
+        cursor = request.query_params.get('despues_de')
+        try:
+            fecha = date.fromisoformat(fecha_param) if fecha_param else date.today()
+            limite = min(int(request.query_params.get('limite', settings.RUTA_CUOTAS_MAX)), settings.RUTA_CUOTAS_MAX)
+            if cursor:
+                cursor_fecha, _, cursor_id = cursor.partition('_')
+                cursor_fecha, cursor_id = date.fromisoformat(cursor_fecha), UUID(cursor_id)
+        except ValueError:
+            return Response({'detail': 'fecha debe tener formato YYYY-MM-DD, limite debe ser entero '
+                                       'y despues_de debe ser el `siguiente` de la página anterior.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if limite < 1:
+            return Response({'detail': 'limite debe ser mayor que 0.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        cartera = get_object_or_404(Cartera.objects.only('id'), pk=pk)
+        self.check_object_permissions(request, cartera)
+
+        abiertas = Cuota.objects.filter(prestamo__cartera_id=cartera.id,
+                                        fecha_vencimiento__lte=fecha,
+                                        saldo_pendiente__gt=0,  # idx_cuota_abierta_venc
+                                        estado__in=[Cuota.Estado.PENDIENTE, Cuota.Estado.MORA])
+        pagina = abiertas
+        if cursor:
+            pagina = pagina.filter(Q(fecha_vencimiento__gt=cursor_fecha) |
+                                   Q(fecha_vencimiento=cursor_fecha, id__gt=cursor_id))
+        cuotas = list(pagina
+                      .order_by('fecha_vencimiento', 'id')
+                      .values('id', 'prestamo_id', 'numero', 'fecha_vencimiento', 'estado', 'saldo_pendiente',
+                              'prestamo__cliente_id', 'prestamo__cliente__nombre',
+                              'prestamo__cliente__telefono', 'prestamo__cliente__direccion')
+                      [:limite + 1])  # una de más: indica si hay otra página
+        hay_mas = len(cuotas) > limite
+        cuotas = cuotas[:limite]
+
+        items = [{
+            'cuota_id': str(c['id']),
+            'prestamo_id': str(c['prestamo_id']),
+            'numero': c['numero'],
+            'fecha_vencimiento': c['fecha_vencimiento'],
+            'estado': c['estado'],
+            'saldo': c['saldo_pendiente'],
+            'dias_atraso': max((fecha - c['fecha_vencimiento']).days, 0),
+            'cliente': {
+                'id': str(c['prestamo__cliente_id']),
+                'nombre': c['prestamo__cliente__nombre'],
+                'telefono': c['prestamo__cliente__telefono'],
+                'direccion': c['prestamo__cliente__direccion'],
+            },
+        } for c in cuotas]
+
+        datos = {
+            'cartera_id': str(cartera.id),
+            'fecha': fecha,
+            'siguiente': f"{cuotas[-1]['fecha_vencimiento'].isoformat()}_{cuotas[-1]['id']}" if hay_mas else None,
+            'cuotas': items,
+        }
+        if not cursor:
+            totales = abiertas.aggregate(n=Count('id'), saldo=Sum('saldo_pendiente'))
+            datos['total_cuotas'] = totales['n']
+            datos['total_a_cobrar'] = totales['saldo'] or Decimal(0)
+        return Response(datos)
+
     @action(detail=True, methods=['post'], url_path='quitar', permission_classes=[permissions.AllowAny])
     def quitar_miembro(self, request, pk=None):
         cartera = self.get_object()
@@ -77,32 +218,108 @@ class CarteraViewSet(viewsets.ModelViewSet):
         if not usuario_id:
             return Response({'detail': 'usuario_id es requerido.'}, status=status.HTTP_400_BAD_REQUEST)
         CarteraMiembro.objects.filter(cartera=cartera, usuario_id=usuario_id).delete()
+        invalidar_cartera(cartera.id)
         return Response({'ok': True})
     
 class PrestamoViewSet(viewsets.ModelViewSet):
-    queryset = Prestamo.objects.select_related('cliente','cartera','interes')
+    # Cuotas y miembros de la cartera en 2 consultas para toda la página (sin N+1)
+    queryset = Prestamo.objects.select_related('cliente','cartera','interes').prefetch_related(
+        Prefetch('cuotas', queryset=Cuota.objects.order_by('numero')),
+        Prefetch('cartera__asignaciones', queryset=CarteraMiembro.objects.select_related('usuario')),
+    )
     serializer_class = PrestamoSerializer
+    pagination_class = CursorPorFecha
+    # Lecturas puras: los estados los actualiza el job diario
+    # (manage.py actualizar_estados / POST /api/actualizar-estados/)
 
-    def list(self, request, *args, **kwargs):
-        """Lista préstamos actualizando estados automáticamente"""
-        from .services import actualizar_estados_cuotas, actualizar_estados_prestamos
-        # Actualizar estados antes de mostrar la lista
-        actualizar_estados_cuotas()
-        actualizar_estados_prestamos()
-        return super().list(request, *args, **kwargs)
-    
-    def retrieve(self, request, *args, **kwargs):
-        """Obtiene un préstamo específico actualizando estados"""
-        from .services import actualizar_estados_cuotas, actualizar_estados_prestamos
-        # Actualizar estados antes de mostrar el préstamo
-        actualizar_estados_cuotas()
-        actualizar_estados_prestamos()
-        return super().retrieve(request, *args, **kwargs)
+    def _expand(self):
+        """?expand=cuotas,cliente,cartera → bloques anidados opcionales del listado."""
+        pedido = self.request.query_params.get('expand', '')
+        return {e.strip() for e in pedido.split(',')} & set(PrestamoListaSerializer.EXPANSIONES)
+
+    def get_queryset(self):
+        if self.action != 'list':
+            return super().get_queryset()
+
+        proxima_cuota = (Cuota.objects
+                         .filter(prestamo=OuterRef('pk'), estado__in=[Cuota.Estado.PENDIENTE, Cuota.Estado.MORA])
+                         .order_by('numero')
+                         .values('fecha_vencimiento')[:1])
+        qs = (Prestamo.objects
+              .select_related('cliente', 'cartera')
+              .annotate(proxima_cuota_fecha=Subquery(proxima_cuota)))
+
+        expand = self._expand()
+        if 'cuotas' in expand:
+            qs = qs.prefetch_related(Prefetch('cuotas', queryset=Cuota.objects.order_by('numero')))
+        if 'cartera' in expand:
+            qs = qs.prefetch_related(
+                Prefetch('cartera__asignaciones', queryset=CarteraMiembro.objects.select_related('usuario'))
+            )
+        return qs
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return PrestamoListaSerializer
+        return super().get_serializer_class()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'list':
+            context['expand'] = self._expand()
+        return context
 
     def perform_create(self, serializer):
         prestamo = serializer.save()
         generar_calendario(prestamo)
 
+    def perform_update(self, serializer):
+        cartera_anterior = serializer.instance.cartera_id
+        prestamo = serializer.save()
+        reconstruir_metricas({cartera_anterior, prestamo.cartera_id})
+
+    def perform_destroy(self, instance):
+        cartera_id = instance.cartera_id
+        instance.delete()
+        reconstruir_metricas([cartera_id])
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    @presupuesto_consultas(None)  # crece con el tamaño del lote (acotado por PRESTAMOS_LOTE_MAX)
+    def crear_lote(self, request):
+        """
+        POST /api/prestamos/bulk/ con una lista de préstamos (o {"prestamos": [...]}).
+        Todo o nada: si alguna fila falla no se crea ninguno y se informan los errores por fila.
+        """
+        filas = request.data.get('prestamos') if isinstance(request.data, dict) else request.data
+        if not isinstance(filas, list) or not filas:
+            return Response({'detail': 'Se espera una lista de préstamos.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        limite = settings.PRESTAMOS_LOTE_MAX
+        if len(filas) > limite:
+            return Response({'detail': f'Máximo {limite} préstamos por lote.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        validas, errores = [], {}
+        for i, fila in enumerate(filas):
+            ser = PrestamoLoteSerializer(data=fila)
+            if ser.is_valid():
+                validas.append(ser.validated_data)
+            else:
+                errores[i] = ser.errors
+
+        if not errores:
+            prestamos, errores = crear_prestamos_lote(validas)
+
+        if errores:
+            return Response({
+                'creados': 0,
+                'errores': [{'fila': i, 'errores': e} for i, e in sorted(errores.items())],
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'creados': len(prestamos),
+            'prestamos': [{'fila': i, 'id': str(p.id)} for i, p in enumerate(prestamos)],
+        }, status=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=['post'])
     def regenerar_calendario(self, request, pk=None):
         prestamo = self.get_object()
@@ -117,13 +334,7 @@ class PrestamoViewSet(viewsets.ModelViewSet):
 
 class CuotaViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = CuotaSerializer
-    
-    def list(self, request, *args, **kwargs):
-        """Lista cuotas actualizando estados automáticamente"""
-        from .services import actualizar_estados_cuotas
-        # Actualizar estados de cuotas antes de mostrar la lista
-        actualizar_estados_cuotas()
-        return super().list(request, *args, **kwargs)
+    pagination_class = CursorCuotas
     
     def get_queryset(self):
         qs = Cuota.objects.select_related('prestamo')
@@ -135,6 +346,7 @@ class CuotaViewSet(viewsets.ReadOnlyModelViewSet):
 class PagoViewSet(viewsets.ModelViewSet):
     queryset = Pago.objects.select_related('prestamo')
     serializer_class = PagoSerializer
+    pagination_class = CursorPorFecha
 
     def create(self, request, *args, **kwargs):
         resp = super().create(request, *args, **kwargs)
@@ -143,6 +355,87 @@ class PagoViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(pago)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    def perform_update(self, serializer):
+        cartera_anterior = serializer.instance.prestamo.cartera_id
+        pago = serializer.save()
+        reconstruir_metricas({cartera_anterior, pago.prestamo.cartera_id})
+
+    def perform_destroy(self, instance):
+        # Los PagoDetalle se borran en cascada: el cobrado de la cartera sale de ellos
+        cartera_id = instance.prestamo.cartera_id
+        instance.delete()
+        reconstruir_metricas([cartera_id])
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    @presupuesto_consultas(None)  # una transacción por préstamo (acotado por PAGOS_LOTE_MAX)
+    def aplicar_lote(self, request):
+        """
+        POST /api/pagos/bulk/ con una lista de pagos (o {"pagos": [...]}).
+        Cada pago se acepta o rechaza individualmente; el resultado viene por fila
+        (aplicado | duplicado | rechazado | error). Con `referencia` por fila el lote se puede
+        reintentar sin duplicar pagos.
+        """
+        filas = request.data.get('pagos') if isinstance(request.data, dict) else request.data
+        if not isinstance(filas, list) or not filas:
+            return Response({'detail': 'Se espera una lista de pagos.'}, status=status.HTTP_400_BAD_REQUEST)
+        return self._procesar_lote(filas)
+
+    @action(detail=False, methods=['post'], url_path='bulk-csv', parser_classes=[MultiPartParser, FormParser])
+    @presupuesto_consultas(None)
+    def aplicar_lote_csv(self, request):
+        """
+        POST /api/pagos/bulk-csv/ (multipart) con el campo `archivo`: CSV con encabezado
+        prestamo,fecha_pago,monto[,metodo_pago,observacion,referencia].
+        """
+        archivo = request.FILES.get('archivo')
+        if archivo is None:
+            return Response({'detail': 'archivo es requerido.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            contenido = archivo.read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            return Response({'detail': 'El CSV debe estar en UTF-8.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        filas = [
+            {k.strip(): (v or '').strip() for k, v in fila.items() if k}
+            for fila in csv.DictReader(io.StringIO(contenido))
+        ]
+        if not filas:
+            return Response({'detail': 'El CSV no contiene pagos.'}, status=status.HTTP_400_BAD_REQUEST)
+        return self._procesar_lote(filas)
+
+    def _procesar_lote(self, filas):
+        limite = settings.PAGOS_LOTE_MAX
+        if len(filas) > limite:
+            return Response({'detail': f'Máximo {limite} pagos por lote.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        resultados = [None] * len(filas)
+        validas, posiciones = [], []
+        for i, fila in enumerate(filas):
+            ser = PagoLoteSerializer(data=fila)
+            if ser.is_valid():
+                validas.append(ser.validated_data)
+                posiciones.append(i)
+            else:
+                resultados[i] = {'fila': i, 'estado': 'rechazado', 'errores': ser.errors}
+
+        for pos, res in zip(posiciones, aplicar_pagos_lote(validas)):
+            resultados[pos] = {**res, 'fila': pos}
+
+        aplicados = sum(1 for r in resultados if r['estado'] == 'aplicado')
+        duplicados = sum(1 for r in resultados if r['estado'] == 'duplicado')
+        if aplicados:
+            codigo = status.HTTP_201_CREATED
+        elif duplicados == len(resultados):
+            codigo = status.HTTP_200_OK  # reintento de un lote ya aplicado
+        else:
+            codigo = status.HTTP_400_BAD_REQUEST
+        return Response({
+            'aplicados': aplicados,
+            'duplicados': duplicados,
+            'rechazados': len(resultados) - aplicados - duplicados,
+            'resultados': resultados,
+        }, status=codigo)
+
 @api_view(["GET"])
 @permission_classes([permissions.IsAuthenticated])
 def me_view(request):
@@ -163,20 +456,24 @@ def actualizar_estados_view(request):
     """
     Vista para actualizar automáticamente los estados de préstamos y cuotas.
     GET: Muestra estadísticas generales de estados
-    POST: Ejecuta la actualización automática de estados
+    POST: Ejecuta la actualización automática de estados (solo admin: recorre todas las cuotas)
     """
     try:
-        from .services import actualizar_estados_prestamos, actualizar_estados_cuotas
+        from .services import ejecutar_actualizacion_estados
         from .models import Prestamo, Cuota
         from datetime import date
         
         if request.method == "POST":
+            if not IsSystemAdmin().has_permission(request, None):
+                return Response({'detail': 'Solo admin puede ejecutar la actualización de estados.'},
+                                status=status.HTTP_403_FORBIDDEN)
             # Ejecutar actualización de estados
-            print("🔄 Iniciando actualización automática de estados...")
+            logger.info('Actualización manual de estados solicitada por %s', request.user)
             
-            # Actualizar estados de cuotas y préstamos
-            cuotas_mora, cuotas_pagadas = actualizar_estados_cuotas()
-            prestamos_mora, prestamos_pagados = actualizar_estados_prestamos()
+            # Mismo job que el comando programado (también avanza la marca de agua)
+            resultado = ejecutar_actualizacion_estados(forzar=True)
+            cuotas_mora = resultado['cuotas_mora']
+            prestamos_mora, prestamos_pagados = resultado['prestamos_mora'], resultado['prestamos_pagados']
             
             return Response({
                 'success': True,
@@ -184,14 +481,13 @@ def actualizar_estados_view(request):
                 'fecha_actualizacion': date.today().isoformat(),
                 'resultados': {
                     'cuotas': {
-                        'actualizadas_a_mora': cuotas_mora,
-                        'actualizadas_a_pagada': cuotas_pagadas
+                        'actualizadas_a_mora': cuotas_mora
                     },
                     'prestamos': {
                         'actualizados_a_mora': prestamos_mora,
                         'actualizados_a_pagado': prestamos_pagados
                     },
-                    'total_actualizaciones': cuotas_mora + cuotas_pagadas + prestamos_mora + prestamos_pagados
+                    'total_actualizaciones': cuotas_mora + prestamos_mora + prestamos_pagados
                 }
             })
         else:
@@ -255,13 +551,14 @@ def dashboard_view(request):
     cartera_id = request.GET.get('cartera_id')
     
     try:
-        # Obtener carteras donde el usuario es miembro
-        from .models import Cartera, CarteraMiembro
-        carteras_usuario = Cartera.objects.filter(
-            asignaciones__usuario=user
-        ).select_related().prefetch_related('asignaciones')
+        # Carteras donde el usuario es miembro, con su rol (una sola consulta)
+        asignaciones = list(
+            CarteraMiembro.objects.filter(usuario=user)
+            .select_related('cartera')
+            .order_by('cartera__nombre')
+        )
         
-        if not carteras_usuario.exists():
+        if not asignaciones:
             return Response({
                 'message': 'No tienes carteras asignadas',
                 'carteras': []
@@ -272,121 +569,57 @@ def dashboard_view(request):
             try:
                 from uuid import UUID
                 cartera_uuid = UUID(cartera_id)
-                cartera_especifica = carteras_usuario.filter(id=cartera_uuid).first()
-                if not cartera_especifica:
-                    return Response({
-                        'error': 'No tienes acceso a esta cartera o no existe',
-                        'cartera_id': cartera_id
-                    }, status=403)
-                carteras_usuario = [cartera_especifica]
             except ValueError:
                 return Response({
                     'error': 'cartera_id debe ser un UUID válido',
                     'cartera_id': cartera_id
                 }, status=400)
+            asignaciones = [a for a in asignaciones if a.cartera_id == cartera_uuid]
+            if not asignaciones:
+                return Response({
+                    'error': 'No tienes acceso a esta cartera o no existe',
+                    'cartera_id': cartera_id
+                }, status=403)
         
-        # Calcular métricas para cada cartera
-        resultados = []
-        
-        for cartera in carteras_usuario:
-            try:
-                # Usar Django ORM para cálculos más confiables y compatibles entre BD
-                from django.db.models import Sum, Count, Q, F, Case, When, DecimalField, Value
-                from django.db.models.functions import Coalesce
-                from decimal import Decimal
-                from datetime import date
-                
-                # 1. Dinero disponible (total cobrado) - Compatible con PostgreSQL y SQLite
-                dinero_disponible = PagoDetalle.objects.filter(
-                    cuota__prestamo__cartera=cartera
-                ).aggregate(
-                    total=Coalesce(
-                        Sum(F('capital_aplicado') + F('interes_aplicado')), 
-                        Value(0, output_field=DecimalField())
-                    )
-                )['total']
-                
-                # 2. Cálculos de saldos pendientes - Optimizado para PostgreSQL
-                cuotas_con_pagos = Cuota.objects.filter(
-                    prestamo__cartera=cartera
-                ).annotate(
-                    capital_aplicado_total=Coalesce(
-                        Sum('aplicaciones__capital_aplicado'), 
-                        Value(0, output_field=DecimalField())
-                    ),
-                    interes_aplicado_total=Coalesce(
-                        Sum('aplicaciones__interes_aplicado'), 
-                        Value(0, output_field=DecimalField())
-                    ),
-                    capital_pendiente=F('capital_programado') - F('capital_aplicado_total'),
-                    interes_pendiente=F('interes_programado') - F('interes_aplicado_total'),
-                    esta_vencido=Case(
-                        When(fecha_vencimiento__lte=date.today(), then=Value(True)),
-                        default=Value(False),
-                        output_field=DecimalField()
-                    )
-                )
-                
-                # Calcular totales usando agregaciones optimizadas
-                saldos = cuotas_con_pagos.aggregate(
-                    capital_pendiente_total=Coalesce(
-                        Sum('capital_pendiente'), 
-                        Value(0, output_field=DecimalField())
-                    ),
-                    interes_devengado_total=Coalesce(
-                        Sum(Case(
-                            When(fecha_vencimiento__lte=date.today(), 
-                                 then='interes_pendiente'),
-                            default=Value(0, output_field=DecimalField())
-                        )), 
-                        Value(0, output_field=DecimalField())
-                    ),
-                    interes_pendiente_total=Coalesce(
-                        Sum('interes_pendiente'), 
-                        Value(0, output_field=DecimalField())
-                    )
-                )
-                
-                capital_pendiente = saldos['capital_pendiente_total']
-                interes_devengado = saldos['interes_devengado_total'] 
-                interes_pendiente_total = saldos['interes_pendiente_total']
-                
-                # 3. Métricas finales
-                cartera_por_cobrar = capital_pendiente + interes_devengado
-                saldo_contractual = capital_pendiente + interes_pendiente_total
-                
-                # 4. Clientes activos - Compatible con ambas BD
-                clientes_activos = Cliente.objects.filter(
-                    prestamos__cartera=cartera,
-                    activo=True
-                ).distinct().count()
-                
-                # Obtener rol del usuario en esta cartera
-                asignacion = cartera.asignaciones.filter(usuario=user).first()
-                rol_usuario = asignacion.rol if asignacion else None
-                
-                cartera_data = {
+        # Bloques por cartera desde la caché; los que falten salen de las métricas
+        # materializadas (lectura por PK) y las que no existan se construyen una vez
+        por_cartera = {a.cartera_id: a for a in asignaciones}
+
+        def calcular_bloques(ids):
+            metricas = CarteraMetricas.objects.in_bulk(ids)
+            faltantes = [cid for cid in ids if cid not in metricas]
+            if faltantes:
+                reconstruir_metricas(faltantes, invalidar=False)
+                metricas.update(CarteraMetricas.objects.in_bulk(faltantes))
+
+            bloques = {}
+            for cid in ids:
+                cartera, m = por_cartera[cid].cartera, metricas[cid]
+                bloques[cid] = {
                     'cartera': {
                         'id': str(cartera.id),
                         'nombre': cartera.nombre,
                         'descripcion': cartera.descripcion,
-                        'rol_usuario': rol_usuario
+                        'rol_usuario': por_cartera[cid].rol
                     },
                     'metricas': {
-                        'dinero_disponible': float(dinero_disponible),
-                        'cartera_por_cobrar_contable': float(cartera_por_cobrar),
-                        'saldo_contractual_pendiente': float(saldo_contractual),
-                        'clientes_activos': clientes_activos
+                        'dinero_disponible': float(m.dinero_disponible),
+                        'cartera_por_cobrar_contable': float(m.cartera_por_cobrar_contable),
+                        'saldo_contractual_pendiente': float(m.saldo_contractual_pendiente),
+                        'clientes_activos': m.clientes_activos
                     }
                 }
-                
-                resultados.append(cartera_data)
-                    
-            except Exception as e:
-                return Response({
-                    'error': 'Error procesando cartera',
-                    'mensaje': str(e)
-                }, status=500)
+            return bloques
+
+        try:
+            bloques = obtener_bloques(user.id, list(por_cartera), calcular_bloques)
+        except Exception as e:
+            return Response({
+                'error': 'Error procesando cartera',
+                'mensaje': str(e)
+            }, status=500)
+
+        resultados = [bloques[a.cartera_id] for a in asignaciones]
         
         # Preparar respuesta
         response_data = {
@@ -418,6 +651,27 @@ def dashboard_view(request):
         }, status=500)
 
 
+@api_view(["GET"])
+@permission_classes([IsSystemAdmin])
+def dashboard_cache_view(request):
+    """Contadores de hits/misses de la caché del dashboard (solo admin)."""
+    return Response(estadisticas_cache())
+
+
+def metricas_view(request):
+    """
+    GET /metrics en formato de exposición de Prometheus (ver core/metricas.py).
+    Con METRICAS_TOKEN exige `Authorization: Bearer <token>`; sin token solo en DEBUG.
+    """
+    token = settings.METRICAS_TOKEN
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse(status=401)
+    elif not settings.DEBUG:
+        raise Http404
+    return HttpResponse(exponer(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def test_auth(request):
@@ -574,14 +828,68 @@ def debug_login(request):
         }, status=500)
 
 
-@cache_control(max_age=3600)  # Cache por 1 hora
+def _media_sin_bytes(request, decoded_path):
+    """
+    Modo redirect de secure_media_proxy: los bytes nunca pasan por el worker.
+    - Cloudinary: 302 a una URL de descarga firmada que vence en SECURE_MEDIA_URL_TTL.
+    - Local: X-Accel-Redirect / X-Sendfile para que lo sirva el servidor web
+      (sin SECURE_MEDIA_SENDFILE lo sirve Django, como en desarrollo).
+    """
+    import os
+    import time
+    import mimetypes
+    from urllib.parse import quote
+    from django.core.exceptions import SuspiciousFileOperation
+    from django.http import HttpResponseRedirect
+    from django.utils._os import safe_join
+    from django.utils.cache import patch_cache_control
+
+    if settings.USE_CLOUDINARY:
+        import cloudinary.utils
+
+        ttl = settings.SECURE_MEDIA_URL_TTL
+        cfg = settings.CLOUDINARY_STORAGE
+        public_id, extension = os.path.splitext(decoded_path)
+        url = cloudinary.utils.private_download_url(
+            public_id, extension.lstrip('.'),
+            type='upload', resource_type='image',
+            expires_at=int(time.time()) + ttl,
+            cloud_name=cfg.get('CLOUD_NAME'), api_key=cfg.get('API_KEY'), api_secret=cfg.get('API_SECRET'),
+        )
+        response = HttpResponseRedirect(url)
+        # El navegador puede reusar la redirección mientras la firma siga vigente
+        patch_cache_control(response, private=True, max_age=max(ttl - 30, 0))
+        return response
+
+    try:
+        file_path = safe_join(settings.MEDIA_ROOT, decoded_path)
+    except SuspiciousFileOperation:
+        raise Http404("Archivo no encontrado")
+    if not os.path.isfile(file_path):
+        raise Http404("Archivo no encontrado")
+
+    modo = settings.SECURE_MEDIA_SENDFILE
+    if modo == 'x-accel':
+        response = HttpResponse(content_type=mimetypes.guess_type(file_path)[0] or 'application/octet-stream')
+        response['X-Accel-Redirect'] = settings.SECURE_MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + quote(decoded_path)
+    elif modo == 'x-sendfile':
+        response = HttpResponse(content_type=mimetypes.guess_type(file_path)[0] or 'application/octet-stream')
+        response['X-Sendfile'] = file_path
+    else:
+        from django.views.static import serve
+        response = serve(request, decoded_path, document_root=settings.MEDIA_ROOT)
+
+    patch_cache_control(response, private=True, max_age=3600)
+    response['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
 def secure_media_proxy(request, path):
     """
     Proxy seguro para servir archivos media de Cloudinary
-    Solo usuarios autenticados pueden acceder a las imágenes
+    Solo usuarios autenticados pueden acceder a las imágenes.
+    Con SECURE_MEDIA_MODO=redirect no transfiere bytes (ver _media_sin_bytes).
     """
-    print(f"🔑 [PROXY] Iniciando proxy para: {path}")
-    
     # Verificación manual de autenticación JWT
     from rest_framework_simplejwt.authentication import JWTAuthentication
     from rest_framework.exceptions import AuthenticationFailed
@@ -590,7 +898,6 @@ def secure_media_proxy(request, path):
     
     # Decodificar la URL (espacios y caracteres especiales)
     decoded_path = unquote(path)
-    print(f"🔓 [PROXY] Path decodificado: {decoded_path}")
     
     try:
         # Autenticar usuario con JWT
@@ -598,10 +905,8 @@ def secure_media_proxy(request, path):
         auth_result = jwt_auth.authenticate(request)
         
         if not auth_result:
-            print(f"❌ [PROXY] No se encontró token de autenticación")
-            print(f"❌ [PROXY] Headers disponibles: {list(request.headers.keys())}")
-            auth_header = request.headers.get('Authorization')
-            print(f"❌ [PROXY] Authorization header: {auth_header}")
+            logger.info('Media sin token: %s', decoded_path,
+                        extra={'headers': list(request.headers.keys())})
             return JsonResponse({
                 'error': 'Token de autenticación requerido',
                 'details': 'No se encontró el header Authorization con un token JWT válido'
@@ -609,52 +914,28 @@ def secure_media_proxy(request, path):
         
         user, token = auth_result
         if not user.is_authenticated:
-            print(f"❌ [PROXY] Usuario no autenticado: {user}")
+            logger.info('Media con usuario no autenticado: %s', decoded_path)
             return JsonResponse({'error': 'Usuario no autenticado'}, status=401)
         
-        print(f"✅ [PROXY] Usuario autenticado: {user.username}")
+        logger.debug('Media %s para %s', decoded_path, user.username)
+
+        if settings.SECURE_MEDIA_MODO == 'redirect':
+            return _media_sin_bytes(request, decoded_path)
             
         # Servir archivo si está autenticado
         if settings.USE_CLOUDINARY:
             # Construir URL de Cloudinary
             cloud_name = settings.CLOUDINARY_STORAGE.get('CLOUD_NAME')
             if not cloud_name:
-                print(f"❌ [PROXY] Configuración de Cloudinary no encontrada")
+                logger.error('Media: CLOUDINARY_STORAGE sin CLOUD_NAME')
                 raise Http404("Configuración de Cloudinary no encontrada")
             
             # Usar path decodificado para construir URL de Cloudinary
             cloudinary_url = f"https://res.cloudinary.com/{cloud_name}/image/upload/v1/{decoded_path}"
             
-            print(f"✅ [PROXY] Accediendo a archivo: {decoded_path}")
-            print(f"🔗 [PROXY] URL de Cloudinary: {cloudinary_url}")
-            
-            # Hacer request a Cloudinary con timeout
-            response = requests.get(cloudinary_url, timeout=10)
-            
-            print(f"📊 [PROXY] Status Cloudinary: {response.status_code}")
-            if response.status_code != 200:
-                print(f"❌ [PROXY] Error en Cloudinary: {response.status_code}")
-                print(f"❌ [PROXY] Respuesta: {response.text[:200]}")
-            else:
-                print(f"✅ [PROXY] Imagen encontrada, sirviendo archivo")
-            
-            if response.status_code == 200:
-                # Determinar content type basado en la extensión
-                content_type = response.headers.get('content-type', 'image/jpeg')
-                
-                # Crear respuesta HTTP con la imagen
-                http_response = HttpResponse(response.content, content_type=content_type)
-                http_response['Content-Length'] = len(response.content)
-                http_response['Cache-Control'] = 'private, max-age=3600'
-                
-                # Headers adicionales de seguridad
-                http_response['X-Content-Type-Options'] = 'nosniff'
-                http_response['X-Frame-Options'] = 'DENY'
-                
-                return http_response
-            else:
-                print(f"Error obteniendo imagen de Cloudinary: {response.status_code}")
-                raise Http404("Archivo no encontrado en Cloudinary")
+            # Streaming con sesión compartida, caché en disco y peticiones condicionales
+            from .media import servir_remoto
+            return servir_remoto(request, cloudinary_url)
         else:
             # En desarrollo local, servir archivo directamente
             from django.views.static import serve
@@ -663,28 +944,28 @@ def secure_media_proxy(request, path):
             # Verificar que el archivo existe usando path decodificado
             file_path = os.path.join(settings.MEDIA_ROOT, decoded_path)
             if not os.path.exists(file_path):
-                print(f"❌ Archivo no encontrado en: {file_path}")
+                logger.debug('Media local no encontrada: %s', file_path)
                 raise Http404("Archivo no encontrado")
+            response = serve(request, decoded_path, document_root=settings.MEDIA_ROOT)
+            response['Cache-Control'] = 'private, max-age=3600'
+            return response
             
-            print(f"✅ Sirviendo archivo local: {file_path}")
-            return serve(request, decoded_path, document_root=settings.MEDIA_ROOT)
-            
+    except Http404:
+        raise
     except AuthenticationFailed as e:
-        print(f"❌ [PROXY] Error de autenticación: {e}")
+        logger.info('Media con token inválido: %s', e)
         return JsonResponse({
             'error': 'Token inválido o expirado',
             'details': str(e)
         }, status=401)
     except requests.RequestException as e:
-        print(f"❌ [PROXY] Error de red sirviendo media: {e}")
+        logger.warning('Error de red sirviendo media %s: %s', decoded_path, e)
         return JsonResponse({
             'error': 'Error al acceder al archivo',
             'details': 'Error de conexión con Cloudinary'
         }, status=503)
     except Exception as e:
-        print(f"❌ [PROXY] Error general sirviendo media: {e}")
-        import traceback
-        print(f"❌ [PROXY] Traceback: {traceback.format_exc()}")
+        logger.exception('Error sirviendo media %s', decoded_path)
         return JsonResponse({
             'error': 'Error interno del servidor',
             'details': str(e)